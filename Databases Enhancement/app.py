@@ -1,5 +1,6 @@
 import pandas as pd
-from flask import Flask, render_template, jsonify, request, make_response
+from flask import Flask, render_template, jsonify, request, make_response, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 import plotly.express as px
 import plotly.graph_objects as go
 import json
@@ -7,13 +8,29 @@ import plotly
 import base64
 import os
 from pymongo import MongoClient
+from bson.objectid import ObjectId
+from bson import json_util
 import logging
-from crud import MongoCRUD
+from crud import MongoCRUD, get_collection_version, CHANGE_LOG_COLLECTION
+from storage import DataBackend
+from sqlite_storage import SQLiteStorage
+from snapshot_storage import SnapshotStorage
+import metrics
+from events import EventBroker, change_event, start_change_stream
+from query_advisor import SlowQueryRecorder, get_log_collection, build_index_report
+from columnar import ColumnarSnapshot
+from compact_schema import schema_for, short_key, CODED_FIELDS
+from search import (FuzzySearchIndex, FieldValueIndex, parse_search_query, compile_search_query, is_field_query,
+                    encode_cursor, decode_cursor, merge_queries, compile_column_filters)
 from collections import OrderedDict
 import time
 from dotenv import load_dotenv
 import csv
 import io
+import threading
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
 
 load_dotenv()
 
@@ -25,30 +42,137 @@ class LRUCache:
     def __init__(self, capacity=50):
         self.cache = OrderedDict()
         self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        # Requests run on several threads; the counts and the LRU order change together
+        self.lock = threading.Lock()
     
     def get(self, key):
-        if key in self.cache:
-            # Move to end (most recently used)
-            self.cache.move_to_end(key)
-            return self.cache[key]
-        return None
+        with self.lock:
+            if key in self.cache:
+                # Move to end (most recently used)
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return self.cache[key]
+            self.misses += 1
+            return None
     
     def put(self, key, value):
-        if key in self.cache:
-            # Update existing key
-            self.cache.move_to_end(key)
-        elif len(self.cache) >= self.capacity:
-            # Remove least recently used (first item)
-            self.cache.popitem(last=False)
-        
-        self.cache[key] = value
+        with self.lock:
+            if key in self.cache:
+                # Update existing key
+                self.cache.move_to_end(key)
+            elif len(self.cache) >= self.capacity:
+                # Remove least recently used (first item)
+                self.cache.popitem(last=False)
+            
+            self.cache[key] = value
+    
+    def stats(self):
+        """Get (hits, misses) read together"""
+        with self.lock:
+            return self.hits, self.misses
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls into one in-flight call.
+    The first caller for a key runs the function; callers arriving while it
+    runs wait for and share its result. Nothing is kept once the call ends,
+    so results are never stale.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.shared = 0  # Calls answered by another caller's in-flight call
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self._Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+# Mean Earth radius, converts kilometers to radians for $centerSphere
+EARTH_RADIUS_KM = 6378.1
+
+# Values listed per group in aggregation summaries, and the most a request may ask for
+DEFAULT_TOP_K = 5
+MAX_TOP_K = 50
+
+# Seconds a worker trusts its cached collection write version (writes by
+# other processes show up in ETags within this window)
+DATA_VERSION_TTL = 2
+
+# Map grid resolution for /api/map/grid, in cells per 256px tile
+GRID_CELLS_PER_TILE = 8
 
 # Initialize cache
 search_cache = LRUCache(50)
 
-class MongoDataManager:
+# Compiled search query cache (raw query string -> MongoDB filter)
+query_cache = LRUCache(200)
+
+# Aggregation results cache, keyed by data version, filter and parameters
+aggregation_cache = LRUCache(100)
+
+# Default age histogram bin edges in weeks, including the rescue age limits
+DEFAULT_AGE_EDGES = (0, 20, 26, 52, 104, 156, 300, 520)
+MAX_HISTOGRAM_BINS = 50
+
+# Snapshot file directory, mapped at startup by the columnar and snapshot backends
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH')
+
+class MongoDataManager(DataBackend):
     """Data management class to handle MongoDB operations"""
 
+    backend_name = "mongodb"
+
+    # Fields broken down in search facets, and buckets returned per facet
+    FACET_FIELDS = ("outcome_type", "animal_type", "sex_upon_outcome", "breed")
+    FACET_LIMIT = 25
+
+    # Time series bucket sizes: $dateToString formats, quarters are built separately
+    PERIOD_FORMATS = {"day": "%Y-%m-%d", "week": "%G-W%V", "month": "%Y-%m", "year": "%Y"}
+    GRANULARITIES = ("day", "week", "month", "quarter", "year")
+
+    # The outcome date for date operators. Imports store dates, but collections imported
+    # before that hold strings, which still parse here (unparseable ones group as null)
+    OUTCOME_DATE = {"$convert": {"input": "$datetime", "to": "date", "onError": None, "onNull": None}}
+
+    # Pre-bucketed daily counts per rescue filter and outcome type
+    ROLLUP_COLLECTION = "daily_outcome_rollup"
+    ROLLUP_FILTERS = ("All", "Water Rescue", "Mountain or Wilderness Rescue", "Disaster or Individual Tracking")
+
+    # Fields the data table may sort on; create_indexes gives each an index to sort with
+    SORTABLE_FIELDS = ("datetime", "breed", "age_upon_outcome_in_weeks", "name",
+                       "animal_type", "outcome_type", "date_of_birth")
+
     def __init__(self, mongo_uri=None, database_name=None, collection_name=None):
         # Get credentials and connection info from .env
         username = os.getenv('MONGO_USERNAME')
@@ -69,8 +193,30 @@ class MongoDataManager:
         self.client = None
         self.db = None
         self.collection = None
+        self.fuzzy_index = None
+        self.value_index = None
+        self.inflight = SingleFlight()
+        self.data_version = None
+        self.data_version_checked = 0
+        self.snapshot = None
+        self.snapshot_lock = threading.Lock()
         self.connect()
 
+        # Short keys and coded categories when COMPACT_SCHEMA is on (None otherwise)
+        self.schema = schema_for(self.db)
+
+        # Record slow finds/aggregations for the index advisor
+        try:
+            log_collection = get_log_collection(self.db)
+        except Exception as e:
+            logger.error(f"Slow query log collection unavailable: {e}")
+            log_collection = None
+        self.slow_queries = SlowQueryRecorder(log_collection=log_collection)
+
+        # Optionally serve filters and group-by counts from an in-memory column store
+        if os.getenv('DATA_BACKEND', 'mongo') == 'columnar':
+            self.load_snapshot()
+
     def connect(self):
         """Connect to MongoDB"""
         try:
@@ -85,29 +231,55 @@ class MongoDataManager:
             raise
 
     
-    def read(self, query=None, limit=None):
+    def read(self, query=None, limit=None, sort=None, skip=0):
         """
         Query data from MongoDB
         :param query: MongoDB query dictionary
         :param limit: Maximum number of documents to return
+        :param sort: List of (field, direction) pairs
+        :param skip: Number of documents to skip (table paging)
         :return: List of documents
         """
         try:
             if query is None:
                 query = {}
             
-            cursor = self.collection.find(query)
+            # Unsorted reads the column store can evaluate never reach MongoDB, unless its
+            # rows are partial (a mapped snapshot file), so every read returns full documents
+            snapshot = None if sort else self._snapshot_for(query)
+            if snapshot is not None and snapshot.complete:
+                with snapshot.lock:
+                    return snapshot.rows_for(snapshot.mask(query), skip, limit)
             
-            if limit:
-                cursor = cursor.limit(limit)
+            def fetch():
+                start = time.perf_counter()
+                stored_query = self._query(query)
+                cursor = self.collection.find(stored_query)
+                
+                if sort:
+                    cursor = cursor.sort(sort if self.schema is None else self.schema.encode_sort(sort))
+                if skip:
+                    cursor = cursor.skip(skip)
+                if limit:
+                    cursor = cursor.limit(limit)
+                
+                # Convert MongoDB cursor to list of dictionaries
+                documents = [self._decode(doc) for doc in cursor]
+                self.slow_queries.record("find", stored_query, (time.perf_counter() - start) * 1000,
+                                         sort=dict(sort) if sort else None)
+                
+                # Convert ObjectId to string for JSON serialization
+                for doc in documents:
+                    if '_id' in doc:
+                        doc['_id'] = str(doc['_id'])
+                return documents
             
-            # Convert MongoDB cursor to list of dictionaries
-            results = list(cursor)
+            # Identical concurrent reads share one MongoDB round trip
+            flight_key = self._flight_key("find", [query, sort, skip], limit)
+            shared = self.inflight.do(flight_key, fetch)
             
-            # Convert ObjectId to string for JSON serialization
-            for doc in results:
-                if '_id' in doc:
-                    doc['_id'] = str(doc['_id'])
+            # Callers modify the documents they get, so each gets its own copies
+            results = [dict(doc) for doc in shared]
             
             logger.info(f"Retrieved {len(results)} documents from MongoDB")
             return results
@@ -116,6 +288,40 @@ class MongoDataManager:
             logger.error(f"Error querying MongoDB: {e}")
             return []
     
+    def count(self, query):
+        """Count the documents matching a query"""
+        try:
+            snapshot = self._snapshot_for(query)
+            if snapshot is not None:
+                return int(snapshot.mask(query).sum())
+            return self.collection.count_documents(self._query(query))
+        except Exception as e:
+            logger.error(f"Error counting documents: {e}")
+            return 0
+
+    def sort_index_supported(self, sort_field, query=None):
+        """
+        Check that an index can return documents in sort_field order for a query:
+        sort_field must follow a (possibly empty) prefix of equality-matched fields.
+        Codes are not in value order, so coded fields of compact documents never qualify.
+        """
+        if self.schema is not None and sort_field in CODED_FIELDS:
+            return False
+        equality = {self._key(field) for field, condition in (query or {}).items()
+                    if not field.startswith("$") and not isinstance(condition, dict)}
+        sort_field = self._key(sort_field)
+        for info in self.collection.index_information().values():
+            for key, direction in info["key"]:
+                if key == sort_field and direction in (1, -1):
+                    return True
+                if key not in equality:
+                    break
+        return False
+
+    def text_search(self, text, match_query=None, limit=100):
+        """Full text search on name, breed and outcome type, narrowed by a filter"""
+        return self.search(merge_queries(match_query, {"$text": {"$search": text}}), page_size=limit)["results"]
+
     def get_stats(self):
         """Get collection statistics"""
         try:
@@ -131,32 +337,509 @@ class MongoDataManager:
             self.client.close()
             logger.info("MongoDB connection closed")
     
+    @staticmethod
+    def _flight_key(kind, spec, limit=None):
+        """Key identifying identical queries for request coalescing"""
+        return f"{kind}:{limit}:{json_util.dumps(spec)}"
+
+    def _key(self, field):
+        """Stored key of a public field name"""
+        return field if self.schema is None else short_key(field)
+
+    def _query(self, query):
+        """Stored form of a filter on the public fields"""
+        return query if self.schema is None or not query else self.schema.encode_query(query)
+
+    def _decode(self, doc):
+        """Public form of a stored document"""
+        return doc if self.schema is None else self.schema.decode_document(doc)
+
+    def _decode_value(self, field, value):
+        """Public value of a grouped field (a code in compact documents)"""
+        return value if self.schema is None else self.schema.decode_value(field, value)
+
+    def _decode_groups(self, results, field=None, top_name=None, top_field=None):
+        """Decode the field grouped on (the _id) of aggregation results, and the values of their top_<name> list"""
+        if self.schema is None:
+            return results
+        for doc in results:
+            if field:
+                doc["_id"] = self._decode_value(field, doc["_id"])
+            if top_name:
+                doc[top_name] = [dict(entry, value=self._decode_value(top_field, entry["value"]))
+                                 for entry in doc[top_name]]
+        return results
+
+    def _aggregate(self, pipeline, collection=None):
+        """
+        Run an aggregation pipeline, sharing it with identical concurrent calls and recording it if slow.
+        Pipelines over the outcomes collection are written against the public fields.
+        """
+        collection = self.collection if collection is None else collection
+        if self.schema is not None and collection is self.collection:
+            pipeline = self.schema.encode_pipeline(pipeline)
+
+        def run():
+            start = time.perf_counter()
+            documents = list(collection.aggregate(pipeline))
+            if collection is self.collection:
+                self.slow_queries.record("aggregate", pipeline, (time.perf_counter() - start) * 1000)
+            return documents
+
+        shared = self.inflight.do(self._flight_key(f"aggregate:{collection.name}", pipeline), run)
+        return [dict(doc) for doc in shared]
+
     def create_indexes(self):
         """Create performance indexes"""
         try:
             # Create compound index for common queries
+            key = self._key
             self.collection.create_index([
-                ("breed", 1),
-                ("sex_upon_outcome", 1),
-                ("age_upon_outcome_in_weeks", 1)
+                (key("breed"), 1),
+                (key("sex_upon_outcome"), 1),
+                (key("age_upon_outcome_in_weeks"), 1)
             ])
             
             # Create index for outcome type queries
-            self.collection.create_index([("outcome_type", 1)])
+            self.collection.create_index([(key("outcome_type"), 1)])
             
             # Create index for animal type queries
-            self.collection.create_index([("animal_type", 1)])
+            self.collection.create_index([(key("animal_type"), 1)])
             
             # Create index for date queries
-            self.collection.create_index([("date_of_birth", 1)])
+            self.collection.create_index([(key("date_of_birth"), 1)])
+
+            # Create index for fuzzy name lookups ($in on exact names)
+            self.collection.create_index([(key("name"), 1)])
+
+            # Create indexes for table sorting (breed sorts use the compound index above)
+            self.collection.create_index([(key("datetime"), 1)])
+            self.collection.create_index([(key("age_upon_outcome_in_weeks"), 1)])
             
             logger.info("Performance indexes created successfully")
         except Exception as e:
             logger.error(f"Error creating indexes: {e}")
 
+    def get_plan_stages(self, query):
+        """
+        Get the stage names of the winning query plan for a query
+        :param query: MongoDB query dictionary
+        :return: List of stage names, outermost first
+        """
+        plan = self.collection.find(self._query(query)).explain()["queryPlanner"]["winningPlan"]
+        stages = []
+        while plan:
+            stages.append(plan.get("stage"))
+            # Single child plans nest under inputStage, $or/text plans under inputStages
+            plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+        return stages
+
+    def verify_search_plan(self):
+        """Check that a combined rescue filter + text query avoids a collection scan"""
+        sample_query = merge_queries(
+            get_filter_query('Water Rescue'),
+            {"$text": {"$search": "retriever", "$caseSensitive": False}}
+        )
+        try:
+            stages = self.get_plan_stages(sample_query)
+            if "COLLSCAN" in stages:
+                logger.warning(f"Combined filter + search query scans the collection: {stages}")
+            else:
+                logger.info(f"Combined filter + search query plan: {stages}")
+            return stages
+        except Exception as e:
+            logger.error(f"Error explaining combined search query: {e}")
+            return []
+
+    def check_date_types(self):
+        """
+        Warn when outcome dates are stored as strings (imported by an earlier version):
+        date range filters only match stored dates
+        :return: True if the dates are typed
+        """
+        try:
+            if self.collection.find_one(self._query({"datetime": {"$type": "string"}}), {"_id": 1}) is None:
+                return True
+            logger.error("Outcome dates are stored as strings: date range filters match nothing until "
+                         "the collection is re-imported with csv_to_mongodb.py")
+            return False
+        except Exception as e:
+            logger.error(f"Error checking outcome date types: {e}")
+            return True
+
+    def get_fuzzy_index(self):
+        """Get the fuzzy search index, building it on first use"""
+        if self.fuzzy_index is None:
+            self.fuzzy_index = FuzzySearchIndex(self).build()
+        return self.fuzzy_index
+
+    def get_value_index(self):
+        """Get the case-insensitive search value index, rebuilt when the data version changes"""
+        version = self.get_data_version()
+        if self.value_index is None or self.value_index[0] != version:
+            self.value_index = (version, FieldValueIndex(self).build())
+        return self.value_index[1]
+
+    def distinct(self, field):
+        """Distinct values of a field (used to build the fuzzy search index)"""
+        return [self._decode_value(field, value) for value in self.collection.distinct(self._key(field))]
+
+    def invalidate_fuzzy_index(self):
+        """Drop the fuzzy search index so it is rebuilt with fresh values"""
+        self.fuzzy_index = None
+
+    def get_data_version(self, fresh=False):
+        """Get the collection write version, cached for DATA_VERSION_TTL seconds unless fresh"""
+        now = time.monotonic()
+        if fresh or self.data_version is None or now - self.data_version_checked > DATA_VERSION_TTL:
+            try:
+                self.data_version = get_collection_version(self.db, self.collection_name)
+            except Exception as e:
+                logger.error(f"Error reading collection version: {e}")
+                # Unknown version, never let clients reuse a cached response
+                return f"unknown-{now}"
+            self.data_version_checked = now
+        return self.data_version
+
+    def get_changes(self, since, match_query=None, max_changes=5000):
+        """
+        Get the changes to a filtered result set since a version token.
+        Changed ids come from the change log written by MongoCRUD; the ones that
+        still match the filter are returned as upserts, the rest as deletes.
+        :param since: Version token the client's copy is at
+        :param match_query: Filter of the client's result set
+        :param max_changes: Beyond this many changes a full reload is cheaper
+        :return: Dictionary with token, reset, upserts and deletes
+        """
+        version = self.get_data_version(fresh=True)
+        if not isinstance(version, int):
+            # Version lookup failed: the client falls back to a full load
+            return {"token": None, "reset": True, "upserts": [], "deletes": []}
+        changes = {"token": version, "reset": False, "upserts": [], "deletes": []}
+        if since >= version:
+            return changes
+
+        entries = list(self.db[CHANGE_LOG_COLLECTION].find(
+            {"collection": self.collection_name, "seq": {"$gt": since, "$lte": version}}
+        ).sort("seq", 1).limit(max_changes + 1))
+
+        # Expired entries, bulk reloads or too many changes: the client must reload
+        if (not entries or entries[0]["seq"] != since + 1 or len(entries) > max_changes
+                or any(entry["op"] == "reset" for entry in entries)):
+            changes["reset"] = True
+            return changes
+
+        # Stop at a gap (a write whose log entry is not visible yet), it is picked up next time
+        token = since
+        doc_ids = []
+        for entry in entries:
+            if entry["seq"] != token + 1:
+                break
+            token = entry["seq"]
+            if entry["doc_id"] not in doc_ids:
+                doc_ids.append(entry["doc_id"])
+
+        matching = self.read(merge_queries(match_query, {"_id": {"$in": doc_ids}}))
+        matching_ids = {doc["_id"] for doc in matching}
+
+        changes["token"] = token
+        changes["upserts"] = matching
+        changes["deletes"] = [str(doc_id) for doc_id in doc_ids if str(doc_id) not in matching_ids]
+        return changes
+
+    def load_snapshot(self):
+        """
+        Load the columnar snapshot. With SNAPSHOT_PATH set, the snapshot file is
+        mapped first and caught up from the change log on the next refresh,
+        instead of reading the whole collection
+        """
+        if self.snapshot is None and SNAPSHOT_PATH:
+            try:
+                self.snapshot = ColumnarSnapshot.open(SNAPSHOT_PATH)
+            except Exception as e:
+                logger.error(f"Error opening snapshot file in {SNAPSHOT_PATH}: {e}")
+            if self.snapshot is not None:
+                return
+
+        # Version first: writes made during the load are replayed on the next refresh
+        version = self.get_data_version(fresh=True)
+        documents = [self._decode(doc) for doc in self.collection.find()]
+        for doc in documents:
+            doc['_id'] = str(doc['_id'])
+        snapshot = self.snapshot or ColumnarSnapshot()
+        snapshot.load(documents, version)
+        snapshot.complete = True
+        self.snapshot = snapshot
+
+    def _snapshot_for(self, query):
+        """
+        Get the columnar snapshot, brought up to the current data version, if it can evaluate a query
+        :return: ColumnarSnapshot, or None to query MongoDB
+        """
+        if self.snapshot is None or not self.snapshot.supports(query or {}):
+            return None
+
+        version = self.get_data_version()
+        if version != self.snapshot.version:
+            if not isinstance(version, int):
+                return None
+            with self.snapshot_lock:
+                try:
+                    if self.snapshot.version != version:
+                        # Same change log the dashboard replicas sync from
+                        changes = self.get_changes(self.snapshot.version)
+                        if changes["reset"]:
+                            self.load_snapshot()
+                        else:
+                            self.snapshot.apply(changes["upserts"], changes["deletes"], changes["token"])
+                except Exception as e:
+                    logger.error(f"Error refreshing columnar snapshot: {e}")
+                    return None
+            if self.snapshot.version != version:
+                # Stopped at a change log gap, stay exact by asking MongoDB
+                return None
+        return self.snapshot
+
+    def value_counts(self, field, match_query=None):
+        """
+        Count documents per value of a field
+        :return: List of (value, count), most frequent first
+        """
+        match_query = match_query or {}
+        try:
+            snapshot = self._snapshot_for(match_query) if field in ColumnarSnapshot.CATEGORY_FIELDS else None
+            if snapshot is not None:
+                with snapshot.lock:
+                    return snapshot.value_counts(field, snapshot.mask(match_query))
+
+            pipeline = [{"$match": match_query}] if match_query else []
+            pipeline.extend([
+                {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}}
+            ])
+            return [(self._decode_value(field, bucket["_id"]), bucket["count"]) for bucket in self._aggregate(pipeline)]
+        except Exception as e:
+            logger.error(f"Error counting {field} values: {e}")
+            return []
+
+    def mark_changed(self):
+        """Drop state derived from the data after a write through this process"""
+        self.invalidate_fuzzy_index()
+        self.data_version = None
+
+    def fuzzy_query(self, term):
+        """
+        Build a typo-tolerant query on breed and name
+        :param term: Search text, possibly misspelled
+        :return: MongoDB query dictionary, or None if nothing matched
+        """
+        try:
+            return self.get_fuzzy_index().build_query(term)
+        except Exception as e:
+            logger.error(f"Error building fuzzy query: {e}")
+            return None
+
+    def search(self, query, cursor=None, page_size=100):
+        """
+        Paginated search with total count and facet breakdowns.
+        The first page runs a single $facet pipeline for results, total and
+        facets; later pages are plain index-backed finds from the cursor.
+        :param query: MongoDB query dictionary (may contain $text)
+        :param cursor: Decoded cursor state from a previous page, None for the first page
+        :param page_size: Documents per page
+        :return: Dictionary with results, total, facets and next_cursor
+        """
+        # Compact documents answer $text through the lookup collections, without relevance scores
+        is_text = "$text" in query and self.schema is None
+        score_sort = {"score": {"$meta": "textScore"}}
+        total = None
+        facets = None
+
+        if cursor is None:
+            # Text results are ranked by relevance, everything else by _id (keyset)
+            sort_stage = {"$sort": score_sort} if is_text else {"$sort": {"_id": 1}}
+            facet_stage = {
+                "results": [sort_stage, {"$limit": page_size + 1}],
+                "total": [{"$count": "count"}]
+            }
+            for field in self.FACET_FIELDS:
+                facet_stage[field] = [
+                    {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1}},
+                    {"$limit": self.FACET_LIMIT}
+                ]
+
+            output = self._aggregate([{"$match": query}, {"$facet": facet_stage}])[0]
+            documents = [self._decode(doc) for doc in output["results"]]
+            total = output["total"][0]["count"] if output["total"] else 0
+            facets = {
+                field: [{"value": self._decode_value(field, bucket["_id"]), "count": bucket["count"]}
+                        for bucket in output[field]]
+                for field in self.FACET_FIELDS
+            }
+            offset = 0
+        elif is_text:
+            start = time.perf_counter()
+            offset = int(cursor.get("offset", 0))
+            documents = list(self.collection.find(query, score_sort)
+                             .sort([("score", {"$meta": "textScore"})])
+                             .skip(offset).limit(page_size + 1))
+            self.slow_queries.record("find", query, (time.perf_counter() - start) * 1000)
+        else:
+            start = time.perf_counter()
+            offset = 0
+            page_query = self._query({**query, "_id": {"$gt": ObjectId(cursor["after"])}})
+            cursor_documents = self.collection.find(page_query).sort("_id", 1).limit(page_size + 1)
+            documents = [self._decode(doc) for doc in cursor_documents]
+            self.slow_queries.record("find", page_query, (time.perf_counter() - start) * 1000, sort={"_id": 1})
+
+        has_more = len(documents) > page_size
+        documents = documents[:page_size]
+
+        next_cursor = None
+        if has_more:
+            if is_text:
+                next_cursor = {"offset": offset + page_size}
+            else:
+                next_cursor = {"after": str(documents[-1]["_id"])}
+
+        for doc in documents:
+            doc["_id"] = str(doc["_id"])
+            doc.pop("score", None)
+
+        return {
+            "results": documents,
+            "total": total,
+            "facets": facets,
+            "next_cursor": next_cursor
+        }
+
+    def find_within_radius(self, lat, lon, radius_km, match_query=None, limit=500):
+        """
+        Find animals within a radius of a point (2dsphere index)
+        :param lat: Latitude of the center
+        :param lon: Longitude of the center
+        :param radius_km: Radius in kilometers
+        :param match_query: Additional filter, e.g. a rescue filter
+        :param limit: Maximum number of documents to return
+        :return: List of documents
+        """
+        query = merge_queries(match_query, {
+            "location": {"$geoWithin": {"$centerSphere": [[lon, lat], radius_km / EARTH_RADIUS_KM]}}
+        })
+        return self.read(query, limit=limit)
+
+    def find_within_box(self, min_lon, min_lat, max_lon, max_lat, match_query=None, limit=500):
+        """
+        Find animals inside a bounding box (2dsphere index)
+        :return: List of documents
+        """
+        box = {
+            "type": "Polygon",
+            "coordinates": [[
+                [min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat],
+                [min_lon, max_lat], [min_lon, min_lat]
+            ]]
+        }
+        query = merge_queries(match_query, {"location": {"$geoWithin": {"$geometry": box}}})
+        return self.read(query, limit=limit)
+
+    def find_near(self, lat, lon, max_km=None, match_query=None, limit=100):
+        """
+        Find the animals nearest to a point, closest first
+        :param lat: Latitude of the point
+        :param lon: Longitude of the point
+        :param max_km: Optional maximum distance in kilometers
+        :param match_query: Additional filter, e.g. a rescue filter
+        :param limit: Maximum number of documents to return
+        :return: List of documents with a distance_km field
+        """
+        try:
+            geo_near = {
+                "near": {"type": "Point", "coordinates": [lon, lat]},
+                "distanceField": "distance_km",
+                "distanceMultiplier": 0.001,  # meters to kilometers
+                "spherical": True,
+                "key": "location"
+            }
+            if max_km is not None:
+                geo_near["maxDistance"] = max_km * 1000
+            if match_query:
+                geo_near["query"] = match_query
+
+            results = [self._decode(doc) for doc in self._aggregate([{"$geoNear": geo_near}, {"$limit": limit}])]
+            for doc in results:
+                doc['_id'] = str(doc['_id'])
+            return results
+        except Exception as e:
+            logger.error(f"Error in near query: {e}")
+            return []
+
+    def get_location_grid(self, zoom, match_query=None, bounds=None, max_cells=2000):
+        """
+        Bin animal locations into a zoom-dependent grid
+        :param zoom: Map zoom level, each level halves the cell size
+        :param match_query: Filter for the animals to include
+        :param bounds: Optional (min_lon, min_lat, max_lon, max_lat) viewport
+        :param max_cells: Maximum number of cells to return (largest first)
+        :return: GeoJSON FeatureCollection with one point per occupied cell
+        """
+        # GRID_CELLS_PER_TILE cells across each 256px map tile
+        cell_size = 360.0 / (2 ** zoom) / GRID_CELLS_PER_TILE
+        location_query = {
+            "location_lat": {"$type": "number"},
+            "location_long": {"$type": "number"}
+        }
+        if bounds:
+            min_lon, min_lat, max_lon, max_lat = bounds
+            location_query = {
+                "location_lat": {"$gte": min_lat, "$lte": max_lat},
+                "location_long": {"$gte": min_lon, "$lte": max_lon}
+            }
+
+        pipeline = [
+            {"$match": merge_queries(match_query, location_query)},
+            {"$group": {
+                "_id": {
+                    "lat": {"$floor": {"$divide": ["$location_lat", cell_size]}},
+                    "lon": {"$floor": {"$divide": ["$location_long", cell_size]}}
+                },
+                "count": {"$sum": 1},
+                "lat": {"$avg": "$location_lat"},
+                "lon": {"$avg": "$location_long"}
+            }},
+            {"$sort": {"count": -1}},
+            {"$limit": max_cells}
+        ]
+
+        try:
+            cells = self._aggregate(pipeline)
+        except Exception as e:
+            logger.error(f"Error in location grid aggregation: {e}")
+            cells = []
+
+        return {
+            "type": "FeatureCollection",
+            "cell_size": cell_size,
+            "features": [
+                {
+                    "type": "Feature",
+                    # Centroid of the animals in the cell, not the cell corner
+                    "geometry": {"type": "Point", "coordinates": [round(cell["lon"], 6), round(cell["lat"], 6)]},
+                    "properties": {"count": cell["count"]}
+                }
+                for cell in cells
+            ]
+        }
+
     def aggregate_by_outcome_type(self, match_query=None):
         """Aggregate data by outcome type"""
         try:
+            snapshot = self._snapshot_for(match_query)
+            if snapshot is not None:
+                with snapshot.lock:
+                    return snapshot.outcome_type_summary(snapshot.mask(match_query or {}))
+
             pipeline = []
             
             if match_query:
@@ -171,113 +854,403 @@ class MongoDataManager:
                 {"$sort": {"count": -1}}
             ])
             
-            results = list(self.collection.aggregate(pipeline))
-            return results
+            results = self._aggregate(pipeline)
+            return self._decode_groups(results, "outcome_type")
         except Exception as e:
             logger.error(f"Error in outcome type aggregation: {e}")
             return []
 
-    def aggregate_by_animal_type(self, match_query=None):
-        """Aggregate data by animal type"""
+    @staticmethod
+    def _top_values_stages(group_id, field, name, top_k, accumulators=None, totals=None):
+        """
+        Stages grouping by group_id with a distinct count and the top_k most frequent
+        values of field, instead of an unbounded $addToSet of every value
+        :param group_id: Dictionary of output key -> grouping expression
+        :param field: Field whose values are summarized
+        :param name: Output name, gives distinct_<name> and top_<name>
+        :param top_k: Number of values kept per group
+        :param accumulators: Extra accumulators of the (group, value) level
+        :param totals: Accumulators of the group level, over the (group, value) documents
+        """
+        value_id = dict(group_id, value=f"${field}")
+        group_fields = {key: f"$_id.{key}" for key in group_id}
+        return [
+            {"$group": dict({"_id": value_id, "count": {"$sum": 1}}, **(accumulators or {}))},
+            {"$sort": {"count": -1, "_id.value": 1}},
+            {"$group": dict({
+                "_id": group_fields if len(group_fields) > 1 else next(iter(group_fields.values())),
+                "count": {"$sum": "$count"},
+                f"distinct_{name}": {"$sum": 1},
+                # Pushed in count order, so the slice below keeps the most frequent
+                f"top_{name}": {"$push": {"value": "$_id.value", "count": "$count"}}
+            }, **(totals or {}))},
+            {"$addFields": {f"top_{name}": {"$slice": [f"$top_{name}", top_k]}}}
+        ]
+
+    def aggregate_by_animal_type(self, match_query=None, top_k=DEFAULT_TOP_K):
+        """Aggregate data by animal type, with the top breeds of each"""
         try:
+            snapshot = self._snapshot_for(match_query)
+            if snapshot is not None:
+                with snapshot.lock:
+                    return snapshot.animal_type_summary(snapshot.mask(match_query or {}), top_k)
+
             pipeline = []
             
             if match_query:
                 pipeline.append({"$match": match_query})
             
-            pipeline.extend([
-                {"$group": {
-                    "_id": "$animal_type",
-                    "count": {"$sum": 1},
-                    "breeds": {"$addToSet": "$breed"}
-                }},
-                {"$sort": {"count": -1}}
-            ])
+            pipeline.extend(self._top_values_stages({"animal_type": "$animal_type"}, "breed", "breeds", top_k))
+            pipeline.append({"$sort": {"count": -1}})
             
-            results = list(self.collection.aggregate(pipeline))
-            return results
+            results = self._aggregate(pipeline)
+            return self._decode_groups(results, "animal_type", "top_breeds", "breed")
         except Exception as e:
             logger.error(f"Error in animal type aggregation: {e}")
             return []
 
-    def aggregate_by_breed(self, match_query=None):
-        """Aggregate data by breed"""
+    def aggregate_by_breed(self, match_query=None, top_k=DEFAULT_TOP_K):
+        """Aggregate data by breed, with the top outcome types of each"""
         try:
+            snapshot = self._snapshot_for(match_query)
+            if snapshot is not None:
+                with snapshot.lock:
+                    return snapshot.breed_summary(snapshot.mask(match_query or {}), top_k)
+
             pipeline = []
             
             if match_query:
                 pipeline.append({"$match": match_query})
             
+            # The average age is carried as a sum and count of known ages through both groups
+            age = "$age_upon_outcome_in_weeks"
+            pipeline.extend(self._top_values_stages(
+                {"breed": "$breed"}, "outcome_type", "outcome_types", top_k,
+                accumulators={
+                    "age_sum": {"$sum": age},
+                    "age_count": {"$sum": {"$cond": [{"$gt": [age, None]}, 1, 0]}}
+                },
+                totals={"age_sum": {"$sum": "$age_sum"}, "age_count": {"$sum": "$age_count"}}
+            ))
             pipeline.extend([
-                {"$group": {
-                    "_id": "$breed",
-                    "count": {"$sum": 1},
-                    "avg_age_weeks": {"$avg": "$age_upon_outcome_in_weeks"},
-                    "outcome_types": {"$addToSet": "$outcome_type"}
-                }},
                 {"$sort": {"count": -1}},
-                {"$limit": 20}  # Top 20 breeds
+                {"$limit": 20},  # Top 20 breeds
+                {"$addFields": {"avg_age_weeks": {"$cond": [
+                    {"$gt": ["$age_count", 0]}, {"$divide": ["$age_sum", "$age_count"]}, None]}}},
+                {"$project": {"age_sum": 0, "age_count": 0}}
             ])
             
-            results = list(self.collection.aggregate(pipeline))
-            return results
+            results = self._aggregate(pipeline)
+            return self._decode_groups(results, "breed", "top_outcome_types", "outcome_type")
         except Exception as e:
             logger.error(f"Error in breed aggregation: {e}")
             return []
 
-    def get_monthly_statistics(self, match_query=None):
-        """Get monthly statistics"""
+    def get_age_histogram(self, match_query=None, edges=DEFAULT_AGE_EDGES, bins=None):
+        """
+        Count animals per age range with $bucket (fixed edges) or $bucketAuto (even bins)
+        :param match_query: MongoDB filter
+        :param edges: Increasing bin edges in weeks; older ages fall into a last open bin,
+            younger ones are not counted
+        :param bins: Number of automatically sized bins, used instead of edges
+        :return: List of {min, max, count}, max is None for the open bin
+        """
         try:
+            # Only known ages are binned; this also lets the age index serve the match.
+            # $bucket's default bin takes values below the first edge too, so those are left out
+            age_condition = {"$type": "number"} if bins else {"$type": "number", "$gte": edges[0]}
+            match = merge_queries(match_query, {"age_upon_outcome_in_weeks": age_condition})
+            pipeline = [{"$match": match}]
+
+            if bins:
+                pipeline.append({"$bucketAuto": {
+                    "groupBy": "$age_upon_outcome_in_weeks",
+                    "buckets": bins,
+                    "output": {"count": {"$sum": 1}}
+                }})
+                results = self._aggregate(pipeline)
+                return [{"min": bucket["_id"]["min"], "max": bucket["_id"]["max"], "count": bucket["count"]}
+                        for bucket in results]
+
+            edges = list(edges)
+            pipeline.append({"$bucket": {
+                "groupBy": "$age_upon_outcome_in_weeks",
+                "boundaries": edges,
+                "default": "older",
+                "output": {"count": {"$sum": 1}}
+            }})
+            counts = {bucket["_id"]: bucket["count"] for bucket in self._aggregate(pipeline)}
+
+            # Report every bin, including empty ones, so charts keep a stable axis
+            histogram = [{"min": low, "max": high, "count": counts.get(low, 0)}
+                         for low, high in zip(edges, edges[1:])]
+            histogram.append({"min": edges[-1], "max": None, "count": counts.get("older", 0)})
+            return histogram
+        except Exception as e:
+            logger.error(f"Error in age histogram aggregation: {e}")
+            return []
+
+    def get_monthly_statistics(self, match_query=None, top_k=DEFAULT_TOP_K):
+        """Get monthly statistics, with the top outcome types of each month"""
+        try:
+            snapshot = self._snapshot_for(match_query)
+            if snapshot is not None:
+                with snapshot.lock:
+                    return snapshot.monthly_summary(snapshot.mask(match_query or {}), top_k)
+
             pipeline = []
 
             if match_query:
                 pipeline.append({"$match": match_query})
 
             pipeline.extend([
-                {
-                    "$addFields": {
-                        "parsed_date": {
-                            "$toDate": "$datetime"
-                        }
-                    }
-                },
-                {
-                    "$group": {
-                        "_id": {
-                            "year": {"$year": "$parsed_date"},
-                            "month": {"$month": "$parsed_date"}
-                        },
-                        "count": {"$sum": 1},
-                        "outcome_types": {"$addToSet": "$outcome_type"}
-                    }
-                },
+                *self._top_values_stages(
+                    {"year": {"$year": self.OUTCOME_DATE}, "month": {"$month": self.OUTCOME_DATE}},
+                    "outcome_type", "outcome_types", top_k
+                ),
                 {
                     "$sort": {"_id.year": 1, "_id.month": 1}
                 }
             ])
 
-            results = list(self.collection.aggregate(pipeline))
-            return results
+            results = self._aggregate(pipeline)
+            return self._decode_groups(results, top_name="top_outcome_types", top_field="outcome_type")
         except Exception as e:
             logger.error(f"Error in monthly statistics: {e}")
             return []
 
 
+    @classmethod
+    def _period_expression(cls, granularity, date):
+        """Expression giving the bucket label of a date, e.g. "2016-05" or "2016-Q2" """
+        if granularity == "quarter":
+            quarter = {"$toInt": {"$ceil": {"$divide": [{"$month": date}, 3]}}}
+            return {"$concat": [{"$toString": {"$year": date}}, "-Q", {"$toString": quarter}]}
+        return {"$dateToString": {"format": cls.PERIOD_FORMATS[granularity], "date": date}}
+
+    @staticmethod
+    def _series_stages(period, count):
+        """Stages turning (period, outcome_type) counts into one document per period"""
+        return [
+            {"$group": {
+                "_id": {"period": period, "outcome_type": "$outcome_type"},
+                "count": {"$sum": count}
+            }},
+            {"$group": {
+                "_id": "$_id.period",
+                "count": {"$sum": "$count"},
+                # One entry per outcome type, so bounded by the handful of outcome types
+                # $toString: $arrayToObject needs string keys, compact documents group on integer codes
+                "outcomes": {"$push": {"k": {"$toString": {"$ifNull": ["$_id.outcome_type", "Unknown"]}},
+                                       "v": "$count"}}
+            }},
+            {"$sort": {"_id": 1}},
+            {"$project": {"_id": 0, "period": "$_id", "count": 1, "outcomes": {"$arrayToObject": "$outcomes"}}}
+        ]
+
+    def get_time_series(self, granularity="month", date_range=None, filter_type="All", match_query=None):
+        """
+        Count outcomes per time bucket, split by outcome type
+        :param granularity: One of GRANULARITIES
+        :param date_range: (start, end) datetimes, end exclusive, either may be None
+        :param filter_type: Rescue filter name, used to pick the daily rollup
+        :param match_query: MongoDB filter for filter_type
+        :return: List of {period, count, outcomes: {outcome_type: count}}
+        """
+        start, end = date_range or (None, None)
+
+        if filter_type in self.ROLLUP_FILTERS and self.rollup_is_current():
+            # Any window and granularity can be summed from the daily buckets
+            day_match = {"filter": filter_type}
+            if start or end:
+                day_match["day"] = {}
+                if start:
+                    day_match["day"]["$gte"] = start.strftime("%Y-%m-%d")
+                if end:
+                    day_match["day"]["$lt"] = end.strftime("%Y-%m-%d")
+            date = {"$dateFromString": {"dateString": "$day"}}
+            pipeline = [{"$match": day_match}] + \
+                self._series_stages(self._period_expression(granularity, date), "$count")
+            try:
+                return self._aggregate(pipeline, collection=self.db[self.ROLLUP_COLLECTION])
+            except Exception as e:
+                logger.error(f"Error reading the daily rollup, using the outcomes collection: {e}")
+
+        try:
+            match = dict(match_query or {})
+            if start or end:
+                # Pushed into the leading $match so the datetime index bounds the scan
+                match["datetime"] = {}
+                if start:
+                    match["datetime"]["$gte"] = start
+                if end:
+                    match["datetime"]["$lt"] = end
+
+            pipeline = []
+            if match:
+                pipeline.append({"$match": match})
+            pipeline.extend(self._series_stages(self._period_expression(granularity, self.OUTCOME_DATE), 1))
+            series = self._aggregate(pipeline)
+            if self.schema is not None:
+                for period in series:
+                    period["outcomes"] = {
+                        key if key == "Unknown" else self._decode_value("outcome_type", int(key)): count
+                        for key, count in period["outcomes"].items()
+                    }
+            return series
+        except Exception as e:
+            logger.error(f"Error in time series aggregation: {e}")
+            return []
+
+    def rollup_is_current(self):
+        """Check that the daily rollup was built at the current data version"""
+        try:
+            state = self.db[self.ROLLUP_COLLECTION + "_state"].find_one({"_id": self.collection_name})
+        except Exception:
+            return False
+        return state is not None and state["version"] == self.get_data_version()
+
+    def build_daily_rollup(self):
+        """
+        Rebuild the daily rollup: one document per (filter, day, outcome_type) with its count.
+        Readers fall back to the outcomes collection while it is rebuilt or stale.
+        :return: Number of rollup documents written
+        """
+        version = self.get_data_version(fresh=True)
+        state = self.db[self.ROLLUP_COLLECTION + "_state"]
+        rollup = self.db[self.ROLLUP_COLLECTION]
+        state.delete_one({"_id": self.collection_name})
+
+        documents = []
+        for filter_type in self.ROLLUP_FILTERS:
+            pipeline = []
+            match_query = get_filter_query(filter_type)
+            if match_query:
+                pipeline.append({"$match": match_query})
+            pipeline.extend([
+                {"$group": {
+                    "_id": {
+                        "day": {"$dateToString": {"format": "%Y-%m-%d", "date": self.OUTCOME_DATE}},
+                        "outcome_type": "$outcome_type"
+                    },
+                    "count": {"$sum": 1}
+                }}
+            ])
+            if self.schema is not None:
+                pipeline = self.schema.encode_pipeline(pipeline)
+            # The rollup stores public outcome types, so it is read the same way with either schema
+            for bucket in self.collection.aggregate(pipeline, allowDiskUse=True):
+                documents.append({
+                    "filter": filter_type,
+                    "day": bucket["_id"]["day"],
+                    "outcome_type": self._decode_value("outcome_type", bucket["_id"]["outcome_type"]),
+                    "count": bucket["count"]
+                })
+
+        rollup.delete_many({})
+        if documents:
+            rollup.insert_many(documents)
+        rollup.create_index([("filter", 1), ("day", 1)])
+        state.replace_one({"_id": self.collection_name}, {"_id": self.collection_name, "version": version},
+                          upsert=True)
+        logger.info(f"Daily rollup built with {len(documents)} buckets at version {version}")
+        return len(documents)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Serialize dates in ISO 8601 (Flask's default is the HTTP date format)"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = JSONProvider(app)
+
+# Instrument requests, MongoDB commands, the connection pool and the caches
+metrics.init_app(app)
+metrics.install_mongo_listeners()
+metrics.register_cache("search_cache", search_cache)
+metrics.register_cache("query_cache", query_cache)
+metrics.register_cache("aggregation_cache", aggregation_cache)
+
+# Storage backend: mongo (default), columnar (MongoDB plus an in-memory column
+# store), sqlite (embedded local database, no MongoDB server needed) or
+# snapshot (read-only, memory-mapped snapshot file)
+DATA_BACKEND = os.getenv('DATA_BACKEND', 'mongo')
 
 # Initialize data manager
 try:
-    data_manager = MongoDataManager()
-    data_manager.create_indexes()  # Create performance indexes
+    if DATA_BACKEND == 'sqlite':
+        data_manager = SQLiteStorage()
+    elif DATA_BACKEND == 'snapshot':
+        data_manager = SnapshotStorage()
+    else:
+        data_manager = MongoDataManager()
+        data_manager.create_indexes()  # Create performance indexes
     stats = data_manager.get_stats()
-    logger.info(f"MongoDB initialized with {stats['total_documents']} documents")
+    logger.info(f"{data_manager.backend_name} storage initialized with {stats['total_documents']} documents")
 except Exception as e:
-    logger.error(f"Failed to initialize MongoDB: {e}")
+    logger.error(f"Failed to initialize {DATA_BACKEND} storage: {e}")
     data_manager = None
 
+is_mongo = isinstance(data_manager, MongoDataManager)
+if is_mongo:
+    metrics.registry.register(metrics.Gauge(
+        "mongodb_coalesced_calls", "Reads and aggregations served by an identical in-flight call",
+        callback=lambda: {(): data_manager.inflight.shared}))
+
 # Initialize CRUD manager for create/read/update/delete functionality
-crud_manager = MongoCRUD()
+# (the SQLite backend handles its own writes, the snapshot backend refuses them)
+crud_manager = data_manager if DATA_BACKEND in ('sqlite', 'snapshot') else MongoCRUD()
+
+# Push change events to connected dashboards. A change stream also sees writes
+# from other workers and the importer; without one (standalone mongod) the
+# CRUD path of this process publishes its own writes.
+event_broker = EventBroker()
+if not (is_mongo and start_change_stream(data_manager.collection, event_broker)):
+    crud_manager.change_listeners.append(
+        lambda op, doc_id, version: event_broker.publish(change_event(op, doc_id, version)))
+metrics.registry.register(metrics.Gauge(
+    "sse_clients", "Connected Server-Sent Events clients",
+    callback=lambda: {(): event_broker.client_count()}))
+
+@app.errorhandler(NotImplementedError)
+def not_supported(error):
+    """Operations the configured storage backend does not implement"""
+    return jsonify({"error": f"Not supported by the {data_manager.backend_name} storage backend"}), 501
+
+def conditional_response(view):
+    """
+    Serve a view with an ETag derived from the collection write version and the
+    request parameters, answering If-None-Match with 304 before any query runs
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not data_manager:
+            return view(*args, **kwargs)
+
+        params = sorted(request.args.items(multi=True))
+        etag_source = f"{data_manager.get_data_version()}:{request.path}:{params}"
+        etag = hashlib.sha1(etag_source.encode("utf-8")).hexdigest()
+
+        if etag in request.if_none_match:
+            response = make_response("", 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag)
+        # Browsers may keep the body but must revalidate it on every use
+        response.cache_control.no_cache = True
+        response.cache_control.private = True
+        return response
+    return wrapper
 
 @app.route('/')
 def index():
@@ -285,45 +1258,82 @@ def index():
     return render_template('index.html')
 
 @app.route('/api/data')
+@conditional_response
 def get_data():
     """API endpoint to get filtered data"""
     if not data_manager:
         return jsonify({"error": "Database connection not available"}), 500
     
-    filter_type = request.args.get('filter_type', 'All')
+    try:
+        query = build_request_query()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    query = {}
+    if query is None:
+        return jsonify([])
     
-    if filter_type == 'Water Rescue':
-        query = {
-            "breed": {"$in": ["Labrador Retriever Mix", "Chesapeake Bay Retriever", "Newfoundland"]},
-            "sex_upon_outcome": "Intact Female",
-            "age_upon_outcome_in_weeks": {"$gte": 26, "$lte": 156}
-        }
-    elif filter_type == 'Mountain or Wilderness Rescue':
-        query = {
-            "breed": {"$in": ["German Shepherd", "Alaskan Malamute", "Old English Sheepdog", "Siberian Husky", "Rottweiler"]},
-            "sex_upon_outcome": "Intact Male",
-            "age_upon_outcome_in_weeks": {"$gte": 26, "$lte": 156}
-        }
-    elif filter_type == 'Disaster or Individual Tracking':
-        query = {
-            "breed": {"$in": ["Doberman Pinscher", "German Shepherd", "Golden Retriever", "Bloodhound", "Rottweiler"]},
-            "sex_upon_outcome": "Intact Male",
-            "age_upon_outcome_in_weeks": {"$gte": 20, "$lte": 300}
-        }
+    # Per-column table filters (f.<field>=value)
+    column_filters = {key[2:]: value for key, value in request.args.items() if key.startswith('f.')}
+    try:
+        query = merge_queries(query, compile_column_filters(column_filters))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Server-side sort, only on whitelisted fields an index can serve
+    sort = None
+    sort_field = request.args.get('sort')
+    if sort_field:
+        if sort_field not in MongoDataManager.SORTABLE_FIELDS:
+            return jsonify({"error": f"Cannot sort on '{sort_field}'"}), 400
+        if not data_manager.sort_index_supported(sort_field, query):
+            return jsonify({"error": f"Sorting on '{sort_field}' is not index-supported"}), 400
+        direction = -1 if request.args.get('order') == 'desc' else 1
+        # _id breaks ties so pages are stable
+        sort = [(sort_field, direction), ("_id", direction)]
+    
+    # Optional paging of the table
+    page_size = request.args.get('page_size', type=int)
+    skip = 0
+    if page_size:
+        page_size = min(max(page_size, 1), 1000)
+        skip = max(request.args.get('page', 0, type=int), 0) * page_size
+        # Pages of an unsorted table still need a defined order to not overlap
+        if sort is None:
+            sort = [("_id", 1)]
+    
+    # Version the result is at, read first so no later change can be missed
+    version = data_manager.get_data_version(fresh=True)
     
     # Get filtered data
-    data = data_manager.read(query)
+    data = data_manager.read(query, limit=page_size, sort=sort, skip=skip)
     
-    # Remove MongoDB ObjectId from response
-    for record in data:
-        if '_id' in record:
-            del record['_id']
+    # Remove MongoDB ObjectId from response, unless the client keeps a replica keyed by it
+    if request.args.get('include_id') != '1':
+        for record in data:
+            if '_id' in record:
+                del record['_id']
     
-    return jsonify(data)
+    response = make_response(jsonify(data))
+    response.headers["X-Data-Version"] = str(version)
+    if page_size:
+        response.headers["X-Total-Count"] = str(data_manager.count(query))
+    return response
+
+@app.route('/api/data/changes')
+def get_data_changes():
+    """API endpoint for the inserts, updates and deletes to a filter since a version token"""
+    if not data_manager:
+        return jsonify({"error": "Database connection not available"}), 500
+    
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({"error": "since is required"}), 400
+    
+    match_query = get_filter_query(request.args.get('filter_type', 'All'))
+    return jsonify(data_manager.get_changes(since, match_query))
 
 @app.route('/api/chart')
+@conditional_response
 def get_chart():
     """API endpoint to get pie chart data"""
     if not data_manager:
@@ -352,20 +1362,15 @@ def get_chart():
             "age_upon_outcome_in_weeks": {"$gte": 20, "$lte": 300}
         }
     
-    # Get filtered data
-    data = data_manager.read(query)
+    # Count breeds where the data lives instead of shipping every document here
+    breed_counts = data_manager.value_counts('breed', query)
     
-    if not data:
+    if not breed_counts:
         return jsonify({'error': 'No data available'})
     
-    # Convert to DataFrame for plotting
-    df = pd.DataFrame(data)
-    
-    if 'breed' not in df.columns:
-        return jsonify({'error': 'No breed data available'})
-    
     # Create pie chart
-    fig = px.pie(df, names='breed')
+    breeds, counts = zip(*breed_counts)
+    fig = px.pie(names=breeds, values=counts)
     fig.update_layout(
         height=800,
         font=dict(size=18),
@@ -439,7 +1444,108 @@ def get_map_data():
     
     return jsonify({'error': 'Location data not available for selected animal'})
 
+@app.route('/api/map/grid')
+@conditional_response
+def get_map_grid():
+    """API endpoint for the filtered animals binned into map grid cells (GeoJSON)"""
+    if not data_manager:
+        return jsonify({"error": "Database connection not available"}), 500
+    
+    zoom = min(max(request.args.get('zoom', 10, type=int), 0), 20)
+    bounds = None
+    bbox = request.args.get('bbox')
+    if bbox:
+        try:
+            bounds = tuple(float(v) for v in bbox.split(','))
+            if len(bounds) != 4:
+                raise ValueError
+        except ValueError:
+            return jsonify({"error": "bbox must be min_lon,min_lat,max_lon,max_lat"}), 400
+    
+    try:
+        match_query = build_request_query()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if match_query is None:
+        return jsonify({"type": "FeatureCollection", "features": []})
+    
+    return jsonify(data_manager.get_location_grid(zoom, match_query, bounds))
+
+@app.route('/api/geo/within')
+def get_animals_within():
+    """API endpoint for animals within a radius (lat, lon, radius_km) or a box (min_lon,min_lat,max_lon,max_lat)"""
+    if not data_manager:
+        return jsonify({"error": "Database connection not available"}), 500
+    
+    match_query = get_filter_query(request.args.get('filter_type', 'All'))
+    limit = min(max(request.args.get('limit', 500, type=int), 1), 5000)
+    box = request.args.get('box')
+    
+    if box:
+        try:
+            min_lon, min_lat, max_lon, max_lat = [float(v) for v in box.split(',')]
+        except ValueError:
+            return jsonify({"error": "box must be min_lon,min_lat,max_lon,max_lat"}), 400
+        data = data_manager.find_within_box(min_lon, min_lat, max_lon, max_lat, match_query, limit)
+        return jsonify(data)
+    
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    radius_km = request.args.get('radius_km', 10, type=float)
+    if lat is None or lon is None:
+        return jsonify({"error": "lat and lon, or box, are required"}), 400
+    
+    data = data_manager.find_within_radius(lat, lon, radius_km, match_query, limit)
+    return jsonify(data)
+
+@app.route('/api/geo/near')
+def get_animals_near():
+    """API endpoint for the animals nearest to a point, closest first"""
+    if not data_manager:
+        return jsonify({"error": "Database connection not available"}), 500
+    
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None:
+        return jsonify({"error": "lat and lon are required"}), 400
+    
+    max_km = request.args.get('max_km', type=float)
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    match_query = get_filter_query(request.args.get('filter_type', 'All'))
+    
+    data = data_manager.find_near(lat, lon, max_km, match_query, limit)
+    return jsonify(data)
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics endpoint"""
+    response = make_response(metrics.registry.render())
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
+
+@app.route('/api/admin/index-report')
+def get_index_report():
+    """API endpoint for the slow query log with explain plans and index recommendations"""
+    if not data_manager:
+        return jsonify({"error": "Database connection not available"}), 500
+    
+    if not is_mongo:
+        return jsonify({"error": f"Index report is not supported by the {data_manager.backend_name} backend"}), 501
+    
+    report = build_index_report(data_manager.collection, data_manager.slow_queries)
+    return make_response(json_util.dumps(report), 200, {"Content-Type": "application/json"})
+
+@app.route('/api/events')
+def stream_events():
+    """Server-Sent Events stream of data changes"""
+    response = Response(stream_with_context(event_broker.stream()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Keep reverse proxies from buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
 @app.route('/api/stats')
+@conditional_response
 def get_stats():
     """API endpoint to get database statistics"""
     if not data_manager:
@@ -453,6 +1559,8 @@ def create_animal():
     data = request.json
     inserted_id = crud_manager.create(data)
     if inserted_id:
+        if data_manager:
+            data_manager.mark_changed()
         return jsonify({"success": True, "id": inserted_id}), 201
     return jsonify({"error": "Insertion failed"}), 500
 
@@ -468,6 +1576,8 @@ def update_animal(doc_id):
     updated_data = request.json
     success = crud_manager.update(doc_id, updated_data)
     if success:
+        if data_manager:
+            data_manager.mark_changed()
         return jsonify({"success": True})
     return jsonify({"error": "Update failed"}), 500
 
@@ -475,56 +1585,58 @@ def update_animal(doc_id):
 def delete_animal(doc_id):
     success = crud_manager.delete(doc_id)
     if success:
+        if data_manager:
+            data_manager.mark_changed()
         return jsonify({"success": True})
     return jsonify({"error": "Deletion failed"}), 500
 
 @app.route('/api/search')
+@conditional_response
 def search_animals():
-    """API endpoint for real-time search"""
+    """API endpoint for real-time search with cursor pagination and facets"""
     if not data_manager:
         return jsonify({"error": "Database connection not available"}), 500
     
     query_text = request.args.get('q', '').strip()
+    mode = request.args.get('mode', 'text')
+    filter_type = request.args.get('filter_type', 'All')
+    cursor_token = request.args.get('cursor')
+    page_size = min(max(request.args.get('page_size', 100, type=int), 1), 500)
+    empty_page = {"results": [], "total": 0, "facets": None, "next_cursor": None}
     
     if not query_text:
-        return jsonify([])
+        return jsonify(empty_page)
     
     # Check cache first
-    cache_key = f"search:{query_text.lower()}"
+    cache_key = (f"search:{data_manager.get_data_version()}:{mode}:{filter_type}:"
+                 f"{query_text}:{page_size}:{cursor_token or ''}")
     cached_result = search_cache.get(cache_key)
     
     if cached_result:
         logger.info(f"Cache hit for query: {query_text}")
         return jsonify(cached_result)
     
-    # MongoDB text search query
-    search_query = {
-        "$text": {
-            "$search": query_text,
-            "$caseSensitive": False
-        }
-    }
+    try:
+        cursor = decode_cursor(cursor_token) if cursor_token else None
+        search_query = build_request_query()
+        if search_query is None:
+            return jsonify(empty_page)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     try:
-        # Perform text search with relevance scoring
-        results = list(data_manager.collection.find(
-            search_query,
-            {"score": {"$meta": "textScore"}}
-        ).sort([("score", {"$meta": "textScore"})]).limit(100))
-        
-        # Convert ObjectId to string and remove score field
-        clean_results = []
-        for doc in results:
-            doc['_id'] = str(doc['_id'])
-            doc.pop('score', None)  # Remove score field
-            clean_results.append(doc)
+        page = data_manager.search(search_query, cursor=cursor, page_size=page_size)
+        if page["next_cursor"]:
+            page["next_cursor"] = encode_cursor(page["next_cursor"])
         
         # Cache the results
-        search_cache.put(cache_key, clean_results)
+        search_cache.put(cache_key, page)
         
-        logger.info(f"Search performed for '{query_text}': {len(clean_results)} results")
-        return jsonify(clean_results)
+        logger.info(f"Search performed for '{query_text}': {len(page['results'])} results")
+        return jsonify(page)
         
+    except NotImplementedError:
+        raise
     except Exception as e:
         logger.error(f"Search error: {e}")
         return jsonify({"error": "Search failed"}), 500
@@ -535,6 +1647,7 @@ def analytics():
     return render_template('analytics.html')
 
 @app.route('/api/aggregation/outcome-type')
+@conditional_response
 def get_outcome_type_aggregation():
     """API endpoint for outcome type aggregation"""
     if not data_manager:
@@ -547,6 +1660,7 @@ def get_outcome_type_aggregation():
     return jsonify(results)
 
 @app.route('/api/aggregation/animal-type')
+@conditional_response
 def get_animal_type_aggregation():
     """API endpoint for animal type aggregation"""
     if not data_manager:
@@ -555,10 +1669,12 @@ def get_animal_type_aggregation():
     filter_type = request.args.get('filter_type', 'All')
     match_query = get_filter_query(filter_type)
     
-    results = data_manager.aggregate_by_animal_type(match_query)
+    top_k = min(max(request.args.get('top', DEFAULT_TOP_K, type=int), 1), MAX_TOP_K)
+    results = data_manager.aggregate_by_animal_type(match_query, top_k)
     return jsonify(results)
 
 @app.route('/api/aggregation/breed')
+@conditional_response
 def get_breed_aggregation():
     """API endpoint for breed aggregation"""
     if not data_manager:
@@ -567,10 +1683,12 @@ def get_breed_aggregation():
     filter_type = request.args.get('filter_type', 'All')
     match_query = get_filter_query(filter_type)
     
-    results = data_manager.aggregate_by_breed(match_query)
+    top_k = min(max(request.args.get('top', DEFAULT_TOP_K, type=int), 1), MAX_TOP_K)
+    results = data_manager.aggregate_by_breed(match_query, top_k)
     return jsonify(results)
 
 @app.route('/api/aggregation/monthly')
+@conditional_response
 def get_monthly_aggregation():
     """API endpoint for monthly statistics"""
     if not data_manager:
@@ -579,9 +1697,77 @@ def get_monthly_aggregation():
     filter_type = request.args.get('filter_type', 'All')
     match_query = get_filter_query(filter_type)
     
-    results = data_manager.get_monthly_statistics(match_query)
+    top_k = min(max(request.args.get('top', DEFAULT_TOP_K, type=int), 1), MAX_TOP_K)
+    results = data_manager.get_monthly_statistics(match_query, top_k)
+    return jsonify(results)
+
+@app.route('/api/aggregation/age-histogram')
+@conditional_response
+def get_age_histogram_aggregation():
+    """
+    API endpoint for the age distribution.
+    edges: comma separated bin edges in weeks, or bins: number of automatic bins
+    """
+    if not data_manager:
+        return jsonify({"error": "Database connection not available"}), 500
+    
+    filter_type = request.args.get('filter_type', 'All')
+    bins = request.args.get('bins', type=int)
+    try:
+        edges = parse_histogram_edges(request.args.get('edges'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if bins is not None and not 1 <= bins <= MAX_HISTOGRAM_BINS:
+        return jsonify({"error": f"bins must be between 1 and {MAX_HISTOGRAM_BINS}"}), 400
+    
+    cache_key = f"age:{data_manager.get_data_version()}:{filter_type}:{bins or edges}"
+    results = aggregation_cache.get(cache_key)
+    if results is None:
+        results = data_manager.get_age_histogram(get_filter_query(filter_type), edges, bins)
+        if results:
+            aggregation_cache.put(cache_key, results)
+    return jsonify(results)
+
+@app.route('/api/aggregation/timeseries')
+@conditional_response
+def get_time_series_aggregation():
+    """
+    API endpoint for outcome counts over time.
+    granularity: day, week, month, quarter or year; from/to: YYYY-MM-DD, both inclusive
+    """
+    if not data_manager:
+        return jsonify({"error": "Database connection not available"}), 500
+    
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in MongoDataManager.GRANULARITIES:
+        return jsonify({"error": f"granularity must be one of {', '.join(MongoDataManager.GRANULARITIES)}"}), 400
+    
+    try:
+        date_range = parse_date_range(request.args.get('from'), request.args.get('to'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    filter_type = request.args.get('filter_type', 'All')
+    match_query = get_filter_query(filter_type)
+    
+    results = data_manager.get_time_series(granularity, date_range, filter_type, match_query)
     return jsonify(results)
 
+@app.route('/api/admin/rollup', methods=['POST'])
+def rebuild_rollup():
+    """Rebuild the daily rollup behind the time series endpoint"""
+    if not data_manager:
+        return jsonify({"error": "Database connection not available"}), 500
+    
+    try:
+        buckets = data_manager.build_daily_rollup()
+        return jsonify({"buckets": buckets, "version": data_manager.get_data_version()})
+    except NotImplementedError:
+        raise
+    except Exception as e:
+        logger.error(f"Error building daily rollup: {e}")
+        return jsonify({"error": "Failed to build rollup"}), 500
+
 @app.route('/api/export/csv')
 def export_csv():
     """Export current data to CSV"""
@@ -589,20 +1775,13 @@ def export_csv():
         return jsonify({"error": "Database connection not available"}), 500
 
     filter_type = request.args.get('filter_type', 'All')
-    search_query = request.args.get('search', '')
 
-    # Get data based on filter or search
-    if search_query:
-        query = {
-            "$text": {
-                "$search": search_query,
-                "$caseSensitive": False
-            }
-        }
-        data = data_manager.read(query)
-    else:
-        query = get_filter_query(filter_type)
-        data = data_manager.read(query)
+    # Get data matching the filter and search together
+    try:
+        query = build_request_query(search_param='search')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    data = data_manager.read(query) if query is not None else []
 
     if not data:
         return jsonify({"error": "No data to export"}), 404
@@ -633,6 +1812,96 @@ def export_csv():
     return response
 
 
+def build_search_query(query_text):
+    """
+    Get the MongoDB query for a search string.
+    Field-qualified searches (breed:"German Shepherd" age:26..156) compile to
+    indexed predicates on the stored values matching regardless of case, plain
+    text goes to $text. Compiled queries are cached per data version, since the
+    stored values they resolve to change with the data.
+    :raises ValueError: If the field-qualified syntax is invalid
+    """
+    cache_key = f"{data_manager.get_data_version()}:{query_text}"
+    cached_query = query_cache.get(cache_key)
+    if cached_query is None:
+        if is_field_query(query_text):
+            fields, terms = parse_search_query(query_text)
+            cached_query = compile_search_query(fields, terms, data_manager.get_value_index())
+        else:
+            cached_query = {
+                "$text": {
+                    "$search": query_text,
+                    "$caseSensitive": False
+                }
+            }
+        query_cache.put(cache_key, cached_query)
+
+    # Hand out a copy so callers can extend the query without touching the cache
+    return dict(cached_query)
+
+
+def build_request_query(search_param='q'):
+    """
+    Get the MongoDB query for the current request's rescue filter and search.
+    Reads filter_type, the search string and mode (text or fuzzy) from the
+    query string and ANDs the filter with the search.
+    :param search_param: Name of the search string parameter
+    :return: MongoDB query dictionary, or None if a fuzzy search matched nothing
+    :raises ValueError: If the search syntax is invalid
+    """
+    filter_query = get_filter_query(request.args.get('filter_type', 'All'))
+    query_text = request.args.get(search_param, '').strip()
+
+    if not query_text:
+        return filter_query
+
+    if request.args.get('mode', 'text') == 'fuzzy':
+        # Typo-tolerant search: map the term to exact breeds/names, then $in query
+        search_query = data_manager.fuzzy_query(query_text)
+        if search_query is None:
+            return None
+    else:
+        search_query = build_search_query(query_text)
+
+    return merge_queries(filter_query, search_query)
+
+
+def parse_histogram_edges(raw_edges):
+    """
+    Parse comma separated histogram bin edges
+    :return: Tuple of edges, DEFAULT_AGE_EDGES if none were given
+    :raises ValueError: If the edges are not increasing numbers
+    """
+    if not raw_edges:
+        return DEFAULT_AGE_EDGES
+    try:
+        edges = tuple(float(edge) for edge in raw_edges.split(','))
+    except ValueError:
+        raise ValueError("edges must be comma separated numbers")
+    edges = tuple(int(edge) if edge.is_integer() else edge for edge in edges)
+    if not 2 <= len(edges) <= MAX_HISTOGRAM_BINS + 1:
+        raise ValueError(f"edges must list between 2 and {MAX_HISTOGRAM_BINS + 1} values")
+    if any(low >= high for low, high in zip(edges, edges[1:])):
+        raise ValueError("edges must be increasing")
+    return edges
+
+
+def parse_date_range(start, end):
+    """
+    Turn inclusive YYYY-MM-DD bounds into a half-open datetime range
+    :return: (start, end) datetimes, end exclusive, either may be None
+    :raises ValueError: If a date is malformed or the range is empty
+    """
+    try:
+        start_date = datetime.strptime(start, "%Y-%m-%d") if start else None
+        end_date = datetime.strptime(end, "%Y-%m-%d") + timedelta(days=1) if end else None
+    except ValueError:
+        raise ValueError("Dates must be formatted YYYY-MM-DD")
+    if start_date and end_date and start_date >= end_date:
+        raise ValueError("'from' must not be after 'to'")
+    return start_date, end_date
+
+
 def get_filter_query(filter_type):
     """Get MongoDB query for filter type"""
     if filter_type == 'Water Rescue':
@@ -656,6 +1925,11 @@ def get_filter_query(filter_type):
     else:
         return {}
 
+# The text index is created by the CRUD manager; confirm combined queries use it
+if is_mongo:
+    data_manager.verify_search_plan()
+    data_manager.check_date_types()
+
 if __name__ == '__main__':
     # Create templates and static directories if they don't exist
     os.makedirs('templates', exist_ok=True)
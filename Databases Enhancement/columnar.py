@@ -0,0 +1,467 @@
+import os
+import re
+import json
+import time
+import shutil
+import threading
+import logging
+import numpy as np
+from crud import build_location
+
+logger = logging.getLogger(__name__)
+
+# Compact once this share of the rows has been replaced or deleted
+DEAD_ROW_RATIO = 0.5
+
+# Snapshot file format version, bumped on incompatible layout changes
+SNAPSHOT_FORMAT = 1
+
+# Name of the file pointing at the current snapshot directory
+CURRENT_FILE = "CURRENT"
+
+MONTH_PATTERN = re.compile(r"^(\d{4})-(\d{2})")
+
+
+def _month_label(value):
+    """YYYY-MM of a datetime value (string or datetime), None if it has no date"""
+    match = MONTH_PATTERN.match(str(value)) if value is not None else None
+    return match.group(0) if match else None
+
+
+def _json_value(value):
+    """JSON form of dictionary values json cannot encode: ISO 8601 for dates, as the app serves them"""
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def _to_float(value):
+    """Numeric value as a float, NaN when missing or not a number (never matches a comparison)"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return np.nan
+    return float(value)
+
+
+class ColumnarSnapshot:
+    """
+    In-memory column store of the outcomes collection.
+    Categorical fields are dictionary-encoded into int32 code arrays and numeric
+    fields are float64 arrays, so filters run as vectorized boolean masks and
+    group-by counts as np.bincount. Loaded from MongoDB, full documents are
+    kept alongside to return rows; opened from a snapshot file, rows are
+    rebuilt from the memory-mapped columns.
+    """
+
+    CATEGORY_FIELDS = ("breed", "color", "sex_upon_outcome", "outcome_type", "outcome_subtype",
+                       "animal_type", "name", "animal_id")
+    NUMERIC_FIELDS = ("age_upon_outcome_in_weeks", "location_lat", "location_long")
+    # Encoded like the categories to rebuild rows, but never filtered on here
+    ROW_FIELDS = ("_id", "age_upon_outcome", "date_of_birth", "datetime", "monthyear")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._reset()
+        # False for mapped snapshots: their rows are rebuilt from the columns and lack
+        # the fields that are not columns (row_hash, extra fields written through CRUD)
+        self.complete = True
+
+    def _reset(self):
+        self.version = None
+        self.size = 0
+        self.documents = []     # None when rows come from mapped columns
+        self.rows = {}          # _id -> row index of its live version
+        self.live = np.zeros(0, dtype=bool)
+        encoded = self.CATEGORY_FIELDS + self.ROW_FIELDS
+        self.codes = {field: np.zeros(0, dtype=np.int32) for field in encoded}
+        self.values = {field: [] for field in encoded}   # code -> value
+        self.lookup = {field: {} for field in encoded}   # value -> code
+        self.numbers = {field: np.zeros(0) for field in self.NUMERIC_FIELDS}
+
+    def load(self, documents, version):
+        """Replace the snapshot with a full set of documents (_id already a string)"""
+        with self.lock:
+            self._reset()
+            self._append(documents)
+            self.version = version
+        logger.info(f"Columnar snapshot loaded with {len(documents)} rows at version {version}")
+
+    def apply(self, upserts, deleted_ids, version):
+        """Patch the snapshot with changed documents and deleted ids from the change log"""
+        with self.lock:
+            if self.documents is None:
+                # Mapped snapshot: copy the rows into memory before changing them
+                self.documents = [self._row(i) for i in range(self.size)]
+            for doc_id in [doc["_id"] for doc in upserts] + list(deleted_ids):
+                row = self.rows.pop(doc_id, None)
+                if row is not None:
+                    self.live[row] = False
+            self._append(upserts)
+            self.version = version
+
+            dead = self.size - len(self.rows)
+            if dead > DEAD_ROW_RATIO * max(self.size, 1):
+                self.load([self.documents[row] for row in sorted(self.rows.values())], version)
+
+    def _append(self, documents):
+        """Encode documents as new rows"""
+        start = self.size
+        self.documents.extend(documents)
+        self.size += len(documents)
+        for offset, doc in enumerate(documents):
+            self.rows[doc["_id"]] = start + offset
+        self.live = np.concatenate([self.live, np.ones(len(documents), dtype=bool)])
+
+        for field in self.CATEGORY_FIELDS + self.ROW_FIELDS:
+            lookup, values = self.lookup[field], self.values[field]
+            new_codes = np.empty(len(documents), dtype=np.int32)
+            for i, doc in enumerate(documents):
+                value = doc.get(field)
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(values)
+                    values.append(value)
+                new_codes[i] = code
+            self.codes[field] = np.concatenate([self.codes[field], new_codes])
+
+        for field in self.NUMERIC_FIELDS:
+            column = np.fromiter((_to_float(doc.get(field)) for doc in documents), dtype=np.float64,
+                                 count=len(documents))
+            self.numbers[field] = np.concatenate([self.numbers[field], column])
+
+    def supports(self, query):
+        """Check whether every field and operator of a filter can be evaluated here"""
+        for field, condition in query.items():
+            if field in ("$and", "$or"):
+                if not all(self.supports(clause) for clause in condition):
+                    return False
+            elif field in self.CATEGORY_FIELDS:
+                if isinstance(condition, dict) and not set(condition) <= {"$eq", "$ne", "$in", "$nin", "$regex",
+                                                                           "$options"}:
+                    return False
+                if isinstance(condition, dict) and not isinstance(condition.get("$regex", ""), str):
+                    return False
+                if isinstance(condition, (list, tuple)) or hasattr(condition, "pattern"):
+                    return False
+            elif field in self.NUMERIC_FIELDS:
+                if isinstance(condition, dict):
+                    if not set(condition) <= {"$eq", "$ne", "$in", "$gt", "$gte", "$lt", "$lte", "$type"}:
+                        return False
+                    if condition.get("$type", "number") != "number":
+                        return False
+                elif not isinstance(condition, (int, float)):
+                    return False
+            else:
+                return False
+        return True
+
+    def mask(self, query):
+        """
+        Evaluate a MongoDB filter as a boolean row mask (call supports() first).
+        apply() can add or compact rows, so hold lock from the mask through the
+        calls using it when the snapshot is patched concurrently.
+        :return: Boolean array over all rows, False for replaced and deleted rows
+        """
+        with self.lock:
+            return self.live & self._match(query)
+
+    def _match(self, query):
+        result = np.ones(self.size, dtype=bool)
+        for field, condition in query.items():
+            if field == "$and":
+                for clause in condition:
+                    result &= self._match(clause)
+            elif field == "$or":
+                any_clause = np.zeros(self.size, dtype=bool)
+                for clause in condition:
+                    any_clause |= self._match(clause)
+                result &= any_clause
+            elif field in self.CATEGORY_FIELDS:
+                result &= self._category_mask(field, condition)
+            else:
+                result &= self._numeric_mask(field, condition)
+        return result
+
+    def _category_mask(self, field, condition):
+        codes, lookup = self.codes[field], self.lookup[field]
+
+        def code_set(values):
+            return [lookup[value] for value in values if value in lookup]
+
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        result = np.ones(len(codes), dtype=bool)
+        for op, operand in condition.items():
+            if op == "$eq":
+                result &= codes == lookup.get(operand, -1)
+            elif op == "$ne":
+                result &= codes != lookup.get(operand, -1)
+            elif op == "$in":
+                result &= np.isin(codes, code_set(operand))
+            elif op == "$nin":
+                result &= ~np.isin(codes, code_set(operand))
+            elif op == "$regex":
+                # Matched once per dictionary value instead of once per row
+                flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+                pattern = re.compile(operand, flags)
+                matching = [code for code, value in enumerate(self.values[field])
+                            if isinstance(value, str) and pattern.search(value)]
+                result &= np.isin(codes, matching)
+        return result
+
+    def _numeric_mask(self, field, condition):
+        column = self.numbers[field]
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        result = np.ones(len(column), dtype=bool)
+        # NaN (missing) compares False, matching MongoDB's null handling for ranges
+        for op, operand in condition.items():
+            if op == "$eq":
+                result &= column == operand
+            elif op == "$ne":
+                result &= column != operand
+            elif op == "$in":
+                result &= np.isin(column, [float(value) for value in operand])
+            elif op == "$gt":
+                result &= column > operand
+            elif op == "$gte":
+                result &= column >= operand
+            elif op == "$lt":
+                result &= column < operand
+            elif op == "$lte":
+                result &= column <= operand
+            elif op == "$type":
+                result &= ~np.isnan(column)
+        return result
+
+    def rows_for(self, mask, skip=0, limit=None, sort=None):
+        """
+        Get copies of the documents selected by a mask (partial rows unless complete)
+        :param sort: List of (field, direction) pairs, None for row order
+        """
+        with self.lock:
+            indexes = np.flatnonzero(mask)
+            if sort:
+                indexes = indexes[self._order(indexes, sort)]
+            indexes = indexes[skip:]
+            if limit:
+                indexes = indexes[:limit]
+            return [self._row(i) for i in indexes]
+
+    def sortable(self, field):
+        """Check whether rows can be ordered by a field"""
+        return field in self.CATEGORY_FIELDS + self.ROW_FIELDS + self.NUMERIC_FIELDS
+
+    def _order(self, indexes, sort):
+        """Positions ordering the given rows by the sort keys, nulls first like MongoDB"""
+        keys = []
+        for field, direction in reversed(sort):
+            if field in self.NUMERIC_FIELDS:
+                column = np.asarray(self.numbers[field])[indexes]
+                key = np.where(np.isnan(column), -np.inf, column)
+            else:
+                # Rank of each dictionary value, so codes compare in value order
+                values = self.values[field]
+                ranks = np.empty(len(values), dtype=np.int64)
+                ranks[sorted(range(len(values)), key=lambda code: (values[code] is not None, str(values[code])))] = \
+                    np.arange(len(values))
+                key = ranks[np.asarray(self.codes[field])[indexes]]
+            keys.append(key if direction >= 0 else -key)
+        return np.lexsort(keys)
+
+    def _row(self, i):
+        """Copy of row i, rebuilt from the columns when no documents are held"""
+        if self.documents is not None:
+            return dict(self.documents[i])
+        doc = {field: self.values[field][self.codes[field][i]] for field in self.ROW_FIELDS}
+        for field in self.CATEGORY_FIELDS:
+            doc[field] = self.values[field][self.codes[field][i]]
+        for field in self.NUMERIC_FIELDS:
+            value = self.numbers[field][i]
+            doc[field] = None if np.isnan(value) else float(value)
+        # Derived from the coordinates, as the importer and MongoCRUD do
+        location = build_location(doc["location_lat"], doc["location_long"])
+        if location:
+            doc["location"] = location
+        return doc
+
+    def value_counts(self, field, mask):
+        """Count rows per value of a categorical field, most frequent first"""
+        with self.lock:
+            counts = np.bincount(self.codes[field][mask], minlength=len(self.values[field]))
+            values = self.values[field]
+        order = np.argsort(-counts, kind="stable")
+        return [(values[code], int(counts[code])) for code in order if counts[code]]
+
+    def group_average(self, group_field, numeric_field, mask):
+        """Per value of group_field: row count and the mean of a numeric field (None if unknown)"""
+        with self.lock:
+            codes = self.codes[group_field][mask]
+            column = self.numbers[numeric_field][mask]
+            size = len(self.values[group_field])
+            values = self.values[group_field]
+        known = ~np.isnan(column)
+        counts = np.bincount(codes, minlength=size)
+        sums = np.bincount(codes[known], weights=column[known], minlength=size)
+        known_counts = np.bincount(codes[known], minlength=size)
+        return {values[code]: (int(counts[code]), float(sums[code] / known_counts[code]) if known_counts[code] else None)
+                for code in np.flatnonzero(counts)}
+
+    def group_top_values(self, group_field, value_field, mask, top_k):
+        """
+        Per value of group_field: row count, distinct values of value_field and
+        its top_k values with their counts
+        """
+        with self.lock:
+            groups = self.codes[group_field][mask].astype(np.int64)
+            members = self.codes[value_field][mask].astype(np.int64)
+            group_values = self.values[group_field]
+            member_values = self.values[value_field]
+        return self._top_values(groups, group_values, members, member_values, top_k)
+
+    @staticmethod
+    def _top_values(groups, group_values, members, member_values, top_k):
+        """Summarize member codes per group code: count, distinct members and the top_k members"""
+        # Count (group, value) pairs in one pass over combined codes
+        pairs, counts = np.unique(groups * len(member_values) + members, return_counts=True)
+        pair_groups, pair_members = np.divmod(pairs, len(member_values))
+
+        summary = {}
+        for code in np.unique(pair_groups):
+            in_group = pair_groups == code
+            group_counts = counts[in_group]
+            top = np.argsort(-group_counts, kind="stable")[:top_k]
+            summary[group_values[code]] = {
+                "count": int(group_counts.sum()),
+                "distinct": int(in_group.sum()),
+                "top": [{"value": member_values[pair_members[in_group][i]], "count": int(group_counts[i])}
+                        for i in top]
+            }
+        return summary
+
+    def outcome_type_summary(self, mask):
+        """Rows of aggregate_by_outcome_type: [{_id, count, avg_age_weeks}], largest first"""
+        groups = self.group_average("outcome_type", "age_upon_outcome_in_weeks", mask)
+        results = [{"_id": value, "count": count, "avg_age_weeks": avg_age}
+                   for value, (count, avg_age) in groups.items()]
+        return sorted(results, key=lambda item: -item["count"])
+
+    def animal_type_summary(self, mask, top_k):
+        """Rows of aggregate_by_animal_type: [{_id, count, distinct_breeds, top_breeds}], largest first"""
+        groups = self.group_top_values("animal_type", "breed", mask, top_k)
+        results = [{"_id": value, "count": group["count"], "distinct_breeds": group["distinct"],
+                    "top_breeds": group["top"]} for value, group in groups.items()]
+        return sorted(results, key=lambda item: -item["count"])
+
+    def breed_summary(self, mask, top_k, limit=20):
+        """Rows of aggregate_by_breed: the largest breeds with their average age and top outcome types"""
+        groups = self.group_top_values("breed", "outcome_type", mask, top_k)
+        ages = self.group_average("breed", "age_upon_outcome_in_weeks", mask)
+        results = [{"_id": value, "count": group["count"], "avg_age_weeks": ages[value][1],
+                    "distinct_outcome_types": group["distinct"], "top_outcome_types": group["top"]}
+                   for value, group in groups.items()]
+        return sorted(results, key=lambda item: -item["count"])[:limit]
+
+    def monthly_summary(self, mask, top_k):
+        """Rows of get_monthly_statistics: [{_id: {year, month}, count, distinct_outcome_types, top_outcome_types}]"""
+        with self.lock:
+            labels = [_month_label(value) for value in self.values["datetime"]]
+            months = sorted({label for label in labels if label})
+            month_codes = {label: code for code, label in enumerate(months)}
+            # Month code of each datetime dictionary entry, -1 when it has no date
+            month_of = np.array([month_codes.get(label, -1) for label in labels], dtype=np.int64)
+            groups = month_of[self.codes["datetime"][mask]]
+            members = self.codes["outcome_type"][mask].astype(np.int64)
+            member_values = self.values["outcome_type"]
+        known = groups >= 0
+        summary = self._top_values(groups[known], months, members[known], member_values, top_k)
+        return [{"_id": {"year": int(label[:4]), "month": int(label[5:7])}, "count": group["count"],
+                 "distinct_outcome_types": group["distinct"], "top_outcome_types": group["top"]}
+                for label, group in sorted(summary.items())]
+
+    def save(self, path, keep=2):
+        """
+        Write the live rows as a versioned snapshot directory under path:
+        one .npy file per column plus a JSON dictionary of the category values.
+        The CURRENT pointer is swapped atomically, so readers never see a
+        half-written snapshot.
+        :param path: Snapshot root directory
+        :param keep: Number of snapshot versions to keep on disk
+        :return: Directory the snapshot was written to
+        """
+        with self.lock:
+            live = np.flatnonzero(self.live)
+            name = f"v{self.version}-{int(time.time() * 1000)}"
+            target = os.path.join(path, name)
+            staging = target + ".tmp"
+            os.makedirs(staging, exist_ok=True)
+
+            dictionary = {}
+            for field in self.CATEGORY_FIELDS + self.ROW_FIELDS:
+                # Re-encode against the live rows only, so dead values are not carried over
+                used, codes = np.unique(self.codes[field][live], return_inverse=True)
+                dictionary[field] = [self.values[field][code] for code in used]
+                np.save(os.path.join(staging, f"{field}.npy"), codes.astype(np.int32))
+            for field in self.NUMERIC_FIELDS:
+                np.save(os.path.join(staging, f"{field}.npy"), self.numbers[field][live])
+
+            with open(os.path.join(staging, "dictionary.json"), "w") as f:
+                json.dump(dictionary, f, default=_json_value)
+            with open(os.path.join(staging, "manifest.json"), "w") as f:
+                json.dump({"format": SNAPSHOT_FORMAT, "version": self.version, "rows": int(len(live)),
+                           "created": time.time()}, f)
+
+        os.replace(staging, target)
+        pointer = os.path.join(path, CURRENT_FILE)
+        with open(pointer + ".tmp", "w") as f:
+            f.write(name)
+        os.replace(pointer + ".tmp", pointer)
+        logger.info(f"Columnar snapshot of {len(live)} rows written to {target}")
+
+        versions = sorted((entry for entry in os.listdir(path) if entry.startswith("v") and entry != name),
+                          key=lambda entry: os.path.getmtime(os.path.join(path, entry)))
+        for old in versions[:max(len(versions) - (keep - 1), 0)]:
+            shutil.rmtree(os.path.join(path, old), ignore_errors=True)
+        return target
+
+    @staticmethod
+    def current(path):
+        """Get the directory name CURRENT points at, None if no snapshot was written"""
+        try:
+            with open(os.path.join(path, CURRENT_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open the current snapshot under path with memory-mapped, read-only
+        columns. Every process opening the same files shares one page-cache copy.
+        :return: ColumnarSnapshot, or None if no snapshot was written
+        :raises ValueError: If the snapshot has an unsupported format
+        """
+        name = cls.current(path)
+        if name is None:
+            return None
+        directory = os.path.join(path, name)
+        with open(os.path.join(directory, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format {manifest.get('format')} in {directory}")
+        with open(os.path.join(directory, "dictionary.json")) as f:
+            dictionary = json.load(f)
+
+        snapshot = cls()
+        snapshot.version = manifest["version"]
+        snapshot.size = manifest["rows"]
+        snapshot.documents = None
+        snapshot.complete = False
+        snapshot.live = np.ones(snapshot.size, dtype=bool)
+        for field in cls.CATEGORY_FIELDS + cls.ROW_FIELDS:
+            snapshot.codes[field] = np.load(os.path.join(directory, f"{field}.npy"), mmap_mode="r")
+            snapshot.values[field] = dictionary[field]
+            snapshot.lookup[field] = {value: code for code, value in enumerate(dictionary[field])}
+        for field in cls.NUMERIC_FIELDS:
+            snapshot.numbers[field] = np.load(os.path.join(directory, f"{field}.npy"), mmap_mode="r")
+        snapshot.rows = {doc_id: row for row, doc_id in enumerate(snapshot.values["_id"][code]
+                                                                     for code in snapshot.codes["_id"])}
+        logger.info(f"Columnar snapshot {name} mapped with {snapshot.size} rows at version {snapshot.version}")
+        return snapshot
@@ -0,0 +1,280 @@
+"""
+Compact storage schema for the outcomes collection.
+With COMPACT_SCHEMA=true documents are stored with short field keys and the
+categorical fields as small integer codes, each backed by a lookup
+collection of {_id: code, value} documents. MongoCRUD, MongoDataManager and
+the importer translate documents, filters and pipelines through
+CompactSchema, so everything above them keeps using the public field names
+and values.
+"""
+
+import os
+import re
+import time
+import threading
+import logging
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Public field name -> stored key
+FIELD_KEYS = {
+    "age_upon_outcome": "a",
+    "age_upon_outcome_in_weeks": "w",
+    "animal_id": "id",
+    "animal_type": "t",
+    "breed": "b",
+    "color": "c",
+    "date_of_birth": "dob",
+    "datetime": "dt",
+    "monthyear": "my",
+    "name": "n",
+    "outcome_subtype": "os",
+    "outcome_type": "o",
+    "sex_upon_outcome": "s",
+    "location_lat": "lat",
+    "location_long": "lon",
+    "location": "loc",
+    "row_hash": "h",
+}
+PUBLIC_FIELDS = {key: field for field, key in FIELD_KEYS.items()}
+
+# Fields stored as codes, with one lookup collection each
+CODED_FIELDS = ("animal_type", "breed", "color", "outcome_type", "sex_upon_outcome")
+LOOKUP_PREFIX = "codes_"
+
+# Stored in place of values that have no code, so the clause matches nothing
+NO_CODE = -1
+
+# Coded fields $text searches match besides name (the old text index fields)
+TEXT_CODED_FIELDS = ("breed", "outcome_type")
+
+# Seconds before the lookup tables are reloaded for codes assigned by other processes,
+# and the shortest interval between reloads caused by unknown values or codes
+REFRESH_SECONDS = 60
+MISS_REFRESH_SECONDS = 1
+
+# Stages whose output fields are named by the pipeline, not stored keys: later stages are left as they are
+RESHAPING_STAGES = ("$group", "$bucket", "$bucketAuto", "$project", "$replaceRoot", "$replaceWith",
+                    "$count", "$sortByCount", "$facet")
+
+REGEX_FLAGS = {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL, "x": re.VERBOSE}
+
+
+def compact_schema_enabled():
+    """Check the COMPACT_SCHEMA setting shared by the app and the importer"""
+    return os.getenv('COMPACT_SCHEMA', 'false').lower() == 'true'
+
+
+def schema_for(db):
+    """Get a CompactSchema over db's lookup collections, None when the compact schema is off"""
+    return CompactSchema(db) if compact_schema_enabled() else None
+
+
+def short_key(path):
+    """Stored key of a (possibly dotted) public field path, e.g. location.coordinates -> loc.coordinates"""
+    field, dot, rest = path.partition(".")
+    return FIELD_KEYS.get(field, field) + dot + rest
+
+
+def public_key(key):
+    """Public field name of a stored key"""
+    return PUBLIC_FIELDS.get(key, key)
+
+
+class CompactSchema:
+    """Translates between public documents and queries and the compact stored form"""
+
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.RLock()
+        self.codes = {field: {} for field in CODED_FIELDS}
+        self.values = {field: {} for field in CODED_FIELDS}
+        self.loaded = 0
+        for field in CODED_FIELDS:
+            self.db[LOOKUP_PREFIX + field].create_index("value", unique=True)
+        self.refresh(0)
+
+    def refresh(self, max_age=REFRESH_SECONDS):
+        """Reload the lookup collections if they were loaded more than max_age seconds ago"""
+        with self.lock:
+            if self.loaded and time.monotonic() - self.loaded < max_age:
+                return
+            for field in CODED_FIELDS:
+                documents = list(self.db[LOOKUP_PREFIX + field].find())
+                self.codes[field] = {doc["value"]: doc["_id"] for doc in documents}
+                self.values[field] = {doc["_id"]: doc["value"] for doc in documents}
+            self.loaded = time.monotonic()
+
+    def _assign(self, field, value):
+        """Give a new value the next free code of its field"""
+        with self.lock:
+            while True:
+                code = self.codes[field].get(value)
+                if code is not None:
+                    return code
+                code = max(self.values[field], default=NO_CODE) + 1
+                try:
+                    self.db[LOOKUP_PREFIX + field].insert_one({"_id": code, "value": value})
+                except DuplicateKeyError:
+                    # Another process took the code or added the value first
+                    self.refresh(0)
+                    continue
+                self.codes[field][value] = code
+                self.values[field][code] = value
+                logger.info(f"Assigned code {code} to {field} {value!r}")
+                return code
+
+    def encode_value(self, field, value, create=False):
+        """
+        Code of a value of a field (other fields and None pass through)
+        :param create: Assign a code to unknown values instead of returning NO_CODE
+        """
+        if field not in CODED_FIELDS or value is None:
+            return value
+        code = self.codes[field].get(value)
+        if code is None:
+            self.refresh(MISS_REFRESH_SECONDS)
+            code = self.codes[field].get(value)
+        if code is None:
+            return self._assign(field, value) if create else NO_CODE
+        return code
+
+    def decode_value(self, field, value):
+        """Value of a code of a field (other fields and None pass through)"""
+        if field not in CODED_FIELDS or value is None:
+            return value
+        if value not in self.values[field]:
+            self.refresh(MISS_REFRESH_SECONDS)
+        return self.values[field].get(value, value)
+
+    def encode_document(self, document, create=True):
+        """Stored form of a document or $set specification with public field names"""
+        return {short_key(field): self.encode_value(field, value, create) for field, value in document.items()}
+
+    def decode_document(self, document):
+        """Public form of a stored document"""
+        decoded = {}
+        for key, value in document.items():
+            field = public_key(key)
+            decoded[field] = self.decode_value(field, value)
+        return decoded
+
+    def matching_codes(self, field, pattern, options=""):
+        """Codes of the values of a field a regular expression matches, each value tested once"""
+        if not isinstance(pattern, re.Pattern):
+            flags = 0
+            for option in options:
+                flags |= REGEX_FLAGS.get(option, 0)
+            pattern = re.compile(pattern, flags)
+        self.refresh()
+        return [code for value, code in self.codes[field].items() if pattern.search(value)]
+
+    def text_query(self, search):
+        """
+        Filter standing in for a $text search: the words match name through a
+        case-insensitive regex and breed/outcome type through their lookup values
+        (no stemming, stop words or relevance scores)
+        """
+        words = re.findall(r"\w+", search)
+        if not words:
+            return {short_key("name"): {"$in": []}}
+        pattern = r"\b(" + "|".join(re.escape(word) for word in words) + r")\b"
+        clauses = [{short_key("name"): {"$regex": pattern, "$options": "i"}}]
+        for field in TEXT_CODED_FIELDS:
+            codes = self.matching_codes(field, pattern, "i")
+            if codes:
+                clauses.append({short_key(field): {"$in": codes}})
+        return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+    def _encode_condition(self, field, condition):
+        """Stored form of the condition on one field"""
+        if field not in CODED_FIELDS:
+            return condition
+        if isinstance(condition, re.Pattern):
+            return {"$in": self.matching_codes(field, condition)}
+        if not (isinstance(condition, dict) and any(op.startswith("$") for op in condition)):
+            return self.encode_value(field, condition)
+
+        encoded = {}
+        for op, value in condition.items():
+            if op in ("$in", "$nin"):
+                encoded[op] = [self.encode_value(field, item) for item in value]
+            elif op in ("$eq", "$ne"):
+                encoded[op] = self.encode_value(field, value)
+            elif op == "$not":
+                encoded[op] = self._encode_condition(field, value if isinstance(value, dict) else {"$regex": value})
+            elif op not in ("$regex", "$options"):
+                encoded[op] = value
+
+        if "$regex" in condition:
+            # Matched against the lookup values; an $in next to it narrows the matches
+            codes = self.matching_codes(field, condition["$regex"], condition.get("$options", ""))
+            if "$in" in encoded:
+                codes = [code for code in codes if code in encoded["$in"]]
+            encoded["$in"] = codes
+        return encoded
+
+    def encode_query(self, query):
+        """Stored form of a MongoDB filter written against the public fields"""
+        encoded = {}
+        text_clauses = []
+        for key, condition in (query or {}).items():
+            if key in ("$and", "$or", "$nor"):
+                encoded[key] = [self.encode_query(clause) for clause in condition]
+            elif key == "$text":
+                text_clauses.append(self.text_query(condition["$search"]))
+            elif key == "$expr":
+                encoded[key] = self.encode_expression(condition)
+            elif key.startswith("$"):
+                encoded[key] = condition
+            else:
+                encoded[short_key(key)] = self._encode_condition(key, condition)
+        if text_clauses:
+            return {"$and": [encoded, *text_clauses]} if encoded else text_clauses[0]
+        return encoded
+
+    def encode_expression(self, expression):
+        """Rename the field paths ("$breed" -> "$b") of an aggregation expression"""
+        if isinstance(expression, str):
+            if expression.startswith("$") and not expression.startswith("$$"):
+                return "$" + short_key(expression[1:])
+            return expression
+        if isinstance(expression, dict):
+            return {key: self.encode_expression(value) for key, value in expression.items()}
+        if isinstance(expression, list):
+            return [self.encode_expression(item) for item in expression]
+        return expression
+
+    def encode_sort(self, sort):
+        """Stored form of a list of (field, direction) pairs"""
+        return [(short_key(field), direction) for field, direction in sort]
+
+    def encode_pipeline(self, pipeline):
+        """
+        Stored form of an aggregation pipeline over the collection. Stages are
+        translated up to the first one that reshapes documents (a $facet's
+        sub-pipelines are translated on their own); grouped values of coded
+        fields come out as codes, which the caller decodes.
+        """
+        encoded = []
+        for position, stage in enumerate(pipeline):
+            name, spec = next(iter(stage.items()))
+            if name == "$match":
+                spec = self.encode_query(spec)
+            elif name == "$sort":
+                spec = {short_key(field): direction for field, direction in spec.items()}
+            elif name == "$facet":
+                spec = {output: self.encode_pipeline(stages) for output, stages in spec.items()}
+            elif name == "$geoNear":
+                spec = dict(spec)
+                if "key" in spec:
+                    spec["key"] = short_key(spec["key"])
+                if "query" in spec:
+                    spec["query"] = self.encode_query(spec["query"])
+            elif name not in ("$limit", "$skip"):
+                spec = self.encode_expression(spec)
+            encoded.append({name: spec})
+            if name in RESHAPING_STAGES:
+                return encoded + list(pipeline[position + 1:])
+        return encoded
@@ -1,14 +1,104 @@
 import os
 import logging
-from pymongo import MongoClient
+from datetime import datetime, timezone
+from pymongo import MongoClient, ReturnDocument
 from dotenv import load_dotenv
 from bson.objectid import ObjectId
+from compact_schema import schema_for, short_key
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# Collection holding a write version per data collection, bumped on every change
+VERSION_COLLECTION = "collection_versions"
+
+# Oplog-style change log: one entry per write, keyed by the version it produced
+CHANGE_LOG_COLLECTION = "change_log"
+CHANGE_LOG_RETENTION_SECONDS = 7 * 24 * 3600
+
+# Fields stored as BSON dates (the importer parses them from the CSV strings)
+DATE_FIELDS = ("date_of_birth", "datetime", "monthyear")
+
+def bump_collection_version(db, collection_name):
+    """
+    Increment the write version of a collection (used for HTTP ETags and delta sync)
+    :return: The new version
+    """
+    doc = db[VERSION_COLLECTION].find_one_and_update(
+        {"_id": collection_name},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc["version"]
+
+def log_change(db, collection_name, op, doc_id=None):
+    """
+    Bump the collection version and record the change under it
+    :param op: "insert", "update", "delete", or "reset" for bulk reloads
+    :param doc_id: Changed document id (None for resets)
+    :return: The new version
+    """
+    version = bump_collection_version(db, collection_name)
+    db[CHANGE_LOG_COLLECTION].insert_one({
+        "collection": collection_name,
+        "seq": version,
+        "op": op,
+        "doc_id": doc_id,
+        "ts": datetime.now(timezone.utc)
+    })
+    return version
+
+def ensure_change_log_indexes(db):
+    """Index the change log by sequence and expire old entries"""
+    db[CHANGE_LOG_COLLECTION].create_index([("collection", 1), ("seq", 1)])
+    db[CHANGE_LOG_COLLECTION].create_index("ts", expireAfterSeconds=CHANGE_LOG_RETENTION_SECONDS)
+
+def get_collection_version(db, collection_name):
+    """Get the current write version of a collection, 0 if it was never written"""
+    doc = db[VERSION_COLLECTION].find_one({"_id": collection_name})
+    return doc["version"] if doc else 0
+
+def build_location(lat, lon):
+    """
+    Build a GeoJSON point for a coordinate pair
+    :return: GeoJSON Point dictionary, or None if the coordinates are missing or out of range
+    """
+    if lat is None or lon is None:
+        return None
+    try:
+        lat = float(lat)
+        lon = float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    # GeoJSON coordinates are ordered longitude, latitude
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+def parse_dates(data):
+    """Convert ISO formatted date strings of DATE_FIELDS to datetimes, leaving other values as they are"""
+    for field in DATE_FIELDS:
+        value = data.get(field)
+        if isinstance(value, str):
+            try:
+                data[field] = datetime.fromisoformat(value)
+            except ValueError:
+                pass
+    return data
+
 class MongoCRUD:
+    # Text fields first, then the rescue filter fields as index suffix keys
+    TEXT_INDEX_KEYS = [
+        ("name", "text"),
+        ("breed", "text"),
+        ("outcome_type", "text"),
+        ("sex_upon_outcome", 1),
+        ("age_upon_outcome_in_weeks", 1)
+    ]
+    TEXT_INDEX_NAME = "search_text_rescue"
+
     def __init__(self, uri=None, db_name=None, collection_name=None):
         # Pull from .env
         username = os.getenv('MONGO_USERNAME')
@@ -32,26 +122,125 @@ class MongoCRUD:
         self.db_name = db_name or default_db
         self.collection_name = collection_name or default_collection
 
+        # Callbacks run after each successful write with (op, doc_id, version)
+        self.change_listeners = []
+
         try:
             self.client = MongoClient(self.uri)
             self.db = self.client[self.db_name]
             self.collection = self.db[self.collection_name]
 
+            # Short keys and coded categories when COMPACT_SCHEMA is on (None otherwise)
+            self.schema = schema_for(self.db)
+
             # Create compound text index for efficient search
-            self.collection.create_index([
-                ("name", "text"),
-                ("breed", "text"),
-                ("outcome_type", "text")
-            ])
+            self.ensure_text_index()
             logger.info("Compound text index created (or already exists).")
 
+            # Keep the GeoJSON location field and its 2dsphere index in place
+            self.ensure_geo_index()
+
+            ensure_change_log_indexes(self.db)
+
         except Exception as e:
             logger.error(f"Error initializing MongoDB: {e}")
             raise
 
+    def ensure_text_index(self):
+        """
+        Create the compound text index used by search.
+        The trailing rescue filter fields let combined filter + text queries
+        be narrowed inside the text index instead of after fetching every match.
+        A collection may only have one text index, so an outdated one is replaced.
+        Compact documents have no text index: coded breeds and outcome types
+        cannot be tokenized, so searches go through the lookup collections.
+        """
+        for name, info in self.collection.index_information().items():
+            is_text = "weights" in info or any(direction == "text" for _, direction in info["key"])
+            if is_text and (name != self.TEXT_INDEX_NAME or self.schema is not None):
+                logger.info(f"Dropping outdated text index {name}")
+                self.collection.drop_index(name)
+
+        if self.schema is None:
+            self.collection.create_index(self.TEXT_INDEX_KEYS, name=self.TEXT_INDEX_NAME)
+
+    def ensure_geo_index(self):
+        """
+        Create the 2dsphere index and backfill location for documents that lack it.
+        The backfill scans the collection, so it only runs when the index is new:
+        once it exists, the importer and the writes here keep location in sync.
+        """
+        location, lat, lon = (self._key(field) for field in ("location", "location_lat", "location_long"))
+        if any((location, "2dsphere") in info["key"] for info in self.collection.index_information().values()):
+            return
+        self.collection.create_index([(location, "2dsphere")])
+        result = self.collection.update_many(
+            {
+                location: {"$exists": False},
+                lat: {"$gte": -90, "$lte": 90},
+                lon: {"$gte": -180, "$lte": 180}
+            },
+            [{"$set": {location: {"type": "Point", "coordinates": [f"${lon}", f"${lat}"]}}}]
+        )
+        if result.modified_count:
+            logger.info(f"Backfilled location for {result.modified_count} documents")
+
+    def _sync_location(self, data, doc_id=None):
+        """
+        Set or clear the GeoJSON location when coordinates are written
+        :param data: Fields being inserted or updated (modified in place)
+        :param doc_id: Document being updated, used to look up the coordinate not being changed
+        :return: Field names to $unset (location when the coordinates became invalid)
+        """
+        if 'location_lat' not in data and 'location_long' not in data:
+            return []
+
+        lat = data.get('location_lat')
+        lon = data.get('location_long')
+        if doc_id and ('location_lat' not in data or 'location_long' not in data):
+            current = self._decode(self.collection.find_one(
+                {"_id": ObjectId(doc_id)}, {self._key("location_lat"): 1, self._key("location_long"): 1}) or {})
+            lat = data.get('location_lat', current.get('location_lat'))
+            lon = data.get('location_long', current.get('location_long'))
+
+        location = build_location(lat, lon)
+        if location:
+            data['location'] = location
+            return []
+        data.pop('location', None)
+        return ['location']
+
+    def _key(self, field):
+        """Stored key of a public field name"""
+        return field if self.schema is None else short_key(field)
+
+    def _encode(self, data):
+        """Stored form of the fields being written, coding new category values"""
+        return data if self.schema is None else self.schema.encode_document(data)
+
+    def _decode(self, doc):
+        """Public form of a stored document"""
+        return doc if self.schema is None else self.schema.decode_document(doc)
+
+    def record_change(self, op, doc_id):
+        """Bump the collection version and append the write to the change log"""
+        try:
+            version = log_change(self.db, self.collection_name, op, doc_id)
+        except Exception as e:
+            logger.error(f"Change Log Error: {e}")
+            version = None
+
+        for listener in self.change_listeners:
+            try:
+                listener(op, doc_id, version)
+            except Exception as e:
+                logger.error(f"Change Listener Error: {e}")
+
     def create(self, data):
         try:
-            result = self.collection.insert_one(data)
+            self._sync_location(data)
+            result = self.collection.insert_one(self._encode(parse_dates(data)))
+            self.record_change("insert", result.inserted_id)
             return str(result.inserted_id)
         except Exception as e:
             logger.error(f"Insert Error: {e}")
@@ -59,8 +248,10 @@ class MongoCRUD:
 
     def read_all(self, query=None):
         try:
+            if query and self.schema is not None:
+                query = self.schema.encode_query(query)
             documents = self.collection.find(query or {})
-            return [{**doc, "_id": str(doc["_id"])} for doc in documents]
+            return [{**self._decode(doc), "_id": str(doc["_id"])} for doc in documents]
         except Exception as e:
             logger.error(f"Read Error: {e}")
             return []
@@ -69,6 +260,7 @@ class MongoCRUD:
         try:
             doc = self.collection.find_one({"_id": ObjectId(doc_id)})
             if doc:
+                doc = self._decode(doc)
                 doc["_id"] = str(doc["_id"])
             return doc
         except Exception as e:
@@ -77,7 +269,13 @@ class MongoCRUD:
 
     def update(self, doc_id, updated_data):
         try:
-            result = self.collection.update_one({"_id": ObjectId(doc_id)}, {"$set": updated_data})
+            unset_fields = self._sync_location(updated_data, doc_id)
+            update = {"$set": self._encode(parse_dates(updated_data))}
+            if unset_fields:
+                update["$unset"] = {self._key(field): "" for field in unset_fields}
+            result = self.collection.update_one({"_id": ObjectId(doc_id)}, update)
+            if result.modified_count > 0:
+                self.record_change("update", ObjectId(doc_id))
             return result.modified_count > 0
         except Exception as e:
             logger.error(f"Update Error: {e}")
@@ -86,6 +284,8 @@ class MongoCRUD:
     def delete(self, doc_id):
         try:
             result = self.collection.delete_one({"_id": ObjectId(doc_id)})
+            if result.deleted_count > 0:
+                self.record_change("delete", ObjectId(doc_id))
             return result.deleted_count > 0
         except Exception as e:
             logger.error(f"Delete Error: {e}")
@@ -0,0 +1,609 @@
+#!/usr/bin/env python3
+"""
+Script to import CSV data into MongoDB
+Run this script once to migrate your data from CSV to MongoDB
+"""
+
+import os
+import sys
+import time
+import hashlib
+import pandas as pd
+import pymongo
+from pymongo import MongoClient, UpdateOne, ReplaceOne, DeleteOne
+from bson.objectid import ObjectId
+import numpy as np
+from datetime import datetime
+import logging
+from crud import build_location, log_change, DATE_FIELDS
+from sqlite_storage import SQLiteStorage
+from snapshot_storage import export_snapshot
+from compact_schema import CompactSchema, compact_schema_enabled, short_key
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Column types of the outcomes CSV, given to read_csv instead of letting it infer them
+TEXT_COLUMNS = ("age_upon_outcome", "animal_id", "animal_type", "breed", "color", "date_of_birth", "datetime",
+                "monthyear", "name", "outcome_subtype", "outcome_type", "sex_upon_outcome")
+NUMERIC_COLUMNS = ("location_lat", "location_long", "age_upon_outcome_in_weeks")
+CSV_DTYPES = {**{column: str for column in TEXT_COLUMNS}, **{column: "float64" for column in NUMERIC_COLUMNS}}
+
+# Weeks per unit of the age_upon_outcome text, e.g. "3 years" or "2 weeks"
+AGE_UNIT_WEEKS = {"day": 1 / 7, "week": 1, "month": 365.25 / 12 / 7, "year": 365.25 / 7}
+AGE_PATTERN = r"^\s*(\d+)\s*(day|week|month|year)s?\s*$"
+
+# Fields identifying one outcome across imports, unique-indexed for incremental imports
+ROW_KEY = ("animal_id", "datetime")
+ROW_KEY_INDEX_NAME = "animal_id_1_datetime_1"
+ROW_KEY_TYPES = ("string", "date")
+
+# Field storing the hash of the CSV row a document was imported from
+ROW_HASH_FIELD = "row_hash"
+
+# Collection a staged reload is built in before it is renamed over the live one
+STAGING_SUFFIX = "_staging"
+
+# Index options that are reported by list_indexes() but cannot be passed back to create_index()
+INDEX_INFO_ONLY = {"v", "key", "ns", "textIndexVersion", "2dsphereIndexVersion"}
+
+# Documents per insert_many, and per checkpoint
+BATCH_SIZE = 1000
+
+# Progress of interrupted bulk loads, one document per target collection
+CHECKPOINT_COLLECTION = "import_checkpoints"
+
+# Attempts per batch after a connection error, waiting RETRY_BASE_SECONDS * 2**attempt in between
+MAX_RETRIES = 5
+RETRY_BASE_SECONDS = 1
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Beyond this many changed documents a single reset entry replaces per-document change log entries
+MAX_LOGGED_CHANGES = 5000
+
+def read_outcomes_csv(csv_file_path, chunksize=None):
+    """
+    Read the outcomes CSV with explicit column types, skipping the unnamed row number column
+    (with chunksize, an iterator of DataFrames whose index continues across chunks)
+    """
+    return pd.read_csv(csv_file_path, dtype=CSV_DTYPES, usecols=lambda column: not column.startswith('Unnamed'),
+                       chunksize=chunksize)
+
+def parse_age_weeks(ages):
+    """Vectorized conversion of age texts ("3 years", "1 month") to weeks, NaN where unparseable"""
+    parts = ages.str.lower().str.extract(AGE_PATTERN)
+    return parts[0].astype("float64") * parts[1].map(AGE_UNIT_WEEKS).astype("float64")
+
+def normalize_data(df):
+    """
+    Give every field its query-friendly type with whole-column operations:
+    dates become datetimes (stored as BSON dates), coordinates are numeric
+    and in range, and missing ages in weeks are derived from the dates or
+    the age text
+    """
+    df = df.drop(columns=[col for col in df.columns if col.startswith('Unnamed')])
+    
+    for col in DATE_FIELDS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors='coerce', format='ISO8601')
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    
+    # Out of range coordinates would be rejected by the 2dsphere index
+    if {'location_lat', 'location_long'} <= set(df.columns):
+        valid = df['location_lat'].between(-90, 90) & df['location_long'].between(-180, 180)
+        df.loc[~valid, ['location_lat', 'location_long']] = np.nan
+    
+    if 'age_upon_outcome_in_weeks' in df.columns:
+        weeks = df['age_upon_outcome_in_weeks']
+        if {'datetime', 'date_of_birth'} <= set(df.columns):
+            weeks = weeks.fillna((df['datetime'] - df['date_of_birth']) / pd.Timedelta(weeks=1))
+        if 'age_upon_outcome' in df.columns:
+            weeks = weeks.fillna(parse_age_weeks(df['age_upon_outcome']))
+        df['age_upon_outcome_in_weeks'] = weeks
+    
+    return df
+
+def clean_data(df):
+    """Clean and prepare data for MongoDB insertion"""
+    # Datetime columns as Python datetimes, None for NaT. Built from the values: chunks
+    # after the first have an index that does not start at 0, and aligning on it would
+    # turn their dates into NaN
+    for col in df.select_dtypes(include='datetime').columns:
+        values = pd.Series(list(df[col].dt.to_pydatetime()), index=df.index, dtype=object)
+        df[col] = values.where(df[col].notna(), None)
+    
+    # Replace NaN values with None (MongoDB null)
+    df = df.replace({np.nan: None})
+    
+    # Convert numpy types to Python native types
+    for col in df.columns:
+        if df[col].dtype == 'int64':
+            df[col] = df[col].astype('Int64')  # Nullable integer
+        elif df[col].dtype == 'float64':
+            df[col] = df[col].astype('Float64')  # Nullable float
+    
+    return df
+
+def add_locations(records):
+    """Add a GeoJSON location field to each record that has valid coordinates"""
+    for record in records:
+        location = build_location(record.get('location_lat'), record.get('location_long'))
+        if location:
+            record['location'] = location
+    return records
+
+def prepare_records(df):
+    """Normalize and clean a DataFrame into documents ready to insert"""
+    return add_locations(clean_data(normalize_data(df)).to_dict('records'))
+
+def file_hash(path):
+    """SHA-256 of a file, identifying the source a checkpoint belongs to"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def row_id(started, row):
+    """
+    Fixed ObjectId of a CSV row within one load: the load's start time
+    followed by the row number, so a retried or resumed batch inserts the
+    same _ids and rows already written are recognized as duplicates
+    """
+    return ObjectId(started.to_bytes(4, 'big') + row.to_bytes(8, 'big'))
+
+def with_retries(operation, description):
+    """Run a MongoDB operation, retrying connection errors with exponential backoff"""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return operation()
+        except pymongo.errors.PyMongoError as e:
+            retryable = isinstance(e, pymongo.errors.ConnectionFailure) or e.has_error_label("RetryableWriteError")
+            if not retryable or attempt == MAX_RETRIES:
+                raise
+            delay = RETRY_BASE_SECONDS * 2 ** attempt
+            logger.warning(f"{description} failed ({e}), retrying in {delay}s")
+            time.sleep(delay)
+
+def insert_batch(collection, records):
+    """Insert a batch, ignoring rows an earlier attempt already inserted"""
+    try:
+        collection.insert_many(records, ordered=False)
+    except pymongo.errors.BulkWriteError as e:
+        if e.details.get("writeConcernErrors") or \
+                any(error["code"] != DUPLICATE_KEY_ERROR for error in e.details["writeErrors"]):
+            raise
+
+def read_checkpoint(db, collection_name, source_hash, mode):
+    """Get the checkpoint of an interrupted load of the same file in the same mode, None to start over"""
+    checkpoint = db[CHECKPOINT_COLLECTION].find_one({"_id": collection_name})
+    if checkpoint and checkpoint["file_hash"] == source_hash and checkpoint["mode"] == mode:
+        return checkpoint
+    return None
+
+def save_checkpoint(db, collection_name, checkpoint):
+    db[CHECKPOINT_COLLECTION].replace_one({"_id": collection_name}, checkpoint, upsert=True)
+
+def clear_checkpoint(db, collection_name):
+    db[CHECKPOINT_COLLECTION].delete_one({"_id": collection_name})
+
+def load_batches(db, target, csv_file_path, collection_name, mode, drop=False, batch_size=BATCH_SIZE, schema=None):
+    """
+    Stream the CSV into a collection batch by batch, recording a checkpoint
+    after each committed batch. A rerun on the same file resumes after the
+    last checkpoint instead of starting over.
+    
+    Args:
+        db: MongoDB database holding the checkpoints
+        target: Collection to insert into
+        csv_file_path (str): Path to the CSV file
+        collection_name (str): Live collection name, the checkpoint key
+        mode (str): Import mode, a checkpoint only resumes the same mode
+        drop (bool): Drop the target on a fresh start instead of emptying it
+        batch_size (int): Rows per batch
+        schema (CompactSchema): Write compact documents (optional)
+    
+    Returns:
+        int: Number of rows in the CSV
+    """
+    source_hash = file_hash(csv_file_path)
+    checkpoint = with_retries(lambda: read_checkpoint(db, collection_name, source_hash, mode), "Reading checkpoint")
+    if checkpoint:
+        logger.info(f"Resuming after batch {checkpoint['batch']} ({checkpoint['rows']} records already imported)")
+    else:
+        logger.info("Clearing existing data...")
+        with_retries(target.drop if drop else lambda: target.delete_many({}), "Clearing existing data")
+        checkpoint = {"_id": collection_name, "file_hash": source_hash, "mode": mode, "batch": 0, "rows": 0,
+                      "started": int(time.time())}
+        with_retries(lambda: save_checkpoint(db, collection_name, checkpoint), "Saving checkpoint")
+    
+    total_rows = 0
+    for number, chunk in enumerate(read_outcomes_csv(csv_file_path, chunksize=batch_size), start=1):
+        total_rows += len(chunk)
+        if number <= checkpoint["batch"]:
+            continue
+        
+        records = prepare_records(chunk)
+        for record, row in zip(records, chunk.index):
+            record['_id'] = row_id(checkpoint["started"], int(row))
+        if schema is not None:
+            records = [schema.encode_document(record) for record in records]
+        with_retries(lambda: insert_batch(target, records), f"Batch {number}")
+        
+        checkpoint.update(batch=number, rows=total_rows)
+        with_retries(lambda: save_checkpoint(db, collection_name, checkpoint), "Saving checkpoint")
+        logger.info(f"Inserted batch {number}: {len(records)} records")
+    return total_rows
+
+def add_row_hashes(df):
+    """Add a hash of each CSV row, so unchanged outcomes can be skipped by incremental imports"""
+    hashes = pd.util.hash_pandas_object(df, index=False)
+    df[ROW_HASH_FIELD] = [format(value, '016x') for value in hashes]
+    return df
+
+def create_row_key_index(collection, compact=False, batch_size=1000):
+    """
+    Create the unique ROW_KEY index incremental imports match outcomes on.
+    Documents without a full key (an unparseable datetime) are left out of the
+    index, so they cannot collide on it. Duplicate keys left by imports made
+    before the index existed are removed first, keeping the oldest document.
+    
+    Args:
+        collection: Target MongoDB collection
+        compact (bool): Index the short keys of compact documents
+        batch_size (int): Duplicates removed per delete
+    
+    Returns:
+        list: _ids of the removed duplicates
+    """
+    row_key = tuple(short_key(field) for field in ROW_KEY) if compact else ROW_KEY
+    full_key = {field: {"$type": key_type} for field, key_type in zip(row_key, ROW_KEY_TYPES)}
+    
+    index = collection.index_information().get(ROW_KEY_INDEX_NAME)
+    if index is not None:
+        if "partialFilterExpression" in index:
+            return []
+        # Indexed by an earlier version, which also covered incomplete keys
+        collection.drop_index(ROW_KEY_INDEX_NAME)
+    
+    duplicates = []
+    groups = collection.aggregate([
+        {"$match": full_key},
+        {"$group": {"_id": {field: f"${field}" for field in row_key}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    for group in groups:
+        duplicates.extend(sorted(group["ids"])[1:])
+    for i in range(0, len(duplicates), batch_size):
+        collection.delete_many({"_id": {"$in": duplicates[i:i + batch_size]}})
+    if duplicates:
+        logger.warning(f"Removed {len(duplicates)} documents duplicating the key of another outcome")
+    
+    collection.create_index([(field, 1) for field in row_key], unique=True, name=ROW_KEY_INDEX_NAME,
+                            partialFilterExpression=full_key)
+    return duplicates
+
+def sync_records(collection, records, delete_missing=False, batch_size=1000, schema=None):
+    """
+    Bring a collection in line with the source records, writing only the delta:
+    new outcomes are upserted, outcomes whose row hash changed are replaced and
+    (optionally) outcomes no longer in the source are deleted. Records and
+    documents without a full key cannot be matched, so they are skipped and
+    left as they are.
+    
+    Args:
+        collection: Target MongoDB collection (with the unique ROW_KEY index)
+        records (list): Source records carrying their ROW_HASH_FIELD
+        delete_missing (bool): Delete documents whose key is not in the source
+        batch_size (int): Operations per bulk write
+        schema (CompactSchema): Write compact documents (optional)
+    
+    Returns:
+        tuple: ({"inserted", "updated", "unchanged", "deleted", "skipped"} counts, [(op, _id)] changes)
+    """
+    row_key, hash_field = ROW_KEY, ROW_HASH_FIELD
+    if schema is not None:
+        row_key, hash_field = tuple(short_key(field) for field in ROW_KEY), short_key(ROW_HASH_FIELD)
+        records = [schema.encode_document(record) for record in records]
+    
+    projection = {field: 1 for field in row_key + (hash_field,)}
+    existing = {}
+    for doc in collection.find({}, projection):
+        key = tuple(doc.get(field) for field in row_key)
+        if None not in key:
+            existing[key] = (doc['_id'], doc.get(hash_field))
+    
+    operations = []
+    changes = []
+    seen = set()
+    unchanged = 0
+    skipped = 0
+    for record in records:
+        key = tuple(record.get(field) for field in row_key)
+        if None in key:
+            skipped += 1
+            continue
+        if key in seen:
+            logger.warning(f"Skipping duplicate outcome {key}")
+            continue
+        seen.add(key)
+        
+        current = existing.get(key)
+        if current is None:
+            # Upsert on the key, so a rerun after a partial import does not duplicate rows
+            doc_id = ObjectId()
+            operations.append(UpdateOne(dict(zip(row_key, key)),
+                                        {"$setOnInsert": dict(record, _id=doc_id)}, upsert=True))
+            changes.append(("insert", doc_id))
+        elif current[1] != record[hash_field]:
+            operations.append(ReplaceOne({"_id": current[0]}, record))
+            changes.append(("update", current[0]))
+        else:
+            unchanged += 1
+    
+    if delete_missing:
+        for key, (doc_id, _) in existing.items():
+            if key not in seen:
+                operations.append(DeleteOne({"_id": doc_id}))
+                changes.append(("delete", doc_id))
+    
+    for i in range(0, len(operations), batch_size):
+        collection.bulk_write(operations[i:i + batch_size], ordered=False)
+        logger.info(f"Wrote batch {i//batch_size + 1}: {len(operations[i:i + batch_size])} changes")
+    
+    if skipped:
+        logger.warning(f"Skipped {skipped} records without an animal_id and datetime to match them on")
+    
+    counts = {op: sum(1 for change_op, _ in changes if change_op == op) for op in ("insert", "update", "delete")}
+    return {"inserted": counts["insert"], "updated": counts["update"], "unchanged": unchanged,
+            "deleted": counts["delete"], "skipped": skipped}, changes
+
+def log_import_changes(db, collection_name, changes):
+    """Record an import in the change log, per document when the delta is small enough for delta sync"""
+    if len(changes) > MAX_LOGGED_CHANGES:
+        log_change(db, collection_name, "reset")
+        return
+    for op, doc_id in changes:
+        log_change(db, collection_name, op, doc_id)
+
+def create_import_indexes(collection, compact=False):
+    """Create the indexes the importer has always provided (on the short keys of compact documents)"""
+    key = short_key if compact else str
+    collection.create_index(key("breed"))
+    collection.create_index(key("sex_upon_outcome"))
+    collection.create_index(key("age_upon_outcome_in_weeks"))
+    collection.create_index([(key("location_lat"), 1), (key("location_long"), 1)])
+    collection.create_index([(key("location"), "2dsphere")])
+
+def copy_indexes(source, target):
+    """Recreate the secondary indexes of one collection on another (e.g. those the app created)"""
+    for spec in source.list_indexes():
+        if spec["name"] == "_id_":
+            continue
+        if spec["name"] == ROW_KEY_INDEX_NAME and "partialFilterExpression" not in spec:
+            # An earlier version's row key index, which rows without a datetime collide on;
+            # the next incremental import builds the current one
+            continue
+        keys = []
+        for field, kind in spec["key"].items():
+            # Text indexes report _fts/_ftsx in place of their fields, which are listed in weights
+            if field == "_fts":
+                keys.extend((text_field, "text") for text_field in spec["weights"])
+            elif field != "_ftsx":
+                keys.append((field, kind))
+        options = {key: value for key, value in spec.items() if key not in INDEX_INFO_ONLY}
+        target.create_index(keys, **options)
+
+def staged_reload(db, collection_name, csv_file_path, schema=None):
+    """
+    Reload a collection without readers seeing it empty or half loaded: insert
+    into a staging collection with no secondary indexes, build the indexes in
+    one pass afterwards, check the count, then rename it over the live one.
+    The staging load is checkpointed like a replace import.
+    
+    Args:
+        db: MongoDB database
+        collection_name (str): Live collection name
+        csv_file_path (str): Path to the CSV file
+        schema (CompactSchema): Write compact documents (optional)
+    
+    Returns:
+        int: Number of documents loaded
+    
+    Raises:
+        RuntimeError: If the staging count does not match, leaving the live collection untouched
+    """
+    staging = db[collection_name + STAGING_SUFFIX]
+    total_rows = load_batches(db, staging, csv_file_path, collection_name, "staged", drop=True, schema=schema)
+    
+    logger.info("Building indexes on the staging collection...")
+    create_import_indexes(staging, compact=schema is not None)
+    if collection_name in db.list_collection_names():
+        copy_indexes(db[collection_name], staging)
+    
+    count = staging.count_documents({})
+    if count != total_rows:
+        staging.drop()
+        clear_checkpoint(db, collection_name)
+        raise RuntimeError(f"Staging collection has {count} documents, expected {total_rows}")
+    
+    # Atomic swap: readers see the old collection until this returns, then the new one
+    staging.rename(collection_name, dropTarget=True)
+    logger.info(f"Swapped {count} records into {collection_name}")
+    return count
+
+def import_csv_to_mongodb(csv_file_path, mongo_uri="mongodb://localhost:27017/", 
+                         database_name="animal_shelter", collection_name="outcomes", snapshot_path=None,
+                         mode="replace", delete_missing=False, compact=False):
+    """
+    Import CSV data into MongoDB
+    
+    Args:
+        csv_file_path (str): Path to the CSV file
+        mongo_uri (str): MongoDB connection URI
+        database_name (str): Name of the database
+        collection_name (str): Name of the collection
+        snapshot_path (str): Directory to write the memory-mapped app snapshot to (optional)
+        mode (str): "replace" reloads the whole collection, "staged" reloads it through a
+                    staging collection swapped in atomically, "incremental" upserts only
+                    new and changed outcomes keyed on animal_id + datetime
+        delete_missing (bool): In incremental mode, delete outcomes missing from the CSV
+        compact (bool): Store short field keys and coded categories (the app's COMPACT_SCHEMA setting)
+    """
+    try:
+        # Connect to MongoDB
+        logger.info(f"Connecting to MongoDB at {mongo_uri}")
+        client = MongoClient(mongo_uri)
+        db = client[database_name]
+        collection = db[collection_name]
+        schema = CompactSchema(db) if compact else None
+        
+        if mode == "incremental":
+            # Read CSV file
+            logger.info(f"Reading CSV file: {csv_file_path}")
+            df = read_outcomes_csv(csv_file_path)
+            logger.info(f"Successfully loaded {len(df)} records from CSV")
+            
+            # Typed fields, so queries need no conversions at read time
+            df = add_row_hashes(normalize_data(df))
+            records = add_locations(clean_data(df).to_dict('records'))
+            
+            removed = create_row_key_index(collection, compact)
+            counts, changes = sync_records(collection, records, delete_missing=delete_missing, schema=schema)
+            changes = [("delete", doc_id) for doc_id in removed] + changes
+            logger.info(f"Incremental import: {counts['inserted']} inserted, {counts['updated']} updated, "
+                        f"{counts['unchanged']} unchanged, {counts['deleted']} deleted, "
+                        f"{counts['skipped']} skipped without a key")
+            
+            # Delta-sync clients fetch just the changed documents
+            if changes:
+                log_import_changes(db, collection_name, changes)
+        elif mode == "staged":
+            logger.info(f"Loading CSV file: {csv_file_path}")
+            staged_reload(db, collection_name, csv_file_path, schema)
+            log_change(db, collection_name, "reset")
+            clear_checkpoint(db, collection_name)
+        else:
+            # Insert data in checkpointed batches (an interrupted import resumes on rerun)
+            logger.info(f"Loading CSV file: {csv_file_path}")
+            total_inserted = load_batches(db, collection, csv_file_path, collection_name, mode, schema=schema)
+            logger.info(f"Successfully imported {total_inserted} records to MongoDB")
+            
+            # Invalidate dashboard ETags and tell delta-sync clients to reload
+            log_change(db, collection_name, "reset")
+            clear_checkpoint(db, collection_name)
+        
+        # Create indexes for better query performance
+        logger.info("Creating indexes...")
+        create_import_indexes(collection, compact)
+        
+        # Verify the import
+        count = collection.count_documents({})
+        logger.info(f"Verification: {count} documents in collection")
+        
+        # Show sample document
+        sample = collection.find_one()
+        if sample:
+            logger.info("Sample document:")
+            for key, value in sample.items():
+                if key != '_id':  # Skip MongoDB ObjectId
+                    logger.info(f"  {key}: {value}")
+        
+        # Snapshot file the app workers map for instant, MongoDB-independent reads
+        if snapshot_path:
+            logger.info(f"Writing snapshot to {snapshot_path}...")
+            export_snapshot(collection, snapshot_path, schema)
+        
+        client.close()
+        logger.info("Import completed successfully!")
+        
+    except FileNotFoundError:
+        logger.error(f"CSV file not found: {csv_file_path}")
+    except pymongo.errors.ConnectionFailure:
+        logger.error("Failed to connect to MongoDB. Make sure MongoDB is running, then rerun to resume the import.")
+    except Exception as e:
+        logger.error(f"Error during import: {str(e)}")
+
+def import_csv_to_sqlite(csv_file_path, sqlite_path="animal_shelter.db"):
+    """
+    Import CSV data into the embedded SQLite storage used with DATA_BACKEND=sqlite
+    
+    Args:
+        csv_file_path (str): Path to the CSV file
+        sqlite_path (str): Path of the SQLite database file (created if missing)
+    """
+    try:
+        logger.info(f"Reading CSV file: {csv_file_path}")
+        df = read_outcomes_csv(csv_file_path)
+        logger.info(f"Successfully loaded {len(df)} records from CSV")
+        
+        df = clean_data(normalize_data(df))
+        
+        storage = SQLiteStorage(sqlite_path)
+        total_inserted = storage.bulk_load(df.to_dict('records'))
+        logger.info(f"Successfully imported {total_inserted} records to {sqlite_path}")
+        logger.info(f"Verification: {storage.get_stats()['total_documents']} rows in table")
+        storage.close()
+        logger.info("Import completed successfully!")
+        
+    except FileNotFoundError:
+        logger.error(f"CSV file not found: {csv_file_path}")
+    except Exception as e:
+        logger.error(f"Error during import: {str(e)}")
+
+def test_connection(mongo_uri="mongodb://localhost:27017/"):
+    """Test MongoDB connection"""
+    try:
+        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+        client.server_info()  # Force connection
+        logger.info("MongoDB connection successful!")
+        client.close()
+        return True
+    except pymongo.errors.ServerSelectionTimeoutError:
+        logger.error("MongoDB connection failed. Make sure MongoDB is running.")
+        return False
+
+if __name__ == "__main__":
+    # Measure the import stages on synthetic data instead (options: --benchmark --help)
+    if "--benchmark" in sys.argv:
+        from import_benchmark import main
+        main(sys.argv[1:])
+        sys.exit()
+    
+    # Configuration
+    CSV_FILE_PATH = "aac_shelter_outcomes.csv"  # Update this path
+    MONGO_URI = "mongodb://localhost:27017/"     # Update if needed
+    DATABASE_NAME = "animal_shelter"
+    COLLECTION_NAME = "outcomes"
+    # IMPORT_MODE=staged reloads without downtime, IMPORT_MODE=incremental upserts only the
+    # delta; IMPORT_DELETE_MISSING=true also removes outcomes that are no longer in the CSV
+    IMPORT_MODE = os.getenv('IMPORT_MODE', 'replace')
+    DELETE_MISSING = os.getenv('IMPORT_DELETE_MISSING', 'false').lower() == 'true'
+    # COMPACT_SCHEMA=true stores short keys and coded categories (set it for the app too)
+    
+    # Same setting as the app: DATA_BACKEND=sqlite imports into the local SQLite file
+    if os.getenv('DATA_BACKEND') == 'sqlite':
+        import_csv_to_sqlite(CSV_FILE_PATH, os.getenv('SQLITE_PATH', 'animal_shelter.db'))
+    # Test connection first
+    elif test_connection(MONGO_URI):
+        # Import CSV to MongoDB
+        import_csv_to_mongodb(
+            csv_file_path=CSV_FILE_PATH,
+            mongo_uri=MONGO_URI,
+            database_name=DATABASE_NAME,
+            collection_name=COLLECTION_NAME,
+            snapshot_path=os.getenv('SNAPSHOT_PATH'),
+            mode=IMPORT_MODE,
+            delete_missing=DELETE_MISSING,
+            compact=compact_schema_enabled()
+        )
+    else:
+        logger.error("Please install and start MongoDB before running this script.")
+        logger.info("Installation instructions:")
+        logger.info("- Ubuntu/Debian: sudo apt-get install mongodb")
+        logger.info("- macOS: brew install mongodb/brew/mongodb-community")
+        logger.info("- Windows: Download from https://www.mongodb.com/try/download/community")
\ No newline at end of file
@@ -0,0 +1,132 @@
+import json
+import time
+import queue
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds between keep-alive comments on idle event streams
+HEARTBEAT_SECONDS = 15
+
+# Seconds before reopening a failed change stream, doubled per failure up to the maximum
+RECONNECT_SECONDS = 1
+MAX_RECONNECT_SECONDS = 60
+
+
+class EventBroker:
+    """Fans out change events to every connected Server-Sent Events client"""
+
+    def __init__(self, max_queued=100):
+        self.max_queued = max_queued
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self.max_queued)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event):
+        """Queue an event for every subscriber, dropping it for clients that stopped reading"""
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # The client fell behind; it resyncs through the delta endpoint on reconnect
+                logger.warning("Dropping change event for a slow subscriber")
+
+    def stream(self):
+        """Generator producing the text/event-stream body for one client"""
+        subscriber = self.subscribe()
+        try:
+            # Tell the browser how long to wait before reconnecting
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = subscriber.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: change\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def client_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+
+def change_event(op, doc_id, version=None):
+    """Build the compact event sent to dashboards"""
+    event = {"op": op, "id": str(doc_id) if doc_id is not None else None}
+    if version is not None:
+        event["token"] = version
+    return event
+
+
+def start_change_stream(collection, broker):
+    """
+    Publish changes from a MongoDB change stream, which also sees writes made by
+    other processes and the importer. The stream is reopened when it ends: after
+    an invalidate (the collection was dropped or renamed over, as by a staged
+    import) it starts after that event, after an error it resumes with backoff.
+    :return: True if the stream is running, False if the server does not support
+             change streams (standalone mongod) and the CRUD path must publish instead
+    """
+    try:
+        stream = collection.watch()
+    except Exception as e:
+        logger.info(f"Change streams unavailable, publishing from the CRUD path: {e}")
+        return False
+
+    operation_map = {"insert": "insert", "update": "update", "replace": "update", "delete": "delete",
+                     "drop": "reset", "rename": "reset", "invalidate": "reset"}
+
+    def run():
+        current = stream
+        resume_token = None
+        delay = RECONNECT_SECONDS
+        while True:
+            try:
+                if current is None:
+                    current = collection.watch(start_after=resume_token)
+            except Exception as e:
+                if resume_token is not None:
+                    # The token may have left the oplog: start over and make dashboards resync
+                    logger.warning(f"Cannot resume the change stream, opening a new one: {e}")
+                    resume_token = None
+                    broker.publish(change_event("reset", None))
+                    continue
+                logger.error(f"Cannot open the change stream, retrying in {delay}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_SECONDS)
+                continue
+
+            try:
+                with current:
+                    for change in current:
+                        resume_token = change["_id"]
+                        delay = RECONNECT_SECONDS
+                        op = operation_map.get(change["operationType"])
+                        if op is None:
+                            continue
+                        doc_id = change.get("documentKey", {}).get("_id")
+                        broker.publish(change_event(op, doc_id))
+                logger.info("Change stream invalidated, reopening it")
+            except Exception as e:
+                logger.error(f"Change stream stopped, resuming in {delay}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_SECONDS)
+            current = None
+
+    threading.Thread(target=run, name="change-stream", daemon=True).start()
+    logger.info("Publishing dashboard events from the MongoDB change stream")
+    return True
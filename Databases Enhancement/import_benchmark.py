@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Import throughput benchmark.
+Generates a synthetic outcomes CSV of any size from the rows of
+aac_shelter_outcomes.csv, streams it through the importer's per-batch stages
+against a local mongod or mongomock, and reports the time of each stage
+summed over the batches, rows/sec and peak memory (Unix only).
+Run it through `python csv_to_mongodb.py --benchmark` (see --help).
+"""
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import argparse
+import logging
+import tempfile
+import numpy as np
+import bson
+from pymongo import MongoClient
+from csv_to_mongodb import (read_outcomes_csv, normalize_data, clean_data, add_locations, insert_batch,
+                            create_import_indexes, row_id, BATCH_SIZE)
+
+# Peak memory comes from getrusage, which Windows does not have
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_DATABASE = "animal_shelter_benchmark"
+BENCHMARK_COLLECTION = "outcomes"
+
+# Profile entries printed with --profile
+PROFILE_LINES = 25
+
+
+def generate_outcomes(source_csv, rows, path, seed=0):
+    """
+    Write a synthetic outcomes CSV with the source's columns and value distributions:
+    rows are sampled from the source with unique animal ids and jittered coordinates
+    :param source_csv: Real outcomes CSV used as the template
+    :param rows: Number of rows to generate
+    :param path: Output CSV path
+    :param seed: Random seed, so runs are comparable
+    """
+    template = read_outcomes_csv(source_csv)
+    rng = np.random.default_rng(seed)
+    df = template.iloc[rng.integers(0, len(template), rows)].reset_index(drop=True)
+    df['animal_id'] = 'A' + (1000000 + np.arange(rows)).astype(str)
+    for col in ('location_lat', 'location_long'):
+        df[col] = df[col] + rng.normal(0, 0.01, rows)
+    # Written with its row number column, like the real export
+    df.to_csv(path)
+    logger.info(f"Generated {rows} rows in {path} ({os.path.getsize(path) / 2**20:.1f} MB)")
+
+
+def peak_memory_mb():
+    """Process memory high-water mark in MB, None where getrusage is unavailable"""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+
+class StageTimer:
+    """Sums the wall time of each stage over the batches and tracks the memory high-water mark"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.stages = {}
+
+    def run(self, name, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - started
+        total, _ = self.stages.get(name, (0, None))
+        self.stages[name] = (total + elapsed, peak_memory_mb())
+        return result
+
+    def report(self):
+        total = sum(elapsed for elapsed, _ in self.stages.values())
+        print(f"\n{self.rows} rows")
+        print(f"{'stage':<22}{'seconds':>10}{'rows/s':>14}{'share':>8}{'peak MB':>10}")
+        for name, (elapsed, peak_mb) in self.stages.items():
+            rate = self.rows / elapsed if elapsed else float('inf')
+            peak = f"{peak_mb:>10.0f}" if peak_mb is not None else f"{'-':>10}"
+            print(f"{name:<22}{elapsed:>10.3f}{rate:>14,.0f}{elapsed / total:>8.0%}{peak}")
+        print(f"{'total':<22}{total:>10.3f}{self.rows / total:>14,.0f}")
+
+
+def run_benchmark(csv_path, client, rows):
+    """
+    Stream a CSV through the stages load_batches runs on each batch
+    (prepare_records split into its steps), then build the indexes
+    :return: StageTimer with the measurements
+    """
+    timer = StageTimer(rows)
+    collection = client[BENCHMARK_DATABASE][BENCHMARK_COLLECTION]
+    collection.drop()
+    started = int(time.time())
+
+    chunks = iter(read_outcomes_csv(csv_path, chunksize=BATCH_SIZE))
+    while True:
+        chunk = timer.run("read_csv", next, chunks, None)
+        if chunk is None:
+            break
+        df = timer.run("normalize_data", normalize_data, chunk)
+        df = timer.run("clean_data", clean_data, df)
+        records = timer.run("to_dict", df.to_dict, 'records')
+        records = timer.run("add_locations", add_locations, records)
+        for record, row in zip(records, chunk.index):
+            record['_id'] = row_id(started, int(row))
+        # Encoded separately to split encoding from network and server time (insert encodes again)
+        timer.run("bson encode", lambda: [bson.encode(record) for record in records])
+        timer.run("insert", insert_batch, collection, records)
+    timer.run("index builds", create_import_indexes, collection)
+
+    # Conversion bugs show up as missing typed fields, not as errors
+    missing = collection.count_documents({"datetime": None})
+    if missing:
+        logger.warning(f"{missing} of {rows} imported documents have no datetime")
+
+    client.drop_database(BENCHMARK_DATABASE)
+    return timer
+
+
+def connect(mongo_uri):
+    """Client for a MongoDB URI, or an in-process mongomock client for "mongomock" """
+    if mongo_uri == "mongomock":
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("mongomock is not installed: pip install mongomock, or pass --mongo-uri")
+        return mongomock.MongoClient()
+    return MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the CSV importer stages")
+    parser.add_argument("--benchmark", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--rows", type=int, default=100000, help="synthetic rows to generate (default 100000)")
+    parser.add_argument("--source", default="aac_shelter_outcomes.csv", help="template CSV")
+    parser.add_argument("--mongo-uri", default="mongomock",
+                        help='MongoDB URI, e.g. mongodb://localhost:27017/, or "mongomock" (default)')
+    parser.add_argument("--profile", metavar="FILE", help="write cProfile stats to FILE and print the top entries")
+    parser.add_argument("--keep", metavar="CSV", help="keep the generated CSV at this path")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    csv_path = args.keep or os.path.join(tempfile.mkdtemp(), "outcomes_benchmark.csv")
+    generate_outcomes(args.source, args.rows, csv_path, args.seed)
+    client = connect(args.mongo_uri)
+
+    try:
+        if args.profile:
+            profiler = cProfile.Profile()
+            timer = profiler.runcall(run_benchmark, csv_path, client, args.rows)
+            profiler.dump_stats(args.profile)
+        else:
+            timer = run_benchmark(csv_path, client, args.rows)
+    finally:
+        client.close()
+        if not args.keep:
+            os.remove(csv_path)
+
+    timer.report()
+    if args.profile:
+        print(f"\nProfile written to {args.profile}")
+        pstats.Stats(args.profile).sort_stats("cumulative").print_stats(PROFILE_LINES)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import time
+import threading
+import logging
+from collections import defaultdict
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Default latency buckets in seconds (same as the Prometheus client libraries)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+# Response size buckets in bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    """Format a label set as {name="value",...}"""
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    """Format a sample value the way Prometheus expects"""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing value per label set, optionally read from a callback at scrape time"""
+
+    metric_type = "counter"
+
+    def __init__(self, name, documentation, label_names=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values = defaultdict(float)
+        self.lock = threading.Lock()
+        self.callback = callback
+
+    def inc(self, amount=1, *label_values):
+        with self.lock:
+            self.values[label_values] += amount
+
+    def samples(self):
+        if self.callback:
+            # Callback returns {label_values tuple: value}
+            for label_values, value in self.callback().items():
+                yield self.name, _format_labels(self.label_names, label_values), value
+            return
+        with self.lock:
+            items = list(self.values.items())
+        for label_values, value in items:
+            yield self.name, _format_labels(self.label_names, label_values), value
+
+
+class Gauge(Counter):
+    """Value that can go up and down, optionally read from a callback at scrape time"""
+
+    metric_type = "gauge"
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+
+class Histogram:
+    """Cumulative bucket histogram per label set"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.counts = {}
+        self.sums = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            counts = self.counts.setdefault(label_values, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self.sums[label_values] += value
+
+    def samples(self):
+        with self.lock:
+            items = [(labels, list(counts), self.sums[labels]) for labels, counts in self.counts.items()]
+        for label_values, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, label_values, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.label_names, label_values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    """Holds the registered metrics and renders them in Prometheus text format"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format (0.0.4)"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ("method", "route", "status")))
+RESPONSE_SIZE = registry.register(Histogram(
+    "http_response_size_bytes", "HTTP response body size by route",
+    ("route",), buckets=SIZE_BUCKETS))
+MONGO_COMMAND_LATENCY = registry.register(Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency by operation",
+    ("command", "collection")))
+MONGO_COMMAND_FAILURES = registry.register(Counter(
+    "mongodb_command_failures_total", "Failed MongoDB commands by operation",
+    ("command",)))
+MONGO_POOL_EVENTS = registry.register(Counter(
+    "mongodb_pool_events_total", "Connection pool events",
+    ("event",)))
+MONGO_POOL_CONNECTIONS = registry.register(Gauge(
+    "mongodb_pool_connections", "Open and checked out pool connections",
+    ("state",)))
+
+
+class CommandTimingListener(monitoring.CommandListener):
+    """Records the duration of every MongoDB command"""
+
+    def __init__(self):
+        self.collections = {}
+        self.lock = threading.Lock()
+
+    def started(self, event):
+        # The collection name is only on the started event, keep it until completion
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        with self.lock:
+            self.collections[(event.connection_id, event.request_id)] = collection
+
+    def _pop_collection(self, event):
+        with self.lock:
+            return self.collections.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event):
+        collection = self._pop_collection(event)
+        MONGO_COMMAND_LATENCY.observe(event.duration_micros / 1e6, event.command_name, collection)
+
+    def failed(self, event):
+        collection = self._pop_collection(event)
+        MONGO_COMMAND_LATENCY.observe(event.duration_micros / 1e6, event.command_name, collection)
+        MONGO_COMMAND_FAILURES.inc(1, event.command_name)
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Tracks open and checked out connections across all pools"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def _event(self, name):
+        MONGO_POOL_EVENTS.inc(1, name)
+
+    def _adjust(self, state, delta):
+        with self.lock:
+            MONGO_POOL_CONNECTIONS.values[(state,)] += delta
+
+    def pool_created(self, event):
+        self._event("pool_created")
+
+    def pool_ready(self, event):
+        self._event("pool_ready")
+
+    def pool_cleared(self, event):
+        self._event("pool_cleared")
+
+    def pool_closed(self, event):
+        self._event("pool_closed")
+
+    def connection_created(self, event):
+        self._event("connection_created")
+        self._adjust("open", 1)
+
+    def connection_ready(self, event):
+        self._event("connection_ready")
+
+    def connection_closed(self, event):
+        self._event("connection_closed")
+        self._adjust("open", -1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._event("check_out_failed")
+
+    def connection_checked_out(self, event):
+        self._adjust("checked_out", 1)
+
+    def connection_checked_in(self, event):
+        self._adjust("checked_out", -1)
+
+
+def install_mongo_listeners():
+    """Register the command and pool listeners for every MongoClient created afterwards"""
+    monitoring.register(CommandTimingListener())
+    monitoring.register(PoolStatsListener())
+    logger.info("MongoDB command and pool monitoring enabled")
+
+
+def _hit_ratio(cache):
+    hits, misses = cache.stats()
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+def register_cache(name, cache):
+    """Export hit/miss counts and the hit ratio of an LRUCache"""
+    registry.register(Counter(
+        f"{name}_hits_total", f"Hits of the {name} cache",
+        callback=lambda: {(): cache.stats()[0]}))
+    registry.register(Counter(
+        f"{name}_misses_total", f"Misses of the {name} cache",
+        callback=lambda: {(): cache.stats()[1]}))
+    registry.register(Gauge(
+        f"{name}_hit_ratio", f"Hit ratio of the {name} cache",
+        callback=lambda: {(): _hit_ratio(cache)}))
+    registry.register(Gauge(
+        f"{name}_entries", f"Entries held by the {name} cache",
+        callback=lambda: {(): len(cache.cache)}))
+
+
+def init_app(app):
+    """Time every Flask request and record its response size per route"""
+    from flask import request, g
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return response
+        # Use the route pattern, not the raw path, to keep label cardinality bounded
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_LATENCY.observe(time.perf_counter() - start, request.method, route, response.status_code)
+        if not response.is_streamed:
+            RESPONSE_SIZE.observe(response.calculate_content_length() or 0, route)
+        return response
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Slow query recorder and index advisor.
+The app records every find/aggregate slower than SLOW_QUERY_MS; this script
+(or /api/admin/index-report) explains the recorded query shapes and
+recommends indexes for the ones that scan too much.
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+from datetime import datetime, timezone
+from pymongo import MongoClient
+from bson import json_util
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# A plan is flagged when it examines this many documents per document returned
+DOCS_EXAMINED_RATIO = 10
+
+# Capped collection holding slow query samples, and its size in bytes
+SLOW_QUERY_LOG_COLLECTION = "slow_queries"
+SLOW_QUERY_LOG_SIZE = 16 * 1024 * 1024
+
+# Operators that make a field a range predicate (the R in equality-sort-range)
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte", "$ne", "$nin", "$exists"}
+
+
+def query_shape(value):
+    """Replace literal values with their type names so equivalent queries group together"""
+    if isinstance(value, dict):
+        return {key: query_shape(value[key]) for key in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(item, dict) for item in value):
+            # Pipelines and $and/$or clauses keep every element
+            return [query_shape(item) for item in value]
+        # Value lists ($in) keep the first element only, their length is not part of the shape
+        return [query_shape(value[0])] if value else []
+    return type(value).__name__
+
+
+def shape_key(kind, spec):
+    """Stable string key for a query shape"""
+    return f"{kind}:{json.dumps(query_shape(spec), sort_keys=True)}"
+
+
+def split_pipeline(pipeline):
+    """Get the leading $match filter and $sort keys of a pipeline"""
+    match, sort = {}, {}
+    for stage in pipeline:
+        if "$match" in stage and not sort:
+            match.update(stage["$match"])
+        elif "$sort" in stage and not sort:
+            sort = stage["$sort"]
+        elif "$geoNear" in stage:
+            match.update(stage["$geoNear"].get("query", {}))
+        else:
+            break
+    return match, sort
+
+
+def recommend_index(query, sort=None):
+    """
+    Recommend a compound index for a filter following the equality-sort-range rule
+    :param query: MongoDB filter
+    :param sort: Sort specification dictionary
+    :return: List of (field, direction) pairs, empty if nothing is indexable
+    """
+    equality, ranges = [], []
+    for field, condition in query.items():
+        if field.startswith("$"):
+            # $text has its own index, $and/$or clauses are left to the operator
+            continue
+        if isinstance(condition, dict) and any(op in RANGE_OPERATORS for op in condition):
+            ranges.append(field)
+        elif isinstance(condition, dict) and any(op.startswith("$geo") or op == "$near" for op in condition):
+            continue
+        else:
+            equality.append(field)
+
+    keys = [(field, 1) for field in equality]
+    for field, direction in (sort or {}).items():
+        if isinstance(direction, int) and field not in equality:
+            keys.append((field, direction))
+    keys.extend((field, 1) for field in ranges if field not in dict(keys))
+    return keys
+
+
+def index_covers(existing_keys, recommended):
+    """Check whether an existing index already has the recommended keys as its prefix"""
+    return existing_keys[:len(recommended)] == recommended
+
+
+def summarize_explain(explain):
+    """Pull the stages and document counts out of an executionStats explain"""
+    if "stages" in explain:
+        # Aggregation explain wraps the find plan in a $cursor stage
+        cursor_stage = explain["stages"][0].get("$cursor", {})
+        planner = cursor_stage.get("queryPlanner", {})
+        stats = cursor_stage.get("executionStats", {})
+    else:
+        planner = explain.get("queryPlanner", {})
+        stats = explain.get("executionStats", {})
+
+    stages = []
+    plan = planner.get("winningPlan", {})
+    # Newer servers nest the classic plan under queryPlan
+    plan = plan.get("queryPlan", plan)
+    while plan:
+        stages.append(plan.get("stage"))
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+
+    examined = stats.get("totalDocsExamined", 0)
+    returned = stats.get("nReturned", 0)
+    flags = []
+    if "COLLSCAN" in stages:
+        flags.append("COLLSCAN")
+    if examined > DOCS_EXAMINED_RATIO * max(returned, 1):
+        flags.append("HIGH_DOCS_EXAMINED_RATIO")
+
+    return {
+        "stages": stages,
+        "docs_examined": examined,
+        "keys_examined": stats.get("totalKeysExamined", 0),
+        "returned": returned,
+        "execution_ms": stats.get("executionTimeMillis"),
+        "flags": flags
+    }
+
+
+class SlowQueryRecorder:
+    """
+    Records finds and aggregations slower than a threshold, grouped by query shape.
+    Samples are also written to a capped collection so the CLI can report on them.
+    """
+
+    def __init__(self, threshold_ms=None, max_shapes=200, log_collection=None):
+        self.threshold_ms = threshold_ms if threshold_ms is not None else float(os.getenv('SLOW_QUERY_MS', 100))
+        self.max_shapes = max_shapes
+        self.log_collection = log_collection
+        self.shapes = {}
+        self.lock = threading.Lock()
+
+    def record(self, kind, spec, duration_ms, sort=None):
+        """
+        Record a query if it was slow
+        :param kind: "find" or "aggregate"
+        :param spec: Filter (find) or pipeline (aggregate)
+        :param duration_ms: Measured duration in milliseconds
+        :param sort: Sort specification of a find
+        """
+        if duration_ms < self.threshold_ms:
+            return
+
+        key = shape_key(kind, spec)
+        with self.lock:
+            entry = self.shapes.get(key)
+            if entry is None:
+                if len(self.shapes) >= self.max_shapes:
+                    return
+                entry = self.shapes[key] = {
+                    "kind": kind,
+                    "shape": query_shape(spec),
+                    "sample": spec,
+                    "sort": sort,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0
+                }
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+
+        logger.warning(f"Slow {kind} ({duration_ms:.0f} ms): {json.dumps(query_shape(spec))}")
+
+        if self.log_collection is not None:
+            try:
+                # Stored as Extended JSON, operator keys are not valid stored field names
+                self.log_collection.insert_one({
+                    "kind": kind,
+                    "shape_key": key,
+                    "sample": json_util.dumps(spec),
+                    "sort": json_util.dumps(sort),
+                    "duration_ms": duration_ms,
+                    "recorded_at": datetime.now(timezone.utc)
+                })
+            except Exception as e:
+                logger.error(f"Error logging slow query: {e}")
+
+    def entries(self):
+        """Get a snapshot of the recorded shapes"""
+        with self.lock:
+            return [dict(entry) for entry in self.shapes.values()]
+
+    def load_log(self, limit=10000):
+        """Merge the slow query log collection into the recorded shapes (for the CLI)"""
+        if self.log_collection is None:
+            return
+        for doc in self.log_collection.find().sort("$natural", -1).limit(limit):
+            sample = json_util.loads(doc["sample"])
+            with self.lock:
+                entry = self.shapes.setdefault(doc["shape_key"], {
+                    "kind": doc["kind"],
+                    "shape": query_shape(sample),
+                    "sample": sample,
+                    "sort": json_util.loads(doc["sort"]),
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0
+                })
+                entry["count"] += 1
+                entry["total_ms"] += doc["duration_ms"]
+                entry["max_ms"] = max(entry["max_ms"], doc["duration_ms"])
+
+
+def get_log_collection(db):
+    """Get the slow query log collection, creating it as a capped collection if needed"""
+    if SLOW_QUERY_LOG_COLLECTION not in db.list_collection_names():
+        db.create_collection(SLOW_QUERY_LOG_COLLECTION, capped=True, size=SLOW_QUERY_LOG_SIZE)
+    return db[SLOW_QUERY_LOG_COLLECTION]
+
+
+def explain(collection, kind, spec, sort=None):
+    """Run explain("executionStats") for a recorded find or pipeline"""
+    command = {"find": collection.name, "filter": spec} if kind == "find" else \
+        {"aggregate": collection.name, "pipeline": spec, "cursor": {}}
+    if kind == "find" and sort:
+        command["sort"] = sort
+    return collection.database.command({"explain": command, "verbosity": "executionStats"})
+
+
+def build_index_report(collection, recorder):
+    """
+    Explain every recorded slow query shape and recommend indexes
+    :param collection: Collection the queries ran against
+    :param recorder: SlowQueryRecorder holding the shapes
+    :return: Report dictionary, slowest shapes first
+    """
+    existing = [info["key"] for info in collection.index_information().values()]
+    report = []
+    recommendations = {}
+
+    for entry in sorted(recorder.entries(), key=lambda e: e["total_ms"], reverse=True):
+        if entry["kind"] == "find":
+            query, sort = entry["sample"], entry.get("sort")
+        else:
+            query, sort = split_pipeline(entry["sample"])
+
+        try:
+            summary = summarize_explain(explain(collection, entry["kind"], entry["sample"], entry.get("sort")))
+        except Exception as e:
+            summary = {"error": str(e), "flags": []}
+
+        recommended = []
+        if summary["flags"]:
+            recommended = recommend_index(query, sort)
+            if recommended and any(index_covers(keys, recommended) for keys in existing):
+                recommended = []
+        if recommended:
+            recommendations[json.dumps(recommended)] = recommended
+
+        report.append({
+            "kind": entry["kind"],
+            "shape": entry["shape"],
+            "count": entry["count"],
+            "avg_ms": round(entry["total_ms"] / entry["count"], 1),
+            "max_ms": round(entry["max_ms"], 1),
+            "explain": summary,
+            "recommended_index": recommended
+        })
+
+    return {
+        "threshold_ms": recorder.threshold_ms,
+        "queries": report,
+        "recommended_indexes": list(recommendations.values())
+    }
+
+
+def print_report(report):
+    """Print an index report for the command line"""
+    print(f"Slow queries (>= {report['threshold_ms']} ms): {len(report['queries'])} shapes")
+    for entry in report["queries"]:
+        summary = entry["explain"]
+        print()
+        print(f"{entry['kind']} x{entry['count']}  avg {entry['avg_ms']} ms  max {entry['max_ms']} ms")
+        print(f"  shape:    {json.dumps(entry['shape'])}")
+        if "error" in summary:
+            print(f"  explain:  failed ({summary['error']})")
+        else:
+            print(f"  plan:     {' <- '.join(s for s in summary['stages'] if s)}")
+            print(f"  examined: {summary['docs_examined']} docs, {summary['keys_examined']} keys "
+                  f"for {summary['returned']} returned")
+        if summary["flags"]:
+            print(f"  flags:    {', '.join(summary['flags'])}")
+        if entry["recommended_index"]:
+            print(f"  index:    {entry['recommended_index']}")
+
+    print()
+    if report["recommended_indexes"]:
+        print("Recommended indexes:")
+        for keys in report["recommended_indexes"]:
+            print(f"  db.collection.createIndex({json.dumps(dict(keys))})")
+    else:
+        print("No index recommendations.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    username = os.getenv('MONGO_USERNAME')
+    password = os.getenv('MONGO_PASSWORD')
+    cluster = os.getenv('MONGO_CLUSTER')
+    database_name = os.getenv('MONGO_DB', "animal_shelter")
+    collection_name = os.getenv('MONGO_COLLECTION', "outcomes")
+    mongo_uri = os.getenv('MONGO_URI') or \
+        f"mongodb+srv://{username}:{password}@{cluster}/{database_name}?retryWrites=true&w=majority"
+
+    client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+    db = client[database_name]
+    recorder = SlowQueryRecorder(log_collection=db[SLOW_QUERY_LOG_COLLECTION])
+    started = time.perf_counter()
+    recorder.load_log()
+    print_report(build_index_report(db[collection_name], recorder))
+    logger.info(f"Report built in {time.perf_counter() - started:.2f}s")
+    client.close()
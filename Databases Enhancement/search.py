@@ -0,0 +1,368 @@
+import re
+import json
+import base64
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Split a value into lowercase alphanumeric tokens"""
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def trigrams(token):
+    """Get the set of padded trigrams for a token (pg_trgm style)"""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """
+    In-memory trigram index over distinct field values.
+    Maps a misspelled term to the exact stored values it most likely refers to,
+    so the database can be queried with an index-backed $in instead of a regex scan.
+    """
+
+    def __init__(self, min_similarity=0.4):
+        self.min_similarity = min_similarity
+        self.token_values = defaultdict(set)    # token -> exact values containing it
+        self.trigram_tokens = defaultdict(set)  # trigram -> tokens containing it
+        self.token_trigrams = {}                # token -> its trigram set
+
+    def build(self, values):
+        """Build the index from an iterable of distinct values"""
+        self.token_values.clear()
+        self.trigram_tokens.clear()
+        self.token_trigrams.clear()
+
+        for value in values:
+            if not isinstance(value, str):
+                continue
+            for token in tokenize(value):
+                self.token_values[token].add(value)
+                if token not in self.token_trigrams:
+                    grams = trigrams(token)
+                    self.token_trigrams[token] = grams
+                    for gram in grams:
+                        self.trigram_tokens[gram].add(token)
+
+        logger.info(f"Trigram index built with {len(self.token_trigrams)} tokens")
+        return self
+
+    def similar_tokens(self, token):
+        """Get (similarity, token) pairs for indexed tokens similar to the given token"""
+        grams = trigrams(token)
+        shared = defaultdict(int)
+        for gram in grams:
+            for candidate in self.trigram_tokens.get(gram, ()):
+                shared[candidate] += 1
+
+        matches = []
+        for candidate, common in shared.items():
+            # Jaccard similarity of the two trigram sets
+            similarity = common / (len(grams) + len(self.token_trigrams[candidate]) - common)
+            if similarity >= self.min_similarity:
+                matches.append((similarity, candidate))
+        return matches
+
+    def lookup(self, term, limit=50):
+        """
+        Find exact values matching every token of a fuzzy term
+        :param term: User supplied search text, possibly misspelled
+        :param limit: Maximum number of values to return
+        :return: List of exact values, closest match first
+        """
+        scores = None
+        for token in tokenize(term):
+            token_scores = {}
+            for similarity, similar in self.similar_tokens(token):
+                for value in self.token_values[similar]:
+                    token_scores[value] = max(token_scores.get(value, 0), similarity)
+
+            # Every token of the term has to match somewhere in the value
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {value: score + token_scores[value]
+                          for value, score in scores.items() if value in token_scores}
+            if not scores:
+                return []
+
+        # Best score first, shorter (less qualified) values break ties
+        ranked = sorted((scores or {}).items(), key=lambda item: (-item[1], len(item[0]), item[0]))
+        return [value for value, _ in ranked[:limit]]
+
+
+class FuzzySearchIndex:
+    """Trigram indexes for each fuzzy searchable field of the data"""
+
+    FIELDS = ("breed", "name")
+
+    def __init__(self, data_manager, min_similarity=0.4):
+        # Any storage backend with distinct(field)
+        self.data_manager = data_manager
+        self.min_similarity = min_similarity
+        self.indexes = {}
+
+    def build(self):
+        """Load the distinct values of each field and index them"""
+        for field in self.FIELDS:
+            values = self.data_manager.distinct(field)
+            self.indexes[field] = TrigramIndex(self.min_similarity).build(values)
+        return self
+
+    def build_query(self, term, limit=50):
+        """
+        Translate a fuzzy term into an index-backed MongoDB query
+        :return: MongoDB query dictionary, or None if nothing matched
+        """
+        clauses = []
+        for field, index in self.indexes.items():
+            values = index.lookup(term, limit)
+            if values:
+                clauses.append({field: {"$in": values}})
+
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+# Query syntax field names mapped to collection fields
+QUERY_FIELDS = {
+    "breed": "breed",
+    "name": "name",
+    "color": "color",
+    "type": "animal_type",
+    "animal": "animal_type",
+    "outcome": "outcome_type",
+    "subtype": "outcome_subtype",
+    "sex": "sex_upon_outcome",
+    "age": "age_upon_outcome_in_weeks",
+}
+
+# Fields compared as numbers and accepting lo..hi ranges
+NUMERIC_FIELDS = {"age_upon_outcome_in_weeks"}
+
+QUERY_TOKEN_PATTERN = re.compile(r'(\w+):(?:"([^"]*)"|(\S+))|"([^"]*)"|(\S+)')
+
+
+def parse_search_query(text):
+    """
+    Parse a field-qualified search string, e.g.
+    breed:"German Shepherd" outcome:Adoption sex:"Intact Male" age:26..156 buddy
+    :param text: Raw search string
+    :return: Tuple of ({field: [values]}, [bare terms])
+    :raises ValueError: On unknown fields or malformed values
+    """
+    fields = defaultdict(list)
+    terms = []
+
+    for match in QUERY_TOKEN_PATTERN.finditer(text):
+        key, quoted_value, plain_value, quoted_term, plain_term = match.groups()
+
+        if key is None:
+            terms.append(quoted_term if quoted_term is not None else plain_term)
+            continue
+
+        field = QUERY_FIELDS.get(key.lower())
+        if field is None:
+            raise ValueError(f"Unknown search field '{key}'")
+
+        value = quoted_value if quoted_value is not None else plain_value
+        fields[field].append(_parse_field_value(field, value))
+
+    return dict(fields), terms
+
+
+def _parse_field_value(field, value):
+    """Convert a raw field value to its typed form (ranges become (lo, hi) tuples)"""
+    if field in NUMERIC_FIELDS:
+        try:
+            if ".." in value:
+                low, high = value.split("..", 1)
+                return (float(low) if low else None, float(high) if high else None)
+            return float(value)
+        except ValueError:
+            raise ValueError(f"Invalid number for '{field}': {value}")
+    return value
+
+
+def _range_bounds(field, low, high):
+    """
+    MongoDB bounds of a lo..hi range
+    :raises ValueError: If neither end is given
+    """
+    if low is None and high is None:
+        raise ValueError(f"Range for '{field}' needs at least one bound")
+    bounds = {}
+    if low is not None:
+        bounds["$gte"] = low
+    if high is not None:
+        bounds["$lte"] = high
+    return bounds
+
+
+class FieldValueIndex:
+    """
+    Lowercase value -> stored values of each text search field, so
+    breed:"german shepherd" matches the stored "German Shepherd" with an
+    index-backed equality instead of a case-insensitive regex scan
+    """
+
+    FIELDS = tuple(sorted(set(QUERY_FIELDS.values()) - NUMERIC_FIELDS))
+
+    def __init__(self, data_manager):
+        # Any storage backend with distinct(field)
+        self.data_manager = data_manager
+        self.values = {}
+
+    def build(self):
+        """Load the distinct values of each field and group them by lowercase form"""
+        for field in self.FIELDS:
+            lookup = defaultdict(list)
+            for value in self.data_manager.distinct(field):
+                if isinstance(value, str):
+                    lookup[value.lower()].append(value)
+            self.values[field] = dict(lookup)
+        return self
+
+    def resolve(self, field, value):
+        """Stored values of a field equal to value ignoring case, [value] if there are none"""
+        if not isinstance(value, str):
+            return [value]
+        return self.values.get(field, {}).get(value.lower(), [value])
+
+
+def compile_search_query(fields, terms, value_index=None):
+    """
+    Compile a parsed search into a MongoDB filter.
+    Field clauses become equality/$in/range predicates served by the regular
+    indexes; only bare terms fall back to $text.
+    :param value_index: FieldValueIndex matching text values to the stored
+        values regardless of case; without one values must match exactly
+    :return: MongoDB query dictionary
+    :raises ValueError: On a range with no bounds
+    """
+    query = {}
+
+    for field, values in fields.items():
+        ranges = [value for value in values if isinstance(value, tuple)]
+        exact = [value for value in values if not isinstance(value, tuple)]
+        if value_index is not None:
+            exact = list(dict.fromkeys(stored for value in exact for stored in value_index.resolve(field, value)))
+
+        if ranges:
+            # Several ranges on one field narrow to their intersection
+            bounds = {}
+            for low, high in ranges:
+                for op, bound in _range_bounds(field, low, high).items():
+                    # Keep the highest lower bound and the lowest upper bound
+                    bounds[op] = (max if op == "$gte" else min)(bound, bounds.get(op, bound))
+            if exact:
+                bounds["$in"] = exact
+            query[field] = bounds
+        elif len(exact) == 1:
+            query[field] = exact[0]
+        else:
+            query[field] = {"$in": exact}
+
+    if terms:
+        query["$text"] = {"$search": " ".join(terms), "$caseSensitive": False}
+
+    return query
+
+
+def is_field_query(text):
+    """Check whether a search string uses the field-qualified syntax"""
+    return any(match.group(1) for match in QUERY_TOKEN_PATTERN.finditer(text))
+
+
+def encode_cursor(state):
+    """Encode pagination state into an opaque URL-safe cursor"""
+    raw = json.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(token):
+    """
+    Decode a cursor produced by encode_cursor
+    :raises ValueError: If the cursor is malformed
+    """
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(state, dict):
+        raise ValueError("Invalid cursor")
+    return state
+
+
+def merge_queries(*queries):
+    """
+    Combine MongoDB filters with AND semantics.
+    $text is kept at the top level, since MongoDB only allows it there.
+    :return: MongoDB query dictionary
+    """
+    text = None
+    clauses = []
+    for query in queries:
+        if not query:
+            continue
+        query = dict(query)
+        if "$text" in query:
+            text = query.pop("$text")
+        if query:
+            clauses.append(query)
+
+    merged = {}
+    for clause in clauses:
+        if merged.keys() & clause.keys():
+            # Same field constrained twice, both predicates must hold
+            merged = {"$and": clauses}
+            break
+        merged.update(clause)
+
+    if text is not None:
+        merged["$text"] = text
+    return merged
+
+
+# Fields the data table may filter on per column
+COLUMN_FILTER_FIELDS = {
+    "name", "breed", "color", "animal_type", "outcome_type", "outcome_subtype",
+    "sex_upon_outcome", "age_upon_outcome_in_weeks", "animal_id"
+}
+
+
+def compile_column_filters(filters):
+    """
+    Compile per-column table filters into a MongoDB filter.
+    Text columns match by prefix (an anchored regex can still use the field's
+    index); numeric columns take a value or a lo..hi range.
+    :param filters: {field: raw filter value}
+    :return: MongoDB query dictionary
+    :raises ValueError: On fields that may not be filtered or malformed values
+    """
+    query = {}
+    for field, raw_value in filters.items():
+        if field not in COLUMN_FILTER_FIELDS:
+            raise ValueError(f"Cannot filter on '{field}'")
+        value = raw_value.strip()
+        if not value:
+            continue
+
+        if field in NUMERIC_FIELDS:
+            parsed = _parse_field_value(field, value)
+            if isinstance(parsed, tuple):
+                query[field] = _range_bounds(field, *parsed)
+            else:
+                query[field] = parsed
+        else:
+            query[field] = {"$regex": f"^{re.escape(value)}"}
+    return query
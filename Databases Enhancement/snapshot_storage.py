@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Read-only storage backend over a memory-mapped columnar snapshot file.
+Workers map the same column files, so forked processes share one page-cache
+copy, start without loading the collection and keep serving the read
+endpoints while MongoDB is unreachable. Run this module to export a snapshot
+from the configured MongoDB collection.
+"""
+
+import os
+import time
+import threading
+import logging
+from pymongo import MongoClient
+from dotenv import load_dotenv
+from storage import DataBackend, CrudBackend
+from columnar import ColumnarSnapshot
+from search import FuzzySearchIndex, FieldValueIndex
+from crud import get_collection_version
+from compact_schema import schema_for
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the CURRENT pointer for a newer snapshot
+RELOAD_CHECK_SECONDS = 2
+
+
+class SnapshotStorage(DataBackend, CrudBackend):
+    """
+    Serves reads, counts and group-by aggregations from the snapshot written
+    by csv_to_mongodb.py or this module's export. Filters the column store
+    cannot evaluate and all writes raise NotImplementedError (501).
+    Rows are rebuilt from the columns: they have the CSV fields and location,
+    but not fields outside the columns (row_hash, extra fields written through CRUD).
+    """
+
+    backend_name = "snapshot"
+
+    FACET_FIELDS = ("outcome_type", "animal_type", "sex_upon_outcome", "breed")
+    FACET_LIMIT = 25
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('SNAPSHOT_PATH', 'snapshot')
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.current = None
+        self.checked = 0
+        self.fuzzy_index = None
+        self.value_index = None
+        # Read-only, so never called; the app registers its event publisher here
+        self.change_listeners = []
+        self._reload()
+        if self.snapshot is None:
+            raise FileNotFoundError(f"No snapshot found in {self.path}")
+
+    def _reload(self):
+        """Map the snapshot CURRENT points at, if it changed since the last check"""
+        current = ColumnarSnapshot.current(self.path)
+        if current is not None and current != self.current:
+            self.snapshot = ColumnarSnapshot.open(self.path)
+            self.current = current
+            self.fuzzy_index = None
+        self.checked = time.monotonic()
+
+    def _snapshot(self):
+        """Get the current snapshot, picking up a newer export every RELOAD_CHECK_SECONDS"""
+        if time.monotonic() - self.checked > RELOAD_CHECK_SECONDS:
+            with self.lock:
+                try:
+                    self._reload()
+                except Exception as e:
+                    logger.error(f"Error reloading snapshot from {self.path}: {e}")
+        return self.snapshot
+
+    def _mask(self, snapshot, query):
+        query = query or {}
+        if not snapshot.supports(query):
+            raise NotImplementedError
+        return snapshot.mask(query)
+
+    # ---- DataBackend ----
+
+    def read(self, query=None, limit=None, sort=None, skip=0):
+        snapshot = self._snapshot()
+        return snapshot.rows_for(self._mask(snapshot, query), skip, limit, sort)
+
+    def count(self, query):
+        snapshot = self._snapshot()
+        return int(self._mask(snapshot, query).sum())
+
+    def distinct(self, field):
+        """Distinct values of a field (used to build the fuzzy search index)"""
+        return list(self._snapshot().values[field])
+
+    def value_counts(self, field, match_query=None):
+        snapshot = self._snapshot()
+        if field not in snapshot.CATEGORY_FIELDS:
+            raise NotImplementedError
+        return snapshot.value_counts(field, self._mask(snapshot, match_query))
+
+    def get_stats(self):
+        return {"total_documents": int(self._snapshot().live.sum())}
+
+    def aggregate_by_outcome_type(self, match_query=None):
+        snapshot = self._snapshot()
+        return snapshot.outcome_type_summary(self._mask(snapshot, match_query))
+
+    def aggregate_by_animal_type(self, match_query=None, top_k=5):
+        snapshot = self._snapshot()
+        return snapshot.animal_type_summary(self._mask(snapshot, match_query), top_k)
+
+    def aggregate_by_breed(self, match_query=None, top_k=5):
+        snapshot = self._snapshot()
+        return snapshot.breed_summary(self._mask(snapshot, match_query), top_k)
+
+    def get_monthly_statistics(self, match_query=None, top_k=5):
+        snapshot = self._snapshot()
+        return snapshot.monthly_summary(self._mask(snapshot, match_query), top_k)
+
+    def search(self, query, cursor=None, page_size=100):
+        """Search page with offset cursors; field queries only, $text needs MongoDB or SQLite"""
+        snapshot = self._snapshot()
+        mask = self._mask(snapshot, query)
+        offset = int(cursor.get("offset", 0)) if cursor else 0
+        rows = snapshot.rows_for(mask, offset, page_size + 1)
+
+        total = facets = None
+        if cursor is None:
+            total = int(mask.sum())
+            facets = {
+                field: [{"value": value, "count": count}
+                        for value, count in snapshot.value_counts(field, mask)[:self.FACET_LIMIT]]
+                for field in self.FACET_FIELDS
+            }
+        return {
+            "results": rows[:page_size],
+            "total": total,
+            "facets": facets,
+            "next_cursor": {"offset": offset + page_size} if len(rows) > page_size else None
+        }
+
+    def fuzzy_query(self, term):
+        try:
+            if self.fuzzy_index is None:
+                self.fuzzy_index = FuzzySearchIndex(self).build()
+            return self.fuzzy_index.build_query(term)
+        except Exception as e:
+            logger.error(f"Error building fuzzy query: {e}")
+            return None
+
+    def get_value_index(self):
+        version = self.get_data_version()
+        if self.value_index is None or self.value_index[0] != version:
+            self.value_index = (version, FieldValueIndex(self).build())
+        return self.value_index[1]
+
+    def get_data_version(self, fresh=False):
+        # The export's MongoDB version, so ETags stay valid across workers
+        return self._snapshot().version
+
+    def get_changes(self, since, match_query=None, max_changes=5000):
+        # No change log here: a new export makes replicas reload
+        version = self.get_data_version()
+        return {"token": version, "reset": since != version, "upserts": [], "deletes": []}
+
+    def mark_changed(self):
+        self.fuzzy_index = None
+
+    def sort_index_supported(self, sort_field, query=None):
+        # Sorted in memory over the filtered rows
+        return self._snapshot().sortable(sort_field)
+
+    def create_indexes(self):
+        pass
+
+    def close(self):
+        self.snapshot = None
+        logger.info("Snapshot storage closed")
+
+
+def export_snapshot(collection, path, schema=None):
+    """
+    Write a snapshot of a MongoDB collection
+    :param collection: Source collection
+    :param path: Snapshot root directory
+    :param schema: CompactSchema to decode compact documents with, None for public documents
+    :return: Directory the snapshot was written to
+    """
+    # Version first: writes made during the export are replayed by the app from the change log
+    version = get_collection_version(collection.database, collection.name)
+    documents = list(collection.find())
+    if schema is not None:
+        documents = [schema.decode_document(doc) for doc in documents]
+    for doc in documents:
+        doc['_id'] = str(doc['_id'])
+    snapshot = ColumnarSnapshot()
+    snapshot.load(documents, version)
+    return snapshot.save(path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    username = os.getenv('MONGO_USERNAME')
+    password = os.getenv('MONGO_PASSWORD')
+    cluster = os.getenv('MONGO_CLUSTER')
+    database_name = os.getenv('MONGO_DB', "animal_shelter")
+    collection_name = os.getenv('MONGO_COLLECTION', "outcomes")
+    mongo_uri = os.getenv('MONGO_URI') or \
+        f"mongodb+srv://{username}:{password}@{cluster}/{database_name}?retryWrites=true&w=majority"
+
+    client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+    started = time.perf_counter()
+    export_snapshot(client[database_name][collection_name], os.getenv('SNAPSHOT_PATH', 'snapshot'),
+                    schema_for(client[database_name]))
+    logger.info(f"Snapshot exported in {time.perf_counter() - started:.2f}s")
+    client.close()
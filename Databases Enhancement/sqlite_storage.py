@@ -0,0 +1,489 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from storage import DataBackend, CrudBackend
+from search import FuzzySearchIndex, FieldValueIndex, merge_queries
+from crud import parse_dates
+
+logger = logging.getLogger(__name__)
+
+# Dates are stored as ISO 8601 text ("2016-05-06T10:49:00"), the format the MongoDB backend
+# serves them in, which also sorts chronologically. Writes parse date strings first, so
+# imported and CRUD-written values share the format
+sqlite3.register_adapter(datetime, lambda value: value.isoformat())
+
+TABLE = "outcomes"
+
+# Outcome columns and their SQLite types, in CSV order
+COLUMNS = {
+    "age_upon_outcome": "TEXT",
+    "animal_id": "TEXT",
+    "animal_type": "TEXT",
+    "breed": "TEXT",
+    "color": "TEXT",
+    "date_of_birth": "TEXT",
+    "datetime": "TEXT",
+    "monthyear": "TEXT",
+    "name": "TEXT",
+    "outcome_subtype": "TEXT",
+    "outcome_type": "TEXT",
+    "sex_upon_outcome": "TEXT",
+    "location_lat": "REAL",
+    "location_long": "REAL",
+    "age_upon_outcome_in_weeks": "REAL",
+}
+
+# Columns in the FTS5 index, the same fields as the MongoDB text index
+TEXT_COLUMNS = ("name", "breed", "outcome_type")
+
+# Index key columns; the compound first one serves the rescue filters
+INDEXES = [
+    ("breed", "sex_upon_outcome", "age_upon_outcome_in_weeks"),
+    ("outcome_type",), ("animal_type",), ("date_of_birth",), ("name",),
+    ("datetime",), ("age_upon_outcome_in_weeks",),
+]
+
+COMPARISONS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def _quoted(columns):
+    """Comma separated, quoted column list"""
+    return ", ".join(f'"{column}"' for column in columns)
+
+
+def _regexp(pattern, value):
+    """REGEXP function for $regex filters"""
+    return value is not None and re.search(pattern, str(value)) is not None
+
+
+def fts_query(text):
+    """Build an FTS5 query matching any of the terms, like MongoDB $text"""
+    terms = re.findall(r'"[^"]+"|\S+', text)
+    return " OR ".join('"' + term.strip('"').replace('"', '""') + '"' for term in terms)
+
+
+class SQLiteStorage(DataBackend, CrudBackend):
+    """
+    Embedded storage backend: the outcomes table in a local SQLite file, with
+    an FTS5 index for text search. Serves single node deployments and offline
+    runs without a MongoDB server.
+    """
+
+    backend_name = "sqlite"
+
+    FACET_FIELDS = ("outcome_type", "animal_type", "sex_upon_outcome", "breed")
+    FACET_LIMIT = 25
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('SQLITE_PATH', 'animal_shelter.db')
+        self.lock = threading.RLock()
+        self.fuzzy_index = None
+        self.value_index = None
+        # Callbacks run after each successful write with (op, doc_id, version)
+        self.change_listeners = []
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.create_function("REGEXP", 2, _regexp, deterministic=True)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_schema()
+        logger.info(f"Opened SQLite storage: {self.path}")
+
+    def _create_schema(self):
+        columns = ", ".join(f'"{name}" {sql_type}' for name, sql_type in COLUMNS.items())
+        text_columns = ", ".join(TEXT_COLUMNS)
+        new_text = ", ".join(f"new.{column}" for column in TEXT_COLUMNS)
+        old_text = ", ".join(f"old.{column}" for column in TEXT_COLUMNS)
+        with self.lock, self.conn:
+            self.conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS {TABLE} (id INTEGER PRIMARY KEY, {columns}, extra TEXT);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+                INSERT OR IGNORE INTO meta VALUES ('version', 0);
+                CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE}_fts USING fts5(
+                    {text_columns}, content='{TABLE}', content_rowid='id');
+                CREATE TRIGGER IF NOT EXISTS {TABLE}_ai AFTER INSERT ON {TABLE} BEGIN
+                    INSERT INTO {TABLE}_fts(rowid, {text_columns}) VALUES (new.id, {new_text});
+                END;
+                CREATE TRIGGER IF NOT EXISTS {TABLE}_ad AFTER DELETE ON {TABLE} BEGIN
+                    INSERT INTO {TABLE}_fts({TABLE}_fts, rowid, {text_columns}) VALUES ('delete', old.id, {old_text});
+                END;
+                CREATE TRIGGER IF NOT EXISTS {TABLE}_au AFTER UPDATE ON {TABLE} BEGIN
+                    INSERT INTO {TABLE}_fts({TABLE}_fts, rowid, {text_columns}) VALUES ('delete', old.id, {old_text});
+                    INSERT INTO {TABLE}_fts(rowid, {text_columns}) VALUES (new.id, {new_text});
+                END;
+            """)
+        self.create_indexes()
+
+    def create_indexes(self):
+        with self.lock, self.conn:
+            for keys in INDEXES:
+                name = f"idx_{TABLE}_" + "_".join(keys)
+                self.conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {TABLE} ({", ".join(keys)})')
+
+    # ---- Filter translation ----
+
+    def _column(self, field, table):
+        if field == "_id":
+            return f"{table}.id"
+        if field not in COLUMNS:
+            raise ValueError(f"Cannot query field '{field}' in SQLite storage")
+        return f'{table}."{field}"'
+
+    @staticmethod
+    def _value(field, value):
+        return int(value) if field == "_id" else value
+
+    def compile_filter(self, query, table=TABLE):
+        """
+        Translate a MongoDB-style filter to a SQL condition
+        :return: Tuple of (condition, parameters)
+        :raises ValueError: On fields or operators SQLite storage does not support
+        """
+        clauses, params = [], []
+        for field, condition in (query or {}).items():
+            if field in ("$and", "$or"):
+                parts = [self.compile_filter(clause, table) for clause in condition]
+                joiner = " AND " if field == "$and" else " OR "
+                clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")")
+                params.extend(param for _, part_params in parts for param in part_params)
+            elif field == "$text":
+                clauses.append(f"{table}.id IN (SELECT rowid FROM {TABLE}_fts WHERE {TABLE}_fts MATCH ?)")
+                params.append(fts_query(condition["$search"]))
+            elif isinstance(condition, dict):
+                column = self._column(field, table)
+                for op, operand in condition.items():
+                    if op in COMPARISONS:
+                        clauses.append(f"{column} {COMPARISONS[op]} ?")
+                        params.append(self._value(field, operand))
+                    elif op in ("$eq", "$ne"):
+                        if operand is None:
+                            clauses.append(f"{column} IS {'NOT ' if op == '$ne' else ''}NULL")
+                        else:
+                            clauses.append(f"{column} {'=' if op == '$eq' else 'IS NOT'} ?")
+                            params.append(self._value(field, operand))
+                    elif op in ("$in", "$nin"):
+                        values = [self._value(field, value) for value in operand]
+                        placeholders = ", ".join("?" * len(values)) or "NULL"
+                        clauses.append(f"{column} {'NOT ' if op == '$nin' else ''}IN ({placeholders})")
+                        params.extend(values)
+                    elif op == "$regex":
+                        flags = "(?i)" if "i" in condition.get("$options", "") else ""
+                        clauses.append(f"{column} REGEXP ?")
+                        params.append(flags + operand)
+                    elif op == "$options":
+                        continue
+                    elif op == "$exists":
+                        clauses.append(f"{column} IS {'NOT ' if operand else ''}NULL")
+                    elif op == "$type" and operand == "number":
+                        clauses.append(f"typeof({column}) IN ('integer', 'real')")
+                    else:
+                        raise ValueError(f"Operator {op} is not supported by SQLite storage")
+            elif condition is None:
+                clauses.append(f"{self._column(field, table)} IS NULL")
+            else:
+                clauses.append(f"{self._column(field, table)} = ?")
+                params.append(self._value(field, condition))
+        return (" AND ".join(clauses) or "1"), params
+
+    def _order_by(self, sort, table=TABLE):
+        if not sort:
+            return ""
+        return " ORDER BY " + ", ".join(
+            f"{self._column(field, table)} {'DESC' if direction == -1 else 'ASC'}" for field, direction in sort)
+
+    @staticmethod
+    def _document(row):
+        """Turn a row into a document shaped like the MongoDB ones"""
+        doc = {"_id": str(row["id"])}
+        for field in COLUMNS:
+            doc[field] = row[field]
+        if row["extra"]:
+            doc.update(json.loads(row["extra"]))
+        return doc
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    # ---- DataBackend ----
+
+    def read(self, query=None, limit=None, sort=None, skip=0):
+        try:
+            where, params = self.compile_filter(query)
+            sql = f"SELECT * FROM {TABLE} WHERE {where}{self._order_by(sort)}"
+            if limit or skip:
+                sql += " LIMIT ? OFFSET ?"
+                params += [limit or -1, skip]
+            return [self._document(row) for row in self._query(sql, params)]
+        except Exception as e:
+            logger.error(f"Error reading data: {e}")
+            return []
+
+    def count(self, query):
+        try:
+            where, params = self.compile_filter(query)
+            return self._query(f"SELECT COUNT(*) FROM {TABLE} WHERE {where}", params)[0][0]
+        except Exception as e:
+            logger.error(f"Error counting documents: {e}")
+            return 0
+
+    def distinct(self, field):
+        """Distinct values of a field (used to build the fuzzy search index)"""
+        return [row[0] for row in self._query(f"SELECT DISTINCT {self._column(field, TABLE)} FROM {TABLE}")]
+
+    def value_counts(self, field, match_query=None):
+        try:
+            where, params = self.compile_filter(match_query)
+            column = self._column(field, TABLE)
+            rows = self._query(f"SELECT {column}, COUNT(*) AS n FROM {TABLE} WHERE {where} "
+                               f"GROUP BY {column} ORDER BY n DESC", params)
+            return [(row[0], row[1]) for row in rows]
+        except Exception as e:
+            logger.error(f"Error counting {field} values: {e}")
+            return []
+
+    def get_stats(self):
+        try:
+            return {"total_documents": self._query(f"SELECT COUNT(*) FROM {TABLE}")[0][0]}
+        except Exception as e:
+            logger.error(f"Error getting stats: {e}")
+            return {"total_documents": 0}
+
+    def _top_values(self, group_sql, value_field, match_query, top_k):
+        """
+        Count (group, value) pairs in SQL and keep the top_k values per group
+        :return: {group: {"count", "distinct", "top"}} with groups in first-seen order
+        """
+        where, params = self.compile_filter(match_query)
+        value_column = self._column(value_field, TABLE)
+        rows = self._query(f"SELECT {group_sql} AS grp, {value_column} AS value, COUNT(*) AS n FROM {TABLE} "
+                           f"WHERE {where} GROUP BY grp, value ORDER BY grp, n DESC, value", params)
+        groups = {}
+        for row in rows:
+            group = groups.setdefault(row["grp"], {"count": 0, "distinct": 0, "top": []})
+            group["count"] += row["n"]
+            group["distinct"] += 1
+            if len(group["top"]) < top_k:
+                group["top"].append({"value": row["value"], "count": row["n"]})
+        return groups
+
+    def aggregate_by_outcome_type(self, match_query=None):
+        try:
+            where, params = self.compile_filter(match_query)
+            rows = self._query(f"SELECT outcome_type, COUNT(*) AS n, AVG(age_upon_outcome_in_weeks) AS avg_age "
+                               f"FROM {TABLE} WHERE {where} GROUP BY outcome_type ORDER BY n DESC", params)
+            return [{"_id": row[0], "count": row[1], "avg_age_weeks": row[2]} for row in rows]
+        except Exception as e:
+            logger.error(f"Error in outcome type aggregation: {e}")
+            return []
+
+    def aggregate_by_animal_type(self, match_query=None, top_k=5):
+        try:
+            groups = self._top_values("animal_type", "breed", match_query, top_k)
+            results = [{"_id": value, "count": group["count"], "distinct_breeds": group["distinct"],
+                        "top_breeds": group["top"]} for value, group in groups.items()]
+            return sorted(results, key=lambda item: -item["count"])
+        except Exception as e:
+            logger.error(f"Error in animal type aggregation: {e}")
+            return []
+
+    def aggregate_by_breed(self, match_query=None, top_k=5):
+        try:
+            groups = self._top_values("breed", "outcome_type", match_query, top_k)
+            where, params = self.compile_filter(match_query)
+            ages = dict(self._query(f"SELECT breed, AVG(age_upon_outcome_in_weeks) FROM {TABLE} "
+                                    f"WHERE {where} GROUP BY breed", params))
+            results = [{"_id": value, "count": group["count"], "avg_age_weeks": ages.get(value),
+                        "distinct_outcome_types": group["distinct"], "top_outcome_types": group["top"]}
+                       for value, group in groups.items()]
+            return sorted(results, key=lambda item: -item["count"])[:20]  # Top 20 breeds
+        except Exception as e:
+            logger.error(f"Error in breed aggregation: {e}")
+            return []
+
+    def get_monthly_statistics(self, match_query=None, top_k=5):
+        try:
+            groups = self._top_values("strftime('%Y-%m', datetime)", "outcome_type", match_query, top_k)
+            results = []
+            for period, group in sorted(groups.items(), key=lambda item: item[0] or ""):
+                year, month = (int(part) for part in period.split("-")) if period else (None, None)
+                results.append({"_id": {"year": year, "month": month}, "count": group["count"],
+                                "distinct_outcome_types": group["distinct"],
+                                "top_outcome_types": group["top"]})
+            return results
+        except Exception as e:
+            logger.error(f"Error in monthly statistics: {e}")
+            return []
+
+    def text_search(self, text, match_query=None, limit=100):
+        return self.search(merge_queries(match_query, {"$text": {"$search": text}}), page_size=limit)["results"]
+
+    def search(self, query, cursor=None, page_size=100):
+        """Search page with offset cursors; text matches are ranked by bm25"""
+        offset = int(cursor.get("offset", 0)) if cursor else 0
+        text = query.get("$text")
+        rest = {key: value for key, value in query.items() if key != "$text"}
+        where, params = self.compile_filter(rest, "o")
+
+        if text:
+            sql = (f"SELECT o.* FROM {TABLE}_fts f JOIN {TABLE} o ON o.id = f.rowid "
+                   f"WHERE {TABLE}_fts MATCH ? AND {where} ORDER BY f.rank LIMIT ? OFFSET ?")
+            params = [fts_query(text["$search"])] + params
+        else:
+            sql = f"SELECT o.* FROM {TABLE} o WHERE {where} ORDER BY o.id LIMIT ? OFFSET ?"
+        rows = self._query(sql, params + [page_size + 1, offset])
+
+        documents = [self._document(row) for row in rows[:page_size]]
+        total = facets = None
+        if cursor is None:
+            total = self.count(query)
+            facets = {
+                field: [{"value": value, "count": count}
+                        for value, count in self.value_counts(field, query)[:self.FACET_LIMIT]]
+                for field in self.FACET_FIELDS
+            }
+        return {
+            "results": documents,
+            "total": total,
+            "facets": facets,
+            "next_cursor": {"offset": offset + page_size} if len(rows) > page_size else None
+        }
+
+    def fuzzy_query(self, term):
+        try:
+            if self.fuzzy_index is None:
+                self.fuzzy_index = FuzzySearchIndex(self).build()
+            return self.fuzzy_index.build_query(term)
+        except Exception as e:
+            logger.error(f"Error building fuzzy query: {e}")
+            return None
+
+    def get_value_index(self):
+        version = self.get_data_version()
+        if self.value_index is None or self.value_index[0] != version:
+            self.value_index = (version, FieldValueIndex(self).build())
+        return self.value_index[1]
+
+    def get_data_version(self, fresh=False):
+        return self._query("SELECT value FROM meta WHERE key = 'version'")[0][0]
+
+    def get_changes(self, since, match_query=None, max_changes=5000):
+        # No change log here: any change makes replicas reload, including a token ahead of
+        # the counter, from before the database was rebuilt
+        version = self.get_data_version()
+        return {"token": version, "reset": since != version, "upserts": [], "deletes": []}
+
+    def mark_changed(self):
+        self.fuzzy_index = None
+
+    def sort_index_supported(self, sort_field, query=None):
+        return any(keys[0] == sort_field for keys in INDEXES)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+        logger.info("SQLite storage closed")
+
+    # ---- CrudBackend ----
+
+    @staticmethod
+    def _split_fields(data):
+        """Split a document into known column values and extra fields (stored as JSON)"""
+        values = {field: value for field, value in data.items() if field in COLUMNS}
+        extra = {field: value for field, value in data.items() if field not in COLUMNS and field != "_id"}
+        return values, extra
+
+    def _bump_version(self):
+        self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        return self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def record_change(self, op, doc_id, version):
+        self.mark_changed()
+        for listener in self.change_listeners:
+            try:
+                listener(op, doc_id, version)
+            except Exception as e:
+                logger.error(f"Change Listener Error: {e}")
+
+    def create(self, data):
+        try:
+            values, extra = self._split_fields(parse_dates(data))
+            columns = list(values) + ["extra"]
+            with self.lock, self.conn:
+                cursor = self.conn.execute(
+                    f'INSERT INTO {TABLE} ({_quoted(columns)}) '
+                    f'VALUES ({", ".join("?" * len(columns))})',
+                    list(values.values()) + [json.dumps(extra) if extra else None])
+                doc_id, version = cursor.lastrowid, self._bump_version()
+            self.record_change("insert", doc_id, version)
+            return str(doc_id)
+        except Exception as e:
+            logger.error(f"Insert Error: {e}")
+            return None
+
+    def read_one(self, doc_id):
+        try:
+            rows = self._query(f"SELECT * FROM {TABLE} WHERE id = ?", [int(doc_id)])
+            return self._document(rows[0]) if rows else None
+        except Exception as e:
+            logger.error(f"Read One Error: {e}")
+            return None
+
+    def update(self, doc_id, updated_data):
+        try:
+            current = self.read_one(doc_id)
+            if current is None:
+                return False
+            values, extra = self._split_fields(parse_dates({**current, **updated_data}))
+            assignments = ", ".join(f'"{field}" = ?' for field in values)
+            with self.lock, self.conn:
+                self.conn.execute(f"UPDATE {TABLE} SET {assignments}, extra = ? WHERE id = ?",
+                                  list(values.values()) + [json.dumps(extra) if extra else None, int(doc_id)])
+                version = self._bump_version()
+            self.record_change("update", doc_id, version)
+            return True
+        except Exception as e:
+            logger.error(f"Update Error: {e}")
+            return False
+
+    def delete(self, doc_id):
+        try:
+            with self.lock, self.conn:
+                deleted = self.conn.execute(f"DELETE FROM {TABLE} WHERE id = ?", [int(doc_id)]).rowcount
+                version = self._bump_version() if deleted else None
+            if deleted:
+                self.record_change("delete", doc_id, version)
+            return deleted > 0
+        except Exception as e:
+            logger.error(f"Delete Error: {e}")
+            return False
+
+    # ---- Bulk load (importer) ----
+
+    def bulk_load(self, records, batch_size=1000):
+        """
+        Replace the table contents with records in one transaction
+        :return: Number of rows inserted
+        """
+        columns = list(COLUMNS)
+        sql = (f'INSERT INTO {TABLE} ({_quoted(columns)}, extra) '
+               f'VALUES ({", ".join("?" * (len(columns) + 1))})')
+        inserted = 0
+        with self.lock, self.conn:
+            self.conn.execute(f"DELETE FROM {TABLE}")
+            for start in range(0, len(records), batch_size):
+                rows = []
+                for record in records[start:start + batch_size]:
+                    values, extra = self._split_fields(record)
+                    extra.pop("location", None)  # Coordinates are queried from the lat/long columns
+                    rows.append([values.get(column) for column in columns] + [json.dumps(extra) if extra else None])
+                self.conn.executemany(sql, rows)
+                inserted += len(rows)
+            self._bump_version()
+        self.mark_changed()
+        logger.info(f"Loaded {inserted} rows into {self.path}")
+        return inserted
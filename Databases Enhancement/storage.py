@@ -0,0 +1,139 @@
+"""
+Storage interfaces the dashboard is written against.
+MongoDataManager and MongoCRUD implement them over MongoDB; SQLiteStorage
+implements both over an embedded SQLite database. Filters are passed in the
+MongoDB query syntax for every backend.
+"""
+
+
+class DataBackend:
+    """Reads, statistics, aggregations and search"""
+
+    # Name reported in errors for operations a backend does not support
+    backend_name = "storage"
+
+    def read(self, query=None, limit=None, sort=None, skip=0):
+        """
+        Query documents
+        :param query: MongoDB-style filter
+        :param limit: Maximum number of documents to return
+        :param sort: List of (field, direction) pairs
+        :param skip: Number of documents to skip
+        :return: List of documents with _id as a string
+        """
+        raise NotImplementedError
+
+    def count(self, query):
+        """Count the documents matching a filter"""
+        raise NotImplementedError
+
+    def distinct(self, field):
+        """Get the distinct values of a field (the fuzzy search index is built from them)"""
+        raise NotImplementedError
+
+    def value_counts(self, field, match_query=None):
+        """Get (value, count) pairs of a field, most frequent first"""
+        raise NotImplementedError
+
+    def get_stats(self):
+        """Get {"total_documents": n}"""
+        raise NotImplementedError
+
+    def aggregate_by_outcome_type(self, match_query=None):
+        """Get [{_id, count, avg_age_weeks}] per outcome type"""
+        raise NotImplementedError
+
+    def aggregate_by_animal_type(self, match_query=None, top_k=5):
+        """Get [{_id, count, distinct_breeds, top_breeds}] per animal type"""
+        raise NotImplementedError
+
+    def aggregate_by_breed(self, match_query=None, top_k=5):
+        """Get the top 20 [{_id, count, avg_age_weeks, distinct_outcome_types, top_outcome_types}] per breed"""
+        raise NotImplementedError
+
+    def get_monthly_statistics(self, match_query=None, top_k=5):
+        """Get [{_id: {year, month}, count, distinct_outcome_types, top_outcome_types}] per month"""
+        raise NotImplementedError
+
+    def text_search(self, text, match_query=None, limit=100):
+        """Full text search on name, breed and outcome type, narrowed by a filter"""
+        raise NotImplementedError
+
+    def search(self, query, cursor=None, page_size=100):
+        """Get a search page: {results, total, facets, next_cursor}"""
+        raise NotImplementedError
+
+    def fuzzy_query(self, term):
+        """Translate a misspelled term into a filter on exact breeds/names, None if nothing matched"""
+        raise NotImplementedError
+
+    def get_value_index(self):
+        """Get the FieldValueIndex field-qualified searches are matched through, current for the data version"""
+        raise NotImplementedError
+
+    def get_data_version(self, fresh=False):
+        """Get a number that changes whenever the data is written"""
+        raise NotImplementedError
+
+    def get_changes(self, since, match_query=None, max_changes=5000):
+        """Get {token, reset, upserts, deletes} for a result set since a version"""
+        raise NotImplementedError
+
+    def mark_changed(self):
+        """Drop state derived from the data after a write"""
+        raise NotImplementedError
+
+    def sort_index_supported(self, sort_field, query=None):
+        """Check that an index can return documents in sort_field order for a filter"""
+        raise NotImplementedError
+
+    # Optional features, MongoDB only for now (routes answer 501 elsewhere)
+
+    def find_within_radius(self, lat, lon, radius_km, match_query=None, limit=500):
+        raise NotImplementedError
+
+    def find_within_box(self, min_lon, min_lat, max_lon, max_lat, match_query=None, limit=500):
+        raise NotImplementedError
+
+    def find_near(self, lat, lon, max_km=None, match_query=None, limit=100):
+        raise NotImplementedError
+
+    def get_location_grid(self, zoom, match_query=None, bounds=None, max_cells=2000):
+        raise NotImplementedError
+
+    def get_time_series(self, granularity="month", date_range=None, filter_type="All", match_query=None):
+        raise NotImplementedError
+
+    def get_age_histogram(self, match_query=None, edges=None, bins=None):
+        raise NotImplementedError
+
+    def build_daily_rollup(self):
+        raise NotImplementedError
+
+    def create_indexes(self):
+        """Create the indexes the dashboard queries use"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release the connection"""
+        raise NotImplementedError
+
+
+class CrudBackend:
+    """Single document create, read, update and delete"""
+
+    def create(self, data):
+        """Insert a document, return its id as a string or None on failure"""
+        raise NotImplementedError
+
+    def read_one(self, doc_id):
+        """Get a document by id, None if it does not exist"""
+        raise NotImplementedError
+
+    def update(self, doc_id, updated_data):
+        """Set fields of a document, return whether it changed"""
+        raise NotImplementedError
+
+    def delete(self, doc_id):
+        """Delete a document, return whether it existed"""
+        raise NotImplementedError
@@ -0,0 +1,48 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+# The app modules live next to this directory and import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BREEDS = {
+    "Dog": ["Labrador Retriever Mix"] * 6 + ["Pit Bull Mix"] * 4 + ["Beagle"] * 2 + ["Newfoundland"],
+    "Cat": ["Domestic Shorthair Mix"] * 5 + ["Siamese"] * 2,
+    "Bird": ["Parrot"],
+}
+OUTCOMES = ["Adoption", "Transfer", "Adoption", "Euthanasia", "Return to Owner"]
+SEXES = ["Intact Female", "Neutered Male", "Spayed Female", "Intact Male"]
+NAMES = ["Buddy", "Max", None, "Bella Blue"]
+
+
+def make_documents():
+    """Outcome documents shaped like the imported ones, with missing ages, names and coordinates"""
+    documents = []
+    animals = [(animal_type, breed) for animal_type, breeds in BREEDS.items() for breed in breeds]
+    for i, (animal_type, breed) in enumerate(animals * 2):
+        documents.append({
+            "_id": f"{i:024x}",
+            "animal_id": f"A{700000 + i}",
+            "animal_type": animal_type,
+            "breed": breed,
+            "color": "Black" if i % 3 else "Tan",
+            "name": NAMES[i % len(NAMES)],
+            "outcome_type": OUTCOMES[i % len(OUTCOMES)],
+            "outcome_subtype": None,
+            "sex_upon_outcome": SEXES[i % len(SEXES)],
+            "age_upon_outcome": f"{i % 5 + 1} years",
+            "age_upon_outcome_in_weeks": None if i % 7 == 0 else 7.5 * i,
+            "date_of_birth": datetime(2014, 1 + i % 12, 1),
+            "datetime": datetime(2016, 1 + i % 12, 1 + i % 28, 10),
+            "monthyear": datetime(2016, 1 + i % 12, 1 + i % 28, 10),
+            "location_lat": None if i % 9 == 0 else 30 + i / 100,
+            "location_long": None if i % 9 == 0 else -97 - i / 100,
+        })
+    return documents
+
+
+@pytest.fixture
+def documents():
+    return make_documents()
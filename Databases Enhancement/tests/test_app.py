@@ -0,0 +1,97 @@
+import os
+import tempfile
+import threading
+
+import pytest
+
+# Import the app over an empty SQLite database instead of connecting to MongoDB
+os.environ["DATA_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "outcomes.db")
+
+import app  # noqa: E402  (reads DATA_BACKEND at import)
+from app import MongoDataManager  # noqa: E402
+from columnar import ColumnarSnapshot  # noqa: E402
+
+
+@pytest.fixture(scope="module", autouse=True)
+def close_storage():
+    yield
+    app.data_manager.close()
+
+
+def run_bucket(pipeline, ages):
+    """Evaluate the histogram pipeline's age $match and $bucket stages over plain ages"""
+    condition = pipeline[0]["$match"]["age_upon_outcome_in_weeks"]
+    ages = [age for age in ages if age >= condition.get("$gte", float("-inf"))]
+    bucket = pipeline[1]["$bucket"]
+    edges = bucket["boundaries"]
+    counts = {}
+    for age in ages:
+        # Like MongoDB, values outside the boundaries on either end go to the default bin
+        key = next((low for low, high in zip(edges, edges[1:]) if low <= age < high), bucket["default"])
+        counts[key] = counts.get(key, 0) + 1
+    return [{"_id": key, "count": count} for key, count in counts.items()]
+
+
+def test_age_histogram_open_bin_only_counts_older_ages():
+    manager = MongoDataManager.__new__(MongoDataManager)
+    ages = [4, 12, 30, 60, 100, 160, 400]
+    manager._aggregate = lambda pipeline, collection=None: run_bucket(pipeline, ages)
+
+    assert manager.get_age_histogram({"animal_type": "Dog"}, edges=(26, 52, 156)) == [
+        {"min": 26, "max": 52, "count": 1},
+        {"min": 52, "max": 156, "count": 2},
+        {"min": 156, "max": None, "count": 2},
+    ]
+
+
+def columnar_manager(documents):
+    """MongoDataManager answering from a loaded column store that is current for version 1"""
+    manager = MongoDataManager.__new__(MongoDataManager)
+    manager.snapshot = ColumnarSnapshot()
+    manager.snapshot.load(documents, 1)
+    manager.get_data_version = lambda fresh=False: manager.snapshot.version
+    return manager
+
+
+def test_monthly_statistics_from_the_column_store(documents):
+    manager = columnar_manager(documents)
+    months = manager.get_monthly_statistics({"animal_type": "Cat"}, top_k=2)
+    assert sum(month["count"] for month in months) == sum(doc["animal_type"] == "Cat" for doc in documents)
+    assert months == manager.snapshot.monthly_summary(manager.snapshot.mask({"animal_type": "Cat"}), 2)
+
+
+def test_aggregations_survive_concurrent_patches(documents):
+    manager = columnar_manager(documents)
+    stop = threading.Event()
+
+    def patch():
+        version = 1
+        while not stop.is_set():
+            # Replacing every row compacts the columns on each call
+            version += 1
+            manager.snapshot.apply(documents, [], version)
+
+    patcher = threading.Thread(target=patch)
+    patcher.start()
+    try:
+        for _ in range(300):
+            assert manager.aggregate_by_breed({"animal_type": "Dog"})
+            assert manager.value_counts("outcome_type", {"animal_type": "Cat"})
+    finally:
+        stop.set()
+        patcher.join()
+
+
+def test_cache_metrics_are_counters(monkeypatch):
+    monkeypatch.setattr(app.metrics.registry, "metrics", [])
+    cache = app.LRUCache(2)
+    app.metrics.register_cache("test_cache", cache)
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("b")
+
+    rendered = app.metrics.registry.render()
+    assert "# TYPE test_cache_hits_total counter\ntest_cache_hits_total 1\n" in rendered
+    assert "# TYPE test_cache_misses_total counter\ntest_cache_misses_total 1\n" in rendered
+    assert "test_cache_hit_ratio 0.5\n" in rendered
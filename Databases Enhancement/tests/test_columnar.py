@@ -0,0 +1,173 @@
+import re
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from columnar import ColumnarSnapshot
+from sqlite_storage import SQLiteStorage
+
+# Filters the dashboard sends, with the document predicate each one means
+QUERIES = [
+    ({}, lambda doc: True),
+    ({"animal_type": "Dog"}, lambda doc: doc["animal_type"] == "Dog"),
+    ({"breed": {"$in": ["Beagle", "Siamese", "Unknown"]}}, lambda doc: doc["breed"] in ("Beagle", "Siamese")),
+    ({"outcome_type": {"$nin": ["Adoption"]}, "animal_type": {"$ne": "Cat"}},
+     lambda doc: doc["outcome_type"] != "Adoption" and doc["animal_type"] != "Cat"),
+    ({"breed": {"$regex": "^lab", "$options": "i"}}, lambda doc: doc["breed"].lower().startswith("lab")),
+    ({"name": {"$regex": "Blue"}}, lambda doc: doc["name"] is not None and "Blue" in doc["name"]),
+    ({"age_upon_outcome_in_weeks": {"$gte": 26, "$lte": 156}},
+     lambda doc: doc["age_upon_outcome_in_weeks"] is not None and 26 <= doc["age_upon_outcome_in_weeks"] <= 156),
+    ({"location_lat": {"$type": "number"}}, lambda doc: doc["location_lat"] is not None),
+    ({"$or": [{"animal_type": "Bird"}, {"sex_upon_outcome": "Intact Female"}]},
+     lambda doc: doc["animal_type"] == "Bird" or doc["sex_upon_outcome"] == "Intact Female"),
+    ({"breed": {"$in": ["Labrador Retriever Mix", "Newfoundland"]}, "sex_upon_outcome": "Intact Female",
+      "age_upon_outcome_in_weeks": {"$gte": 26, "$lte": 156}},
+     lambda doc: doc["breed"] in ("Labrador Retriever Mix", "Newfoundland")
+     and doc["sex_upon_outcome"] == "Intact Female"
+     and doc["age_upon_outcome_in_weeks"] is not None and 26 <= doc["age_upon_outcome_in_weeks"] <= 156),
+]
+
+
+@pytest.fixture
+def snapshot(documents):
+    snapshot = ColumnarSnapshot()
+    snapshot.load(documents, 1)
+    return snapshot
+
+
+@pytest.fixture
+def sqlite(documents, tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "outcomes.db"))
+    storage.bulk_load(documents)
+    yield storage
+    storage.close()
+
+
+def check_top(top, values, top_k):
+    """Top values are the most frequent ones, with their true counts (ties in any order)"""
+    counts = Counter(values)
+    assert [entry["count"] for entry in top] == sorted(counts.values(), reverse=True)[:top_k]
+    for entry in top:
+        assert counts[entry["value"]] == entry["count"]
+
+
+@pytest.mark.parametrize("query, predicate", QUERIES)
+def test_mask_matches_filter(snapshot, documents, query, predicate):
+    assert snapshot.supports(query)
+    expected = [doc["_id"] for doc in documents if predicate(doc)]
+    assert [row["_id"] for row in snapshot.rows_for(snapshot.mask(query))] == expected
+
+
+def test_unsupported_filters_are_reported(snapshot):
+    assert not snapshot.supports({"$text": {"$search": "lab"}})
+    assert not snapshot.supports({"datetime": {"$gte": "2016-01-01"}})
+    assert not snapshot.supports({"age_upon_outcome_in_weeks": {"$exists": True}})
+    assert not snapshot.supports({"breed": re.compile("^Lab")})
+
+
+def test_value_counts(snapshot, documents):
+    counts = snapshot.value_counts("breed", snapshot.live)
+    assert dict(counts) == Counter(doc["breed"] for doc in documents)
+    assert [count for _, count in counts] == sorted((count for _, count in counts), reverse=True)
+
+
+def test_outcome_type_summary(snapshot, documents):
+    summary = {row["_id"]: row for row in snapshot.outcome_type_summary(snapshot.live)}
+    for outcome in set(doc["outcome_type"] for doc in documents):
+        group = [doc for doc in documents if doc["outcome_type"] == outcome]
+        ages = [doc["age_upon_outcome_in_weeks"] for doc in group if doc["age_upon_outcome_in_weeks"] is not None]
+        assert summary[outcome]["count"] == len(group)
+        assert summary[outcome]["avg_age_weeks"] == pytest.approx(sum(ages) / len(ages))
+
+
+def test_animal_type_summary(snapshot, documents):
+    rows = snapshot.animal_type_summary(snapshot.live, 2)
+    assert [row["_id"] for row in rows] == ["Dog", "Cat", "Bird"]
+    for row in rows:
+        breeds = [doc["breed"] for doc in documents if doc["animal_type"] == row["_id"]]
+        assert row["count"] == len(breeds)
+        assert row["distinct_breeds"] == len(set(breeds))
+        check_top(row["top_breeds"], breeds, 2)
+
+
+def test_breed_summary_limit(snapshot, documents):
+    rows = snapshot.breed_summary(snapshot.live, 3, limit=2)
+    assert [row["_id"] for row in rows] == ["Labrador Retriever Mix", "Domestic Shorthair Mix"]
+    for row in rows:
+        check_top(row["top_outcome_types"],
+                  [doc["outcome_type"] for doc in documents if doc["breed"] == row["_id"]], 3)
+
+
+def test_monthly_summary(snapshot, documents):
+    rows = snapshot.monthly_summary(snapshot.live, 5)
+    months = Counter((doc["datetime"].year, doc["datetime"].month) for doc in documents)
+    assert [(row["_id"]["year"], row["_id"]["month"]) for row in rows] == sorted(months)
+    assert [row["count"] for row in rows] == [months[month] for month in sorted(months)]
+
+
+@pytest.mark.parametrize("query, predicate", QUERIES)
+def test_aggregations_match_sqlite(snapshot, sqlite, query, predicate):
+    mask = snapshot.mask(query)
+    assert int(mask.sum()) == sqlite.count(query)
+    assert dict(snapshot.value_counts("outcome_type", mask)) == dict(sqlite.value_counts("outcome_type", query))
+
+    by_outcome = {row["_id"]: row for row in sqlite.aggregate_by_outcome_type(query)}
+    for row in snapshot.outcome_type_summary(mask):
+        assert row["count"] == by_outcome[row["_id"]]["count"]
+        assert row["avg_age_weeks"] == pytest.approx(by_outcome[row["_id"]]["avg_age_weeks"])
+
+    by_animal = {row["_id"]: row for row in sqlite.aggregate_by_animal_type(query)}
+    for row in snapshot.animal_type_summary(mask, 5):
+        assert (row["count"], row["distinct_breeds"]) == \
+            (by_animal[row["_id"]]["count"], by_animal[row["_id"]]["distinct_breeds"])
+
+    monthly = sqlite.get_monthly_statistics(query)
+    assert [(row["_id"], row["count"]) for row in snapshot.monthly_summary(mask, 5)] == \
+        [(row["_id"], row["count"]) for row in monthly]
+
+
+def test_sorted_rows(snapshot, documents):
+    rows = snapshot.rows_for(snapshot.live, skip=2, limit=5, sort=[("age_upon_outcome_in_weeks", -1), ("_id", -1)])
+    expected = sorted(documents, key=lambda doc: (doc["age_upon_outcome_in_weeks"] or -1, doc["_id"]), reverse=True)
+    assert [row["_id"] for row in rows] == [doc["_id"] for doc in expected[2:7]]
+
+
+def test_apply_changes(snapshot, documents):
+    changed = dict(documents[0], breed="Siamese", animal_type="Cat")
+    snapshot.apply([changed], [documents[1]["_id"]], 2)
+
+    assert snapshot.version == 2
+    assert int(snapshot.live.sum()) == len(documents) - 1
+    assert snapshot.rows_for(snapshot.mask({"animal_id": "A700000"})) == [changed]
+    assert not snapshot.mask({"animal_id": documents[1]["animal_id"]}).any()
+    siamese = sum(doc["breed"] == "Siamese" for doc in documents)
+    assert dict(snapshot.value_counts("breed", snapshot.live))["Siamese"] == siamese + 1
+
+
+def test_apply_compacts_dead_rows(snapshot, documents):
+    snapshot.apply([], [doc["_id"] for doc in documents[:len(documents) * 2 // 3]], 2)
+    assert snapshot.size == len(snapshot.rows) == len(documents) - len(documents) * 2 // 3
+    assert snapshot.live.all()
+
+
+def test_save_and_open(snapshot, documents, tmp_path):
+    snapshot.save(str(tmp_path))
+    mapped = ColumnarSnapshot.open(str(tmp_path))
+
+    assert mapped.version == 1 and not mapped.complete
+    assert isinstance(mapped.codes["breed"], np.memmap)
+    for query, _ in QUERIES:
+        assert (mapped.mask(query) == snapshot.mask(query)).all()
+    assert mapped.animal_type_summary(mapped.live, 3) == snapshot.animal_type_summary(snapshot.live, 3)
+
+    row = mapped.rows_for(mapped.mask({"animal_id": "A700001"}))[0]
+    assert row["breed"] == documents[1]["breed"]
+    assert row["datetime"] == documents[1]["datetime"].isoformat()
+    assert row["location"] == {"type": "Point", "coordinates": [documents[1]["location_long"],
+                                                                documents[1]["location_lat"]]}
+    assert "location" not in mapped.rows_for(mapped.mask({"animal_id": "A700000"}))[0]
+
+
+def test_open_without_snapshot(tmp_path):
+    assert ColumnarSnapshot.open(str(tmp_path)) is None
@@ -0,0 +1,122 @@
+import re
+from collections import defaultdict
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from compact_schema import CompactSchema, NO_CODE, short_key, public_key
+
+
+class LookupCollection:
+    """In-memory stand-in for a codes_<field> collection with its unique value index"""
+
+    def __init__(self):
+        self.documents = []
+
+    def create_index(self, key, unique=False):
+        pass
+
+    def find(self):
+        return list(self.documents)
+
+    def insert_one(self, document):
+        if any(doc["_id"] == document["_id"] or doc["value"] == document["value"] for doc in self.documents):
+            raise DuplicateKeyError("duplicate key")
+        self.documents.append(dict(document))
+
+
+@pytest.fixture
+def db():
+    return defaultdict(LookupCollection)
+
+
+@pytest.fixture
+def schema(db, documents):
+    schema = CompactSchema(db)
+    for document in documents:
+        schema.encode_document(document)
+    return schema
+
+
+def test_keys_round_trip():
+    assert short_key("location.coordinates") == "loc.coordinates"
+    assert short_key("_id") == "_id"
+    assert public_key(short_key("age_upon_outcome_in_weeks")) == "age_upon_outcome_in_weeks"
+
+
+def test_documents_round_trip(schema, documents):
+    for document in documents:
+        stored = schema.encode_document(document)
+        assert isinstance(stored["b"], int) and stored["dt"] == document["datetime"]
+        assert schema.decode_document(stored) == document
+
+
+def test_codes_are_shared_between_processes(db, schema):
+    other = CompactSchema(db)
+    assert other.encode_value("breed", "Beagle") == schema.encode_value("breed", "Beagle")
+
+    # Both assign a new value: the second sees the first one's code instead of taking another
+    code = schema.encode_value("breed", "Poodle", create=True)
+    assert other.encode_value("breed", "Poodle", create=True) == code
+    assert other.encode_value("breed", "Basenji", create=True) == code + 1
+    assert len(db["codes_breed"].documents) == len(set(doc["value"] for doc in db["codes_breed"].documents))
+
+
+def test_unknown_values_match_nothing(schema):
+    assert schema.encode_value("breed", "Unicorn") == NO_CODE
+    assert schema.encode_query({"breed": "Unicorn", "name": "Max"}) == {"b": NO_CODE, "n": "Max"}
+
+
+def test_encode_query(schema):
+    beagle, siamese = schema.encode_value("breed", "Beagle"), schema.encode_value("breed", "Siamese")
+    assert schema.encode_query({
+        "breed": {"$in": ["Beagle", "Siamese"]},
+        "age_upon_outcome_in_weeks": {"$gte": 26, "$lte": 156},
+        "$or": [{"animal_type": {"$ne": "Cat"}}, {"name": None}],
+    }) == {
+        "b": {"$in": [beagle, siamese]},
+        "w": {"$gte": 26, "$lte": 156},
+        "$or": [{"t": {"$ne": schema.encode_value("animal_type", "Cat")}}, {"n": None}],
+    }
+
+
+def test_regex_filters_match_lookup_values(schema):
+    labs = schema.encode_query({"breed": {"$regex": "^lab", "$options": "i"}})
+    assert labs == {"b": {"$in": [schema.encode_value("breed", "Labrador Retriever Mix")]}}
+    assert schema.encode_query({"breed": re.compile("Mix$")})["b"]["$in"] == \
+        [schema.encode_value("breed", breed)
+         for breed in ("Labrador Retriever Mix", "Pit Bull Mix", "Domestic Shorthair Mix")]
+    # An $in next to the regex narrows its matches
+    assert schema.encode_query({"breed": {"$regex": "Mix$", "$in": ["Pit Bull Mix", "Beagle"]}}) == \
+        {"b": {"$in": [schema.encode_value("breed", "Pit Bull Mix")]}}
+
+
+def test_text_query(schema):
+    query = schema.encode_query({"$text": {"$search": "bella adoption"}, "animal_type": "Dog"})
+    assert query == {"$and": [
+        {"t": schema.encode_value("animal_type", "Dog")},
+        {"$or": [{"n": {"$regex": r"\b(bella|adoption)\b", "$options": "i"}},
+                 {"o": {"$in": [schema.encode_value("outcome_type", "Adoption")]}}]},
+    ]}
+    assert schema.encode_query({"$text": {"$search": "?!"}}) == {"n": {"$in": []}}
+
+
+def test_encode_pipeline(schema):
+    pipeline = [
+        {"$match": {"animal_type": "Dog"}},
+        {"$sort": {"datetime": -1}},
+        {"$group": {"_id": "$breed", "avg": {"$avg": "$age_upon_outcome_in_weeks"}}},
+        {"$sort": {"avg": -1}},
+        {"$limit": 5},
+    ]
+    assert schema.encode_pipeline(pipeline) == [
+        {"$match": {"t": schema.encode_value("animal_type", "Dog")}},
+        {"$sort": {"dt": -1}},
+        {"$group": {"_id": "$b", "avg": {"$avg": "$w"}}},
+        {"$sort": {"avg": -1}},
+        {"$limit": 5},
+    ]
+    facet = schema.encode_pipeline([{"$facet": {"by_type": [{"$group": {"_id": "$outcome_type"}}]}}])
+    assert facet == [{"$facet": {"by_type": [{"$group": {"_id": "$o"}}]}}]
+    assert schema.encode_sort([("breed", 1), ("_id", -1)]) == [("b", 1), ("_id", -1)]
+    assert schema.encode_expression({"$concat": ["$name", "$$ROOT"]}) == {"$concat": ["$n", "$$ROOT"]}
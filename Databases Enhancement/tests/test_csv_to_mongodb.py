@@ -0,0 +1,96 @@
+from datetime import datetime
+
+import pytest
+
+from csv_to_mongodb import (read_outcomes_csv, prepare_records, create_row_key_index, sync_records,
+                            ROW_KEY_INDEX_NAME)
+
+HEADER = ('"","age_upon_outcome","animal_id","animal_type","breed","color","date_of_birth","datetime",'
+          '"monthyear","name","outcome_subtype","outcome_type","sex_upon_outcome","location_lat",'
+          '"location_long","age_upon_outcome_in_weeks"\n')
+
+
+def write_outcomes(path, rows):
+    lines = [HEADER]
+    for i in range(rows):
+        day = i % 28 + 1
+        lines.append(f'"{i + 1}","1 year","A{700000 + i}","Dog","Beagle Mix","Tan",2015-02-{day:02d},'
+                     f'2016-03-{day:02d} 10:00:00,"2016-03-{day:02d}T10:00:00","Rex","","Adoption",'
+                     f'"Neutered Male",30.5,-97.5,\n')
+    path.write_text("".join(lines))
+
+
+def test_dates_survive_every_chunk(tmp_path):
+    csv_path = tmp_path / "outcomes.csv"
+    write_outcomes(csv_path, 7)
+
+    chunks = [prepare_records(chunk) for chunk in read_outcomes_csv(csv_path, chunksize=3)]
+    assert [len(records) for records in chunks] == [3, 3, 1]
+
+    for records in chunks:
+        for record in records:
+            for field in ("date_of_birth", "datetime", "monthyear"):
+                assert isinstance(record[field], datetime), (field, record)
+    assert chunks[2][0]["datetime"] == datetime(2016, 3, 7, 10)
+
+
+def test_unparseable_dates_become_none(tmp_path):
+    csv_path = tmp_path / "outcomes.csv"
+    write_outcomes(csv_path, 4)
+    csv_path.write_text(csv_path.read_text().replace("2016-03-04 10:00:00", "not a date"))
+
+    records = [record for chunk in read_outcomes_csv(csv_path, chunksize=2) for record in prepare_records(chunk)]
+    assert records[3]["datetime"] is None
+    assert isinstance(records[2]["datetime"], datetime)
+    # Missing weeks are derived from the dates, or the age text when a date is missing
+    assert records[0]["age_upon_outcome_in_weeks"] > 50
+    assert records[3]["age_upon_outcome_in_weeks"] > 50
+
+
+@pytest.fixture
+def collection():
+    mongomock = pytest.importorskip("mongomock")
+    return mongomock.MongoClient().animal_shelter.outcomes
+
+
+def outcome(animal_id, day, row_hash="h"):
+    return {"animal_id": animal_id, "datetime": datetime(2016, 3, day, 10) if day else None,
+            "breed": "Beagle", "row_hash": row_hash}
+
+
+def test_row_key_index_removes_duplicates(collection):
+    collection.insert_many([outcome("A1", 1), outcome("A1", 1), outcome("A1", 1), outcome("A2", 1)])
+    oldest = min(doc["_id"] for doc in collection.find({"animal_id": "A1"}))
+    collection.create_index([("animal_id", 1), ("datetime", 1)], name=ROW_KEY_INDEX_NAME)
+
+    removed = create_row_key_index(collection)
+    assert len(removed) == 2 and oldest not in removed
+    assert sorted(doc["animal_id"] for doc in collection.find()) == ["A1", "A2"]
+    index = collection.index_information()[ROW_KEY_INDEX_NAME]
+    assert index["unique"] and "partialFilterExpression" in index
+    assert create_row_key_index(collection) == []
+
+
+class RecordingCollection:
+    """Collection serving stored documents and recording the bulk writes made against it"""
+
+    def __init__(self, documents):
+        self.documents = [dict(doc, _id=i) for i, doc in enumerate(documents)]
+        self.operations = []
+
+    def find(self, query, projection):
+        return [{field: doc.get(field) for field in list(projection) + ["_id"]} for doc in self.documents]
+
+    def bulk_write(self, operations, ordered=True):
+        self.operations.extend(operations)
+
+
+def test_sync_skips_records_without_a_key():
+    collection = RecordingCollection([outcome("A1", 1), outcome("A2", None), outcome("A3", 2)])
+
+    counts, changes = sync_records(collection, [outcome("A1", 1, "changed"), outcome("A4", None), outcome("A4", None),
+                                                outcome("A5", 3)], delete_missing=True)
+    assert counts == {"inserted": 1, "updated": 1, "unchanged": 0, "deleted": 1, "skipped": 2}
+    # The keyless document already stored (_id 1) is neither matched nor deleted
+    assert [(op, doc_id) for op, doc_id in changes if op != "insert"] == [("update", 0), ("delete", 2)]
+    assert [type(operation).__name__ for operation in collection.operations] == ["ReplaceOne", "UpdateOne", "DeleteOne"]
@@ -0,0 +1,74 @@
+import queue
+import threading
+
+import events
+from events import EventBroker, start_change_stream
+
+
+class ChangeStream:
+    """Iterable stand-in for a pymongo ChangeStream, ending after its changes like an invalidated one"""
+
+    def __init__(self, changes):
+        self.changes = changes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __iter__(self):
+        for change in self.changes:
+            if isinstance(change, Exception):
+                raise change
+            yield change
+
+
+class WatchedCollection:
+    """Collection serving prepared change streams, blocking once they run out"""
+
+    def __init__(self, streams):
+        self.streams = streams
+        self.watch_calls = []
+        self.exhausted = threading.Event()
+
+    def watch(self, **kwargs):
+        self.watch_calls.append(kwargs)
+        if not self.streams:
+            self.exhausted.set()
+            threading.Event().wait()
+        return ChangeStream(self.streams.pop(0))
+
+
+def change(token, operation, doc_id=None):
+    return {"_id": {"_data": token}, "operationType": operation, "documentKey": {"_id": doc_id}}
+
+
+def published(broker_queue):
+    events = []
+    while True:
+        try:
+            events.append(broker_queue.get_nowait())
+        except queue.Empty:
+            return events
+
+
+def test_stream_is_reopened_after_invalidate_and_errors(monkeypatch):
+    monkeypatch.setattr(events, "RECONNECT_SECONDS", 0)
+    collection = WatchedCollection([
+        [change("1", "insert", "a"), change("2", "drop"), change("3", "invalidate")],
+        [change("4", "update", "b"), ConnectionError("connection reset")],
+        [change("5", "delete", "b")],
+    ])
+    broker = EventBroker()
+    subscriber = broker.subscribe()
+
+    assert start_change_stream(collection, broker)
+    assert collection.exhausted.wait(5)
+
+    assert published(subscriber) == [
+        {"op": "insert", "id": "a"}, {"op": "reset", "id": None}, {"op": "reset", "id": None},
+        {"op": "update", "id": "b"}, {"op": "delete", "id": "b"},
+    ]
+    assert collection.watch_calls == [{}, {"start_after": {"_data": "3"}}, {"start_after": {"_data": "4"}},
+                                      {"start_after": {"_data": "5"}}]
@@ -0,0 +1,130 @@
+import re
+
+import pytest
+
+from search import (TrigramIndex, FuzzySearchIndex, FieldValueIndex, parse_search_query, compile_search_query, is_field_query,
+                    encode_cursor, decode_cursor, merge_queries, compile_column_filters, trigrams)
+
+
+class DistinctValues:
+    """Storage backend stand-in serving distinct(field) from fixed values"""
+
+    def __init__(self, values):
+        self.values = values
+
+    def distinct(self, field):
+        return self.values[field]
+
+
+def test_parse_quoted_values_and_terms():
+    fields, terms = parse_search_query('breed:"German Shepherd" outcome:"return to owner" buddy "good boy"')
+    assert fields == {"breed": ["German Shepherd"], "outcome_type": ["return to owner"]}
+    assert terms == ["buddy", "good boy"]
+
+
+def test_parse_numbers_and_ranges():
+    fields, _ = parse_search_query("age:26..156 AGE:..52 age:8")
+    assert fields == {"age_upon_outcome_in_weeks": [(26.0, 156.0), (None, 52.0), 8.0]}
+
+
+@pytest.mark.parametrize("text", ["colour:black", "age:young", "age:1..x"])
+def test_parse_rejects_bad_input(text):
+    with pytest.raises(ValueError):
+        parse_search_query(text)
+
+
+def test_compile_search_query():
+    assert compile_search_query(*parse_search_query('type:Dog breed:Beagle breed:"Pit Bull Mix" lab')) == {
+        "animal_type": "Dog",
+        "breed": {"$in": ["Beagle", "Pit Bull Mix"]},
+        "$text": {"$search": "lab", "$caseSensitive": False},
+    }
+
+
+def test_compile_matches_stored_values_regardless_of_case():
+    value_index = FieldValueIndex(DistinctValues({
+        "breed": ["German Shepherd", "Pit Bull Mix", None],
+        "name": ["Max", "MAX", "Bella"],
+        "outcome_type": ["Return to Owner", "Rto-Adopt", "Adoption"],
+        "sex_upon_outcome": ["Intact Male"],
+        "animal_type": ["Dog"],
+        "color": ["Black"],
+        "outcome_subtype": [],
+    })).build()
+    fields, terms = parse_search_query('outcome:"return to owner" outcome:rto-adopt breed:"german shepherd" '
+                                       'name:max type:dog breed:Poodle age:26..')
+    assert compile_search_query(fields, terms, value_index) == {
+        "outcome_type": {"$in": ["Return to Owner", "Rto-Adopt"]},
+        "breed": {"$in": ["German Shepherd", "Poodle"]},
+        "name": {"$in": ["Max", "MAX"]},
+        "animal_type": "Dog",
+        "age_upon_outcome_in_weeks": {"$gte": 26.0},
+    }
+
+
+def test_ranges_need_a_bound():
+    with pytest.raises(ValueError):
+        compile_search_query(*parse_search_query("age:.."))
+    with pytest.raises(ValueError):
+        compile_column_filters({"age_upon_outcome_in_weeks": ".."})
+
+
+def test_compile_intersects_ranges():
+    query = compile_search_query(*parse_search_query("age:26..156 age:52.. age:..104 age:60"))
+    assert query == {"age_upon_outcome_in_weeks": {"$gte": 52.0, "$lte": 104.0, "$in": [60.0]}}
+
+
+def test_is_field_query():
+    assert is_field_query('name:"Max" dog')
+    assert not is_field_query('"pit bull" mix')
+
+
+def test_cursor_round_trip():
+    state = {"after": "5f1e", "score": 1.5}
+    token = encode_cursor(state)
+    assert re.fullmatch(r"[A-Za-z0-9_=-]+", token)
+    assert decode_cursor(token) == state
+    for bad in ("not a cursor", encode_cursor([1, 2])):
+        with pytest.raises(ValueError):
+            decode_cursor(bad)
+
+
+def test_merge_queries():
+    assert merge_queries(None, {"breed": "Beagle", "$text": {"$search": "max"}}, {"animal_type": "Dog"}) == \
+        {"breed": "Beagle", "animal_type": "Dog", "$text": {"$search": "max"}}
+    assert merge_queries({"age": {"$gte": 1}}, {"age": {"$lte": 5}}, {}) == \
+        {"$and": [{"age": {"$gte": 1}}, {"age": {"$lte": 5}}]}
+
+
+def test_compile_column_filters():
+    assert compile_column_filters({
+        "name": " Mr. (Bo) ",
+        "breed": "",
+        "age_upon_outcome_in_weeks": "10..",
+        "animal_id": "A7",
+    }) == {
+        "name": {"$regex": r"^Mr\.\ \(Bo\)"},
+        "age_upon_outcome_in_weeks": {"$gte": 10.0},
+        "animal_id": {"$regex": "^A7"},
+    }
+    assert compile_column_filters({"age_upon_outcome_in_weeks": "12"}) == {"age_upon_outcome_in_weeks": 12.0}
+    with pytest.raises(ValueError):
+        compile_column_filters({"location_lat": "30"})
+
+
+def test_trigram_lookup():
+    assert trigrams("dog") == {"  d", " do", "dog", "og "}
+    index = TrigramIndex().build(["Labrador Retriever Mix", "Labrador Retriever", "Pit Bull Mix", None])
+    assert index.lookup("labrdor retreiver") == ["Labrador Retriever", "Labrador Retriever Mix"]
+    assert index.lookup("labrador poodle") == []
+    assert index.lookup("") == []
+
+
+def test_fuzzy_search_query():
+    index = FuzzySearchIndex(DistinctValues({
+        "breed": ["Labrador Retriever Mix", "Beagle"],
+        "name": ["Bagel", "Max"],
+    })).build()
+    assert index.build_query("beagel") == {"$or": [{"breed": {"$in": ["Beagle"]}}, {"name": {"$in": ["Bagel"]}}]}
+    assert index.build_query("labrador") == {"breed": {"$in": ["Labrador Retriever Mix"]}}
+    assert index.build_query("zzz") is None
@@ -0,0 +1,118 @@
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+from sqlite_storage import SQLiteStorage, fts_query
+
+
+@pytest.fixture
+def storage(documents, tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "outcomes.db"))
+    storage.bulk_load(documents)
+    yield storage
+    storage.close()
+
+
+def test_bulk_load_stores_iso_dates(storage, documents):
+    assert storage.get_stats() == {"total_documents": len(documents)}
+    first = storage.read({"animal_id": "A700000"})[0]
+    assert first["datetime"] == documents[0]["datetime"].isoformat()
+    assert "location" not in first
+
+
+def test_crud_writes_use_the_import_date_format(storage):
+    doc_id = storage.create({"animal_id": "A1", "breed": "Beagle", "datetime": "2020-03-04 05:06:07",
+                             "date_of_birth": datetime(2019, 1, 2), "microchip": "985"})
+    created = storage.read_one(doc_id)
+    assert created["datetime"] == "2020-03-04T05:06:07"
+    assert created["date_of_birth"] == "2019-01-02T00:00:00"
+    assert created["microchip"] == "985"
+
+    assert storage.update(doc_id, {"datetime": "2021-01-01", "breed": "Siamese"})
+    updated = storage.read_one(doc_id)
+    assert updated["datetime"] == "2021-01-01T00:00:00"
+    assert updated["breed"] == "Siamese" and updated["microchip"] == "985"
+    assert storage.read({"datetime": {"$gte": "2021-01-01T00:00:00"}}) == [updated]
+
+    assert storage.delete(doc_id)
+    assert storage.read_one(doc_id) is None
+    assert not storage.delete(doc_id)
+    assert not storage.update(doc_id, {"breed": "Beagle"})
+
+
+def test_writes_bump_the_data_version(storage):
+    version = storage.get_data_version()
+    changes = []
+    storage.change_listeners.append(lambda op, doc_id, new_version: changes.append((op, new_version)))
+    doc_id = storage.create({"animal_id": "A1"})
+    storage.delete(doc_id)
+    assert changes == [("insert", version + 1), ("delete", version + 2)]
+    assert storage.get_changes(version)["reset"]
+    assert not storage.get_changes(version + 2)["reset"]
+    # A token from before a rebuild restarted the counter
+    assert storage.get_changes(version + 50)["reset"]
+
+
+def test_filters(storage, documents):
+    dogs = [doc for doc in documents if doc["animal_type"] == "Dog"]
+    assert storage.count({"animal_type": "Dog"}) == len(dogs)
+    assert storage.count({"name": None}) == sum(doc["name"] is None for doc in documents)
+    assert storage.count({"breed": {"$regex": "^lab", "$options": "i"}}) == \
+        sum(doc["breed"].startswith("Lab") for doc in documents)
+    assert storage.count({"breed": {"$in": []}}) == 0
+    assert storage.count({"age_upon_outcome_in_weeks": {"$gt": 26, "$lte": 156}}) == \
+        sum(26 < (doc["age_upon_outcome_in_weeks"] or 0) <= 156 for doc in documents)
+    assert storage.count({"$or": [{"animal_type": "Bird"}, {"location_lat": {"$type": "number"}}]}) == \
+        sum(doc["animal_type"] == "Bird" or doc["location_lat"] is not None for doc in documents)
+
+
+def test_unsupported_filters(storage):
+    with pytest.raises(ValueError):
+        storage.compile_filter({"microchip": "985"})
+    with pytest.raises(ValueError):
+        storage.compile_filter({"breed": {"$elemMatch": {}}})
+    assert storage.read({"microchip": "985"}) == []
+
+
+def test_read_sort_and_paging(storage, documents):
+    rows = storage.read({"animal_type": "Cat"}, limit=3, skip=1, sort=[("animal_id", -1)])
+    cats = sorted((doc["animal_id"] for doc in documents if doc["animal_type"] == "Cat"), reverse=True)
+    assert [row["animal_id"] for row in rows] == cats[1:4]
+
+
+def test_aggregations(storage, documents):
+    assert dict(storage.value_counts("breed")) == Counter(doc["breed"] for doc in documents)
+
+    by_animal = {row["_id"]: row for row in storage.aggregate_by_animal_type(top_k=2)}
+    assert by_animal["Dog"]["count"] == sum(doc["animal_type"] == "Dog" for doc in documents)
+    assert by_animal["Dog"]["distinct_breeds"] == 4
+    assert by_animal["Dog"]["top_breeds"] == [{"value": "Labrador Retriever Mix", "count": 12},
+                                              {"value": "Pit Bull Mix", "count": 8}]
+
+    monthly = storage.get_monthly_statistics({"animal_type": "Cat"})
+    months = Counter(doc["datetime"].month for doc in documents if doc["animal_type"] == "Cat")
+    assert [(row["_id"]["year"], row["_id"]["month"], row["count"]) for row in monthly] == \
+        [(2016, month, months[month]) for month in sorted(months)]
+
+
+def test_text_search(storage, documents):
+    page = storage.search({"$text": {"$search": "shorthair"}, "animal_type": "Cat"}, page_size=6)
+    shorthair = [doc for doc in documents if doc["breed"] == "Domestic Shorthair Mix"]
+    assert page["total"] == len(shorthair)
+    assert len(page["results"]) == 6
+    assert page["facets"]["breed"] == [{"value": "Domestic Shorthair Mix", "count": len(shorthair)}]
+
+    rest = storage.search({"$text": {"$search": "shorthair"}, "animal_type": "Cat"}, page["next_cursor"], 6)
+    assert rest["total"] is None and rest["next_cursor"] is None
+    assert len(page["results"]) + len(rest["results"]) == len(shorthair)
+
+
+def test_fts_query_quotes_terms():
+    assert fts_query('bella "pit bull" O"Neil') == '"bella" OR "pit bull" OR "O""Neil"'
+
+
+def test_value_index_follows_the_data(storage):
+    assert storage.get_value_index().resolve("breed", "labrador retriever MIX") == ["Labrador Retriever Mix"]
+    storage.create({"animal_id": "A1", "breed": "Rto-Adopt Mix"})
+    assert storage.get_value_index().resolve("breed", "rto-adopt mix") == ["Rto-Adopt Mix"]